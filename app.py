@@ -1,41 +1,214 @@
+import hmac
+import logging
 import os
-import random
-from cs50 import SQL
-from flask import Flask, jsonify, render_template, request, session, redirect, url_for
-from flask_session import Session
+import secrets
+from flask import Flask, Response, jsonify, render_template, request, send_file, session, redirect, url_for
+from markupsafe import Markup
+
+from catalog import POOL_KINDS, Catalog, pool_key
+from database import Database, ensure_schema
+from dump import COLUMNS as EXPORT_TABLES, FORMATS as EXPORT_FORMATS, MEDIA_TYPES, export_chunks
+from leaderboard import Leaderboard, leaderboard_page, win_counts
+from metrics import Metrics
+from ratings import RatingEngine
+from search import SearchIndex
+from session_store import init_session
+from static_assets import StaticAssets
+from thumbnails import FORMATS as IMAGE_FORMATS, WIDTHS as IMAGE_WIDTHS, Thumbnails, negotiate_format, snap_width
+from tournament import Bracket, RoundClaims, TokenError, TournamentTokens, new_seed
+from win_recorder import WinRecorder
 
 app = Flask(__name__)
 app.config["SESSION_PERMANENT"] = False
-app.config["SESSION_TYPE"] = "filesystem"
-Session(app)
+# Must be shared by every process when tournaments travel in signed tokens
+app.config["SECRET_KEY"] = os.environ.get("SECRET_KEY") or secrets.token_hex(32)
+# "session" keeps tournament state server-side, "token" in signed tokens
+app.config["TOURNAMENT_MODE"] = os.environ.get("TOURNAMENT_MODE", "session")
+# One of "memory", "sqlite" or "filesystem"
+app.config["SESSION_TYPE"] = os.environ.get("SESSION_TYPE", "filesystem")
+session_store = init_session(app)
+static_assets = StaticAssets(app)
+
+DATABASE_PATH = os.environ.get("DATABASE_PATH", "fragrances.db")
+# /export is off unless EXPORT_TOKEN is set; dump.py exports without it
+EXPORT_TOKEN = os.environ.get("EXPORT_TOKEN")
+
+ensure_schema(DATABASE_PATH)
+db = Database(DATABASE_PATH)
+catalog = Catalog(db, DATABASE_PATH)
+search_index = SearchIndex(catalog)
+search_index.refresh()
+tokens = TournamentTokens(app.config["SECRET_KEY"])
+round_claims = RoundClaims(db, tokens.max_age)
+win_recorder = WinRecorder(DATABASE_PATH)
+win_recorder.start()
+leaderboard = Leaderboard(db)
+leaderboard.load()
+win_recorder.listeners.append(leaderboard.load)
+ratings = RatingEngine(DATABASE_PATH)
+ratings.load()
+win_recorder.listeners.append(ratings.sync)
+# Resized bottle images, at most IMAGE_CACHE_MB on disk per worker process
+thumbnails = Thumbnails(
+    os.environ.get("IMAGE_CACHE_DIR", "image_cache"),
+    max_bytes=int(os.environ.get("IMAGE_CACHE_MB", 256)) * 1024 * 1024,
+    base_dir=app.root_path
+)
+# PROFILE_SLOW_MS logs sampled stacks of requests slower than that many ms.
+# /metrics needs "Authorization: Bearer $METRICS_TOKEN" and is off when
+# METRICS_TOKEN is unset
+metrics = Metrics()
+metrics.init_app(
+    app,
+    db=db,
+    session_store=session_store,
+    slow_request_ms=float(os.environ.get("PROFILE_SLOW_MS", 0)),
+    token=os.environ.get("METRICS_TOKEN")
+)
 
-db = SQL("sqlite:///fragrances.db")
+# Only the tournament endpoints must never be cached; static files are
+# fingerprinted and cached by StaticAssets
+NO_STORE_ENDPOINTS = {"index", "save_vote", "save_votes", "upcoming"}
+
+# Upper bounds for one /upcoming response and one /save_votes batch
+MAX_UPCOMING = 32
+MAX_VOTE_BATCH = 64
+MAX_SEARCH_RESULTS = 25
+MAX_LEADERBOARD_PAGE = 100
+
+# Where bottles without a local copy are still served from
+CDN_IMAGE_URL = "https://fimgs.net/mdimg/perfume/375x500.{id}.jpg"
+# Variants are named after the source's content hash, but the URL is not
+IMAGE_MAX_AGE = 24 * 60 * 60
 
 @app.after_request
 def after_request(response):
-    response.headers["Cache-Control"] = "no-cache, no-store, must-revalidate"
-    response.headers["Expires"] = 0
-    response.headers["Pragma"] = "no-cache"
+    if request.endpoint in NO_STORE_ENDPOINTS:
+        response.headers["Cache-Control"] = "no-cache, no-store, must-revalidate"
+        response.headers["Expires"] = 0
+        response.headers["Pragma"] = "no-cache"
     return response
 
+def token_mode():
+    return app.config["TOURNAMENT_MODE"] == "token"
+
+def load_state(data):
+    """Return the tournament state for a request, or None if there is none
+
+    In token mode the state comes from the signed token in the request,
+    otherwise it is the session itself, so updates are saved with it.
+    """
+    if token_mode():
+        token = data.get("token")
+        if not token:
+            return None
+        return tokens.load(token)
+    if session.get("seed") is None:
+        return None
+    return session
+
+def bracket_for(state):
+    """Return the bracket of a tournament, or None if its pool changed"""
+    ids = catalog.pool(state.get("pool"))
+    if len(ids) != state["size"]:
+        return None
+    return Bracket(ids, state["seed"])
+
 @app.route("/", methods=["GET"])
 def index():
-    """Start a new tournament"""
-    fragrances = db.execute("SELECT id, name, image_url FROM fragrances")
-    print(f"Number of fragrances found: {len(fragrances)}")  # Debug line
-    print(f"Fragrances: {fragrances}")  # Debug line
-    
-    if len(fragrances) < 2:
+    """Start a new tournament, optionally limited to ?category= or ?brand="""
+    pool = None
+    for kind in POOL_KINDS:
+        value = request.args.get(kind, "").strip()
+        if value:
+            pool = pool_key(kind, value)
+            break
+    # Pools are precomputed by the catalog, so this is a dict lookup
+    ids = catalog.pool(pool)
+    if len(ids) < 2:
         return "Not enough fragrances in the database.", 404
 
-    random.shuffle(fragrances)
-    session["remaining"] = fragrances
-    session["champion"] = None
+    # The order is derived lazily from the seed, so starting is O(1)
+    state = {"seed": new_seed(), "cursor": 2, "champion": None, "size": len(ids), "pool": pool}
+    order = Bracket(ids, state["seed"])
+    token = None
+    if token_mode():
+        token = tokens.dump(state)
+    else:
+        session.update(state)
+
+    challenger1 = catalog.get(order[0])
+    challenger2 = catalog.get(order[1])
+
+    return render_template(
+        "index.html",
+        options=[challenger1, challenger2],
+        token=token,
+        categories=catalog.categories
+    )
 
-    challenger1 = session["remaining"].pop()
-    challenger2 = session["remaining"].pop()
+def apply_vote(vote, state):
+    """Validate one vote against a tournament state and apply it to the state
 
-    return render_template("index.html", options=[challenger1, challenger2])
+    Returns (payload, status) for the JSON response.
+    """
+    voted_id = vote.get("voted_id")
+    displayed_ids = vote.get("displayed_ids")
+
+    if not voted_id or not displayed_ids or len(displayed_ids) != 2:
+        return {"error": "Invalid input data"}, 400
+
+    # Validate ID
+    try:
+        voted_id = int(voted_id)
+        displayed_ids = {int(displayed_id) for displayed_id in displayed_ids}
+    except (TypeError, ValueError):
+        return {"error": "Invalid fragrance ID"}, 400
+    if voted_id not in catalog:
+        return {"error": "Invalid fragrance ID"}, 400
+
+    if state.get("seed") is None:
+        return {"error": "No tournament in progress"}, 400
+
+    order = bracket_for(state)
+    if order is None:
+        return {"error": "The fragrance list changed, please start a new game"}, 409
+    cursor = state["cursor"]
+    champion = state.get("champion")
+    matchup = (order[0], order[1]) if champion is None else (champion, order[cursor - 1])
+    if voted_id not in matchup or displayed_ids != set(matchup):
+        return {"error": "Vote does not match the current round"}, 400
+
+    # A signed token can be posted again; count each round only once
+    if token_mode() and not round_claims.claim(state):
+        return {"error": "This round was already voted on"}, 409
+
+    loser_id = matchup[1] if voted_id == matchup[0] else matchup[0]
+    win_recorder.record_match(voted_id, loser_id)
+    ratings.record(voted_id, loser_id)
+    metrics.inc("votes_total")
+    state["champion"] = voted_id
+
+    if cursor >= len(order):
+        win_recorder.record(voted_id)
+        state.pop("seed")
+        metrics.inc("tournaments_completed_total")
+        return {
+            "message": "Tournament complete.",
+            "final_champion": catalog.get(voted_id)
+        }, 200
+
+    state["cursor"] = cursor + 1
+    return {
+        "message": "Next round.",
+        "next_round": [catalog.get(voted_id), catalog.get(order[cursor])]
+    }, 200
+
+def vote_response(payload, status, state):
+    """jsonify a vote result, attaching the updated token in token mode"""
+    if token_mode() and state.get("seed") is not None:
+        payload["token"] = tokens.dump(state)
+    return jsonify(payload), status
 
 @app.route("/save_vote", methods=["POST"])
 def save_vote():
@@ -43,53 +216,171 @@ def save_vote():
         return jsonify({"error": "Expected JSON request"}), 415
 
     data = request.get_json()
-    voted_id = data.get("voted_id")
-    displayed_ids = data.get("displayed_ids")
+    try:
+        state = load_state(data)
+    except TokenError as e:
+        return jsonify({"error": str(e)}), 400
+    if state is None:
+        return jsonify({"error": "No tournament in progress"}), 400
 
-    if not voted_id or not displayed_ids or len(displayed_ids) != 2:
+    payload, status = apply_vote(data, state)
+    return vote_response(payload, status, state)
+
+@app.route("/save_votes", methods=["POST"])
+def save_votes():
+    """Apply a batch of votes in order, stopping at the first invalid one"""
+    if not request.is_json:
+        return jsonify({"error": "Expected JSON request"}), 415
+
+    data = request.get_json()
+    votes = data.get("votes")
+    if not isinstance(votes, list) or not votes or len(votes) > MAX_VOTE_BATCH:
         return jsonify({"error": "Invalid input data"}), 400
+    try:
+        state = load_state(data)
+    except TokenError as e:
+        return jsonify({"error": str(e)}), 400
+    if state is None:
+        return jsonify({"error": "No tournament in progress"}), 400
 
-    # Validate ID
-    valid = db.execute("SELECT 1 FROM fragrances WHERE id = ?", voted_id)
-    if not valid:
-        return jsonify({"error": "Invalid fragrance ID"}), 400
+    payload, status = {}, 200
+    for accepted, vote in enumerate(votes):
+        if not isinstance(vote, dict):
+            payload, status = {"error": "Invalid input data"}, 400
+        else:
+            payload, status = apply_vote(vote, state)
+        if status != 200:
+            payload["accepted"] = accepted
+            return vote_response(payload, status, state)
+    payload["accepted"] = len(votes)
+    return vote_response(payload, status, state)
 
-    old_champion = session.get("champion")
-    if old_champion is None:
-        session["champion"] = db.execute("SELECT * FROM fragrances WHERE id = ?", voted_id)[0]
-    else:
-        if voted_id != old_champion["id"]:
-            session["champion"] = db.execute("SELECT * FROM fragrances WHERE id = ?", voted_id)[0]
-
-    if not session["remaining"]:
-        final_id = session["champion"]["id"]
-        db.execute("""
-            INSERT INTO wins (id, wins)
-            VALUES (?, 1)
-            ON CONFLICT(id) DO UPDATE SET wins = wins + 1
-        """, final_id)
-        return jsonify({
-            "message": "Tournament complete.",
-            "final_champion": session["champion"]
-        })
+@app.route("/upcoming")
+def upcoming():
+    """Return the next challengers of the current tournament for preloading"""
+    try:
+        state = load_state(request.args)
+    except TokenError as e:
+        return jsonify({"error": str(e)}), 400
+    if state is None:
+        return jsonify({"error": "No tournament in progress"}), 400
 
-    next_challenger = session["remaining"].pop()
+    order = bracket_for(state)
+    if order is None:
+        return jsonify({"error": "The fragrance list changed, please start a new game"}), 409
+    start = request.args.get("start", state["cursor"], type=int)
+    n = max(1, min(request.args.get("n", 8, type=int), MAX_UPCOMING))
+    start = max(start, 2)
     return jsonify({
-        "message": "Next round.",
-        "next_round": [session["champion"], next_challenger]
+        "start": start,
+        "total": len(order),
+        "challengers": [catalog.get(fragrance_id) for fragrance_id in order[start:start + n]]
     })
 
 @app.route("/hall_of_fame")
 def hall_of_fame():
-    results = db.execute("""
-        SELECT f.id, f.name, f.image_url, w.wins
-        FROM wins w
-        JOIN fragrances f ON f.id = w.id
-        ORDER BY w.wins DESC
-        LIMIT 10
-    """)
-    champion = session.get("champion")
-    return render_template("hall_of_fame.html", top_fragrances=results, champion=champion)
+    rank = request.args.get("rank", "wins")
+    render = lambda top: Markup(render_template("_top_fragrances.html", top_fragrances=top))
+    if rank in ("elo", "bt"):
+        top_fragrances_html = ratings.fragment(rank, catalog, render)
+    else:
+        rank = "wins"
+        top_fragrances_html = leaderboard.fragment(catalog, render)
+    champion = session.get("champion") or request.args.get("champion", type=int)
+    return render_template(
+        "hall_of_fame.html",
+        top_fragrances_html=top_fragrances_html,
+        champion=champion,
+        rank=rank
+    )
+
+def leaderboard_args():
+    cursor = request.args.get("after")
+    limit = max(1, min(request.args.get("limit", 50, type=int), MAX_LEADERBOARD_PAGE))
+    return cursor, limit
+
+@app.route("/leaderboard")
+def full_leaderboard():
+    """Every fragrance with a win, ranked, a page at a time"""
+    cursor, limit = leaderboard_args()
+    entries, next_cursor = leaderboard_page(db, catalog, cursor, limit)
+    return render_template("leaderboard.html", entries=entries, next_cursor=next_cursor, limit=limit)
+
+@app.route("/leaderboard/entries")
+def leaderboard_entries():
+    """JSON page of the full leaderboard; pass next back as ?after= for the one after"""
+    cursor, limit = leaderboard_args()
+    entries, next_cursor = leaderboard_page(db, catalog, cursor, limit)
+    return jsonify({"entries": entries, "next": next_cursor})
+
+@app.route("/images/<int:fragrance_id>")
+def fragrance_image(fragrance_id):
+    """A bottle image ?w= pixels wide, as ?fmt=webp, jpeg or png
+
+    Without fmt, WebP is sent to clients that accept it. Fragrances the
+    scraper has no local copy of are redirected to the CDN.
+    """
+    fragrance = catalog.get(fragrance_id)
+    if fragrance is None:
+        return "Unknown fragrance", 404
+    width = snap_width(request.args.get("w", IMAGE_WIDTHS[-1], type=int))
+    fmt = negotiate_format(request.args.get("fmt"), request.headers.get("Accept"))
+    image = None
+    local_image_path = catalog.image_path(fragrance_id)
+    if local_image_path:
+        try:
+            # Opened, so another worker evicting the variant cannot break the response
+            image = thumbnails.open(local_image_path, width, fmt)
+        except OSError:
+            logging.exception(f"Resizing the image of {fragrance_id} failed")
+    if image is None:
+        return redirect(fragrance["image_url"] or CDN_IMAGE_URL.format(id=fragrance_id))
+    # The variant's name is content-addressed; its mtime moves on every hit
+    response = send_file(
+        image, mimetype=IMAGE_FORMATS[fmt][1], max_age=IMAGE_MAX_AGE, etag=os.path.basename(image.name)
+    )
+    if "fmt" not in request.args:
+        response.vary.add("Accept")
+    return response
+
+@app.route("/search")
+def search():
+    """Autocomplete fragrance names, with each match's wins and Elo rating"""
+    query = request.args.get("q", "")[:100]
+    limit = max(1, min(request.args.get("limit", 10, type=int), MAX_SEARCH_RESULTS))
+    results = []
+    matches = search_index.search(query, limit)
+    wins = win_counts(db, [fragrance_id for fragrance_id, _ in matches])
+    for fragrance_id, fuzzy in matches:
+        fragrance = catalog.get(fragrance_id)
+        if fragrance is None:
+            continue
+        fragrance["wins"] = wins.get(fragrance_id, 0)
+        fragrance["rating"] = ratings.elo.get(fragrance_id)
+        fragrance["fuzzy"] = fuzzy
+        results.append(fragrance)
+    return jsonify({"query": query, "results": results})
+
+@app.route("/export/<table>")
+def export(table):
+    """Stream fragrances, wins or matches as ?format=ndjson or csv
+
+    Rows come in id order; ?after=<id> resumes an interrupted download
+    after the last row received. Requires "Authorization: Bearer
+    $EXPORT_TOKEN" and does not exist when EXPORT_TOKEN is unset.
+    """
+    authorization = request.headers.get("Authorization", "").encode()
+    if not EXPORT_TOKEN or not hmac.compare_digest(authorization, f"Bearer {EXPORT_TOKEN}".encode()):
+        return jsonify({"error": "Not found"}), 404
+    fmt = request.args.get("format", "ndjson")
+    if table not in EXPORT_TABLES or fmt not in EXPORT_FORMATS:
+        return jsonify({"error": "Unknown table or format"}), 404
+    after = request.args.get("after", type=int)
+    return Response(
+        export_chunks(DATABASE_PATH, table, fmt, after),
+        mimetype=MEDIA_TYPES[fmt],
+        headers={"Content-Disposition": f"attachment; filename={table}.{fmt}"}
+    )
 
 @app.route("/about")
 def about():
@@ -0,0 +1,301 @@
+"""Load and latency benchmarks for the Scent Showdown web app
+
+    python benchmark.py generate --db bench.db --size 1000 --wins 5000 --matches 100000
+    python benchmark.py run --db bench.db --driver client --concurrency 8 --tournaments 50
+    python benchmark.py run --db bench.db --driver server --concurrency 32 --max-votes 50
+
+Each run writes a JSON report (throughput, p50/p95/p99 latency per route,
+session bytes written per vote, peak RSS) to bench_results/ so runs can be
+compared over time.
+"""
+import argparse
+import http.cookiejar
+import json
+import os
+import platform
+import random
+import re
+import resource
+import sys
+import threading
+import time
+import urllib.request
+from collections import defaultdict
+
+from database import BUMP_CATALOG_VERSION_SQL, connect, ensure_schema
+
+OPTION_ID = re.compile(r'data-id="(\d+)"')
+TOKEN = re.compile(r'let token = "([^"]+)"')
+
+CATEGORIES = ("designer", "niche", "celebrity")
+
+
+def generate(db_path, size, wins, matches, seed=0, force=False):
+    """Fill db_path with a synthetic catalog, win counts and a match log
+
+    An existing database is only replaced if force is set, together with
+    its -wal and -shm files.
+    """
+    if os.path.exists(db_path):
+        if not force:
+            raise FileExistsError(f"{db_path} already exists, pass --force to replace it")
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(db_path + suffix):
+                os.remove(db_path + suffix)
+    rng = random.Random(seed)
+    ensure_schema(db_path)
+    conn = connect(db_path)
+    ids = rng.sample(range(1, size * 10), size)
+    with conn:
+        conn.executemany(
+            "INSERT INTO fragrances (id, name, image_url, brand, category) VALUES (?, ?, ?, ?, ?)",
+            (
+                (
+                    i,
+                    f"Fragrance {i}",
+                    f"https://fimgs.net/mdimg/perfume/375x500.{i}.jpg",
+                    f"Brand {rng.randrange(max(1, size // 20))}",
+                    rng.choice(CATEGORIES),
+                )
+                for i in ids
+            )
+        )
+        counts = defaultdict(int)
+        for _ in range(wins):
+            # Skewed towards a few favourites, like real votes
+            counts[ids[min(int(rng.paretovariate(1.2)) - 1, size - 1)]] += 1
+        conn.executemany("INSERT INTO wins (id, wins) VALUES (?, ?)", counts.items())
+        conn.execute(BUMP_CATALOG_VERSION_SQL)
+        conn.executemany(
+            "INSERT INTO matches (winner, loser) VALUES (?, ?)",
+            (tuple(rng.sample(ids, 2)) for _ in range(matches))
+        )
+    conn.close()
+    print(f"Generated {size} fragrances, {wins} wins, {matches} matches in {db_path}")
+
+
+class ClientDriver:
+    """Plays tournaments through the Flask test client"""
+
+    def __init__(self, app):
+        self.app = app
+
+    def session(self):
+        client = self.app.test_client()
+
+        def request(method, path, body=None):
+            if method == "GET":
+                response = client.get(path)
+            else:
+                response = client.post(path, json=body)
+            return response.status_code, response.get_data(as_text=True)
+
+        return request
+
+
+class ServerDriver:
+    """Plays tournaments over HTTP against a threaded local werkzeug server"""
+
+    def __init__(self, app):
+        from werkzeug.serving import make_server
+
+        self.server = make_server("127.0.0.1", 0, app, threaded=True)
+        self.base = f"http://127.0.0.1:{self.server.server_port}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def session(self):
+        opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+
+        def request(method, path, body=None):
+            data = None
+            headers = {}
+            if body is not None:
+                data = json.dumps(body).encode()
+                headers["Content-Type"] = "application/json"
+            req = urllib.request.Request(self.base + path, data=data, headers=headers, method=method)
+            try:
+                with opener.open(req) as response:
+                    return response.status, response.read().decode()
+            except urllib.error.HTTPError as e:
+                return e.code, e.read().decode()
+
+        return request
+
+    def close(self):
+        self.server.shutdown()
+
+
+def play(request, timings, rng, max_votes, start="/"):
+    """Play one tournament, voting at random; returns the number of votes"""
+    started = time.perf_counter()
+    status, body = request("GET", start)
+    timings["/"].append(time.perf_counter() - started)
+    if status != 200:
+        raise RuntimeError(f"GET / returned {status}")
+    ids = [int(i) for i in OPTION_ID.findall(body)]
+    token = TOKEN.search(body)
+    token = token.group(1) if token else None
+
+    votes = 0
+    while votes < max_votes:
+        vote = {"voted_id": rng.choice(ids), "displayed_ids": ids}
+        if token:
+            vote["token"] = token
+        started = time.perf_counter()
+        status, body = request("POST", "/save_vote", vote)
+        timings["/save_vote"].append(time.perf_counter() - started)
+        votes += 1
+        data = json.loads(body)
+        if status != 200:
+            raise RuntimeError(f"POST /save_vote returned {status}: {data}")
+        if "final_champion" in data:
+            break
+        token = data.get("token")
+        ids = [f["id"] for f in data["next_round"]]
+
+    started = time.perf_counter()
+    request("GET", "/hall_of_fame")
+    timings["/hall_of_fame"].append(time.perf_counter() - started)
+    return votes
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def run(args):
+    os.environ["DATABASE_PATH"] = args.db
+    if args.session_type:
+        os.environ["SESSION_TYPE"] = args.session_type
+    if args.tournament_mode:
+        os.environ["TOURNAMENT_MODE"] = args.tournament_mode
+    import app as webapp
+
+    driver = ServerDriver(webapp.app) if args.driver == "server" else ClientDriver(webapp.app)
+    timings = defaultdict(list)
+    totals = {"votes": 0, "tournaments": 0, "errors": 0}
+    lock = threading.Lock()
+    per_worker = max(1, args.tournaments // args.concurrency)
+    start = f"/?category={args.category}" if args.category else "/"
+
+    def worker(n):
+        request = driver.session()
+        rng = random.Random(n)
+        local = defaultdict(list)
+        votes = tournaments = errors = 0
+        for _ in range(per_worker):
+            try:
+                votes += play(request, local, rng, args.max_votes, start)
+                tournaments += 1
+            except Exception as e:
+                errors += 1
+                print(f"worker {n}: {e}", file=sys.stderr)
+        with lock:
+            for route, values in local.items():
+                timings[route].extend(values)
+            totals["votes"] += votes
+            totals["tournaments"] += tournaments
+            totals["errors"] += errors
+
+    store_before = webapp.session_store.stats.bytes_written
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(args.concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    if args.driver == "server":
+        driver.close()
+
+    requests = sum(len(values) for values in timings.values())
+    routes = {}
+    for route, values in sorted(timings.items()):
+        values.sort()
+        routes[route] = {
+            "requests": len(values),
+            "mean_ms": 1000 * sum(values) / len(values),
+            "p50_ms": 1000 * percentile(values, 0.50),
+            "p95_ms": 1000 * percentile(values, 0.95),
+            "p99_ms": 1000 * percentile(values, 0.99),
+        }
+    session_bytes = webapp.session_store.stats.bytes_written - store_before
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "config": {
+            "db": args.db,
+            "catalog_size": len(webapp.catalog),
+            "driver": args.driver,
+            "concurrency": args.concurrency,
+            "tournaments": args.tournaments,
+            "max_votes": args.max_votes,
+            "category": args.category,
+            "session_type": webapp.app.config["SESSION_TYPE"],
+            "tournament_mode": webapp.app.config["TOURNAMENT_MODE"],
+        },
+        "elapsed_s": elapsed,
+        "requests": requests,
+        "throughput_rps": requests / elapsed if elapsed else None,
+        "votes": totals["votes"],
+        "tournaments": totals["tournaments"],
+        "errors": totals["errors"],
+        "session_bytes_per_vote": session_bytes / totals["votes"] if totals["votes"] else None,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "routes": routes,
+    }
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    path = os.path.join(args.output_dir, f"bench-{time.strftime('%Y%m%d-%H%M%S')}-{args.driver}.json")
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
+
+    print(f"{requests} requests in {elapsed:.2f}s ({report['throughput_rps']:.0f} req/s), {totals['errors']} errors")
+    for route, stats in routes.items():
+        print(f"  {route:<14} p50 {stats['p50_ms']:.2f}ms  p95 {stats['p95_ms']:.2f}ms  p99 {stats['p99_ms']:.2f}ms")
+    if report["session_bytes_per_vote"] is not None:
+        print(f"  session bytes per vote: {report['session_bytes_per_vote']:.0f}")
+    print(f"  peak RSS: {report['peak_rss_mb']:.1f} MB")
+    print(f"Report written to {path}")
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    gen = commands.add_parser("generate", help="create a synthetic fragrances database")
+    gen.add_argument("--db", default="bench.db")
+    gen.add_argument("--size", type=int, default=1000, help="number of fragrances (20 to 100k)")
+    gen.add_argument("--wins", type=int, default=10000)
+    gen.add_argument("--matches", type=int, default=100000)
+    gen.add_argument("--seed", type=int, default=0)
+    gen.add_argument("--force", action="store_true", help="replace the database if it exists")
+
+    bench = commands.add_parser("run", help="play tournaments and report latency")
+    bench.add_argument("--db", default="bench.db")
+    bench.add_argument("--driver", choices=("client", "server"), default="client")
+    bench.add_argument("--concurrency", type=int, default=4)
+    bench.add_argument("--tournaments", type=int, default=20)
+    bench.add_argument("--max-votes", type=int, default=10 ** 9,
+                       help="stop each tournament after this many votes (for large catalogs)")
+    bench.add_argument("--session-type", choices=("memory", "sqlite", "filesystem"))
+    bench.add_argument("--tournament-mode", choices=("session", "token"))
+    bench.add_argument("--category", choices=CATEGORIES, help="play category-filtered tournaments")
+    bench.add_argument("--output-dir", default="bench_results")
+
+    args = parser.parse_args()
+    if args.command == "generate":
+        try:
+            generate(args.db, args.size, args.wins, args.matches, args.seed, args.force)
+        except FileExistsError as e:
+            parser.error(str(e))
+    else:
+        run(args)
+
+
+if __name__ == "__main__":
+    main()
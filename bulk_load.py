@@ -0,0 +1,126 @@
+from database import BUMP_CATALOG_VERSION_SQL, connect
+from typing import Iterable, Dict, Any, List
+
+FRAGRANCE_FIELDS = ('id', 'name', 'image_url', 'local_image_path', 'brand', 'category')
+
+# Scraped rows land here first; it lives in the connection's temp database,
+# so filling it takes no lock on fragrances.db
+CREATE_STAGING_SQL = '''
+    CREATE TEMP TABLE IF NOT EXISTS fragrance_staging (
+        id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        image_url TEXT,
+        local_image_path TEXT,
+        brand TEXT,
+        category TEXT
+    )
+'''
+
+STAGE_SQL = '''
+    INSERT OR REPLACE INTO fragrance_staging (id, name, image_url, local_image_path, brand, category)
+    VALUES (:id, :name, :image_url, :local_image_path, :brand, :category)
+'''
+
+# A row `new` changes nothing if every column of the existing row f already
+# has the value the merge would write; optional columns that were not
+# scraped keep theirs
+UNCHANGED_SQL = '''(
+    f.name IS {new}.name
+    AND f.image_url IS {new}.image_url
+    AND f.local_image_path IS COALESCE({new}.local_image_path, f.local_image_path)
+    AND f.brand IS COALESCE({new}.brand, f.brand)
+    AND f.category IS COALESCE({new}.category, f.category)
+)'''
+
+COUNT_SQL = f'''
+    SELECT
+        SUM(f.id IS NULL),
+        SUM(f.id IS NOT NULL AND {UNCHANGED_SQL.format(new='s')})
+    FROM fragrance_staging s LEFT JOIN fragrances f ON f.id = s.id
+'''
+
+# Insert new fragrances and refresh changed ones in place; wins live in
+# their own table and are never touched. A crawl without a category keeps
+# the one an earlier category crawl set. Unchanged rows are not rewritten.
+MERGE_SQL = f'''
+    INSERT INTO fragrances AS f (id, name, image_url, local_image_path, brand, category)
+    SELECT id, name, image_url, local_image_path, brand, category FROM fragrance_staging WHERE true
+    ON CONFLICT(id) DO UPDATE SET
+        name = excluded.name,
+        image_url = excluded.image_url,
+        local_image_path = COALESCE(excluded.local_image_path, f.local_image_path),
+        brand = COALESCE(excluded.brand, f.brand),
+        category = COALESCE(excluded.category, f.category)
+    WHERE NOT {UNCHANGED_SQL.format(new='excluded')}
+'''
+
+
+class BulkLoader:
+    """Buffers scraped fragrances and merges them into the table in bulk.
+
+    flush() stages the buffered rows into a temp table with executemany and
+    then merges them with one INSERT ... SELECT upsert inside a single
+    BEGIN IMMEDIATE transaction, so the write lock is taken once per batch
+    rather than once per row. Later rows for the same id replace earlier
+    ones in the batch. Running totals are kept in counts.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self.pending: List[Dict[str, Any]] = []
+        self.counts = {'inserted': 0, 'updated': 0, 'unchanged': 0}
+
+    def __len__(self):
+        return len(self.pending)
+
+    def add(self, record: Dict[str, Any]):
+        self.pending.append({field: record.get(field) for field in FRAGRANCE_FIELDS})
+
+    def extend(self, records: Iterable[Dict[str, Any]]):
+        for record in records:
+            self.add(record)
+
+    def flush(self) -> Dict[str, int]:
+        """Write the buffered rows and return this batch's counts"""
+        rows, self.pending = self.pending, []
+        counts = {'inserted': 0, 'updated': 0, 'unchanged': 0}
+        if not rows:
+            return counts
+        conn = connect(self.db_path, timeout=30, isolation_level=None)
+        try:
+            conn.execute(CREATE_STAGING_SQL)
+            conn.execute("DELETE FROM fragrance_staging")
+            conn.execute("BEGIN")
+            conn.executemany(STAGE_SQL, rows)
+            conn.execute("COMMIT")
+
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                staged = conn.execute("SELECT COUNT(*) FROM fragrance_staging").fetchone()[0]
+                inserted, unchanged = conn.execute(COUNT_SQL).fetchone()
+                conn.execute(MERGE_SQL)
+                if staged > (unchanged or 0):
+                    conn.execute(BUMP_CATALOG_VERSION_SQL)
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        except BaseException:
+            # Keep the rows for the next attempt
+            self.pending = rows + self.pending
+            raise
+        finally:
+            conn.close()
+        counts['inserted'] = inserted or 0
+        counts['unchanged'] = unchanged or 0
+        counts['updated'] = staged - counts['inserted'] - counts['unchanged']
+        for key, value in counts.items():
+            self.counts[key] += value
+        return counts
+
+
+def upsert_fragrances(db_path: str, records: Iterable[Dict[str, Any]]) -> Dict[str, int]:
+    """Merge many fragrances in one transaction and return the counts"""
+    loader = BulkLoader(db_path)
+    loader.extend(records)
+    return loader.flush()
@@ -0,0 +1,104 @@
+import threading
+import time
+from collections import defaultdict
+
+from database import CATALOG_VERSION_SQL
+
+
+CATALOG_SQL = "SELECT id, name, image_url, local_image_path, brand, category FROM fragrances ORDER BY id"
+
+# Attributes a tournament can be filtered on
+POOL_KINDS = ("brand", "category")
+
+
+def pool_key(kind, value):
+    """Return the key of the id pool for one attribute value, e.g. "category:niche\""""
+    return f"{kind}:{value.strip().lower()}"
+
+
+class Catalog:
+    """Read-through, in-process cache of the fragrances table.
+
+    The whole table is held as ``{id: (name, image_url)}`` and reloaded only
+    when the catalog version in the meta table moves, so a scraper run is
+    picked up without restarting the app while win and match writes never
+    cause a reload. Each reload also builds the id pools of
+    every brand and category, so a filtered tournament starts from a
+    ready-made tuple of ids.
+    """
+
+    def __init__(self, db, db_path, check_interval=1.0):
+        self.db = db
+        self.db_path = db_path
+        self.check_interval = check_interval
+        self.records = {}
+        self.image_paths = {}
+        self.ids = ()
+        self.pools = {}
+        self.categories = ()
+        self.version = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def _stamp(self):
+        """Return the catalog version, bumped by every write to fragrances"""
+        rows = self.db.query(CATALOG_VERSION_SQL)
+        return rows[0]["value"] if rows else 0
+
+    def refresh(self, force=False):
+        """Reload the table if the catalog version moved since the last load"""
+        now = time.monotonic()
+        if not force and self.version is not None and now - self._checked_at < self.check_interval:
+            return
+        with self._lock:
+            self._checked_at = now
+            stamp = self._stamp()
+            if not force and stamp == self.version:
+                return
+            rows = self.db.query(CATALOG_SQL)
+            records = {}
+            image_paths = {}
+            pools = defaultdict(list)
+            for row in rows:
+                records[row["id"]] = (row["name"], row["image_url"])
+                if row["local_image_path"]:
+                    image_paths[row["id"]] = row["local_image_path"]
+                for kind in POOL_KINDS:
+                    if row[kind]:
+                        pools[pool_key(kind, row[kind])].append(row["id"])
+            self.records = records
+            self.image_paths = image_paths
+            self.ids = tuple(records)
+            self.pools = {key: tuple(ids) for key, ids in pools.items()}
+            self.categories = tuple(sorted(
+                key.split(":", 1)[1] for key in self.pools if key.startswith("category:")
+            ))
+            self.version = stamp
+
+    def __len__(self):
+        self.refresh()
+        return len(self.records)
+
+    def __contains__(self, fragrance_id):
+        self.refresh()
+        return fragrance_id in self.records
+
+    def pool(self, key=None):
+        """Return the ids in a pool (see pool_key), or every id for None"""
+        self.refresh()
+        if key is None:
+            return self.ids
+        return self.pools.get(key, ())
+
+    def get(self, fragrance_id):
+        """Return a fragrance as a dict, or None if the id is unknown"""
+        self.refresh()
+        record = self.records.get(fragrance_id)
+        if record is None:
+            return None
+        return {"id": fragrance_id, "name": record[0], "image_url": record[1]}
+
+    def image_path(self, fragrance_id):
+        """Return the scraper's local copy of a fragrance's image, or None"""
+        self.refresh()
+        return self.image_paths.get(fragrance_id)
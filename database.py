@@ -0,0 +1,164 @@
+import sqlite3
+import threading
+import time
+
+# Applied to every connection when it is opened
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA temp_store=MEMORY",
+)
+
+BUSY_TIMEOUT = 5.0
+
+# Compiled statements kept per connection; fixed queries are prepared once
+STATEMENT_CACHE_SIZE = 256
+
+
+def connect(path, readonly=False, timeout=BUSY_TIMEOUT, **kwargs):
+    """Open a tuned sqlite3 connection to path
+
+    Read-only connections open the file with mode=ro and cannot take the
+    write lock, so they never wait behind writers in WAL mode.
+    """
+    if readonly:
+        conn = sqlite3.connect(
+            f"file:{path}?mode=ro",
+            uri=True,
+            timeout=timeout,
+            cached_statements=STATEMENT_CACHE_SIZE,
+            **kwargs
+        )
+        conn.execute("PRAGMA mmap_size=268435456")
+        conn.execute("PRAGMA query_only=ON")
+    else:
+        conn = sqlite3.connect(path, timeout=timeout, cached_statements=STATEMENT_CACHE_SIZE, **kwargs)
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+    conn.execute(f"PRAGMA busy_timeout={int(timeout * 1000)}")
+    return conn
+
+
+class Database:
+    """Per-thread sqlite3 connections for the web app
+
+    Each thread gets one read-write and one read-only connection, opened on
+    first use. Reads go through the read-only one, so they never wait
+    behind writers. The few writes a request makes itself, such as claiming
+    a token round, go through execute(); wins and matches are written in
+    batches by the WinRecorder on its own connection.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        # Called with the duration in seconds of every statement, for metrics
+        self.listeners = []
+        # Create the file (and switch it to WAL) before any read-only open
+        connect(self.path).close()
+
+    def _connection(self, readonly):
+        name = "reader" if readonly else "writer"
+        conn = getattr(self._local, name, None)
+        if conn is None:
+            conn = connect(self.path, readonly=readonly)
+            conn.row_factory = sqlite3.Row
+            setattr(self._local, name, conn)
+        return conn
+
+    def _observe(self, started):
+        elapsed = time.perf_counter() - started
+        for listener in self.listeners:
+            listener(elapsed)
+
+    def query(self, sql, params=()):
+        """Run a SELECT on the read-only connection and return a list of dicts"""
+        started = time.perf_counter()
+        try:
+            return [dict(row) for row in self._connection(True).execute(sql, params)]
+        finally:
+            self._observe(started)
+
+    def execute(self, sql, params=()):
+        """Run one write statement in its own transaction and return rowcount"""
+        started = time.perf_counter()
+        conn = self._connection(False)
+        try:
+            with conn:
+                return conn.execute(sql, params).rowcount
+        finally:
+            self._observe(started)
+
+
+# Bumped in the same transaction as any write that changes fragrances, so
+# readers can tell the catalog changed without watching every other write
+BUMP_CATALOG_VERSION_SQL = '''
+    INSERT INTO meta (key, value) VALUES ('catalog_version', 1)
+    ON CONFLICT(key) DO UPDATE SET value = value + 1
+'''
+
+CATALOG_VERSION_SQL = "SELECT value FROM meta WHERE key = 'catalog_version'"
+
+
+# Attribute columns added after the first release, with their indexes
+FRAGRANCE_ATTRIBUTES = ("brand", "category")
+
+
+def ensure_schema(path):
+    """Create the fragrances, wins, matches, meta and token_rounds tables, adding missing attribute columns
+
+    Databases created before brand and category existed are migrated in
+    place with ALTER TABLE, so old scrapes keep working.
+    """
+    conn = connect(path)
+    try:
+        with conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS fragrances (
+                    id INTEGER PRIMARY KEY,
+                    name TEXT NOT NULL,
+                    image_url TEXT,
+                    local_image_path TEXT,
+                    brand TEXT,
+                    category TEXT
+                )
+            ''')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS wins (
+                    id INTEGER PRIMARY KEY,
+                    wins INTEGER DEFAULT 0,
+                    FOREIGN KEY (id) REFERENCES fragrances(id)
+                )
+            ''')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS matches (
+                    winner INTEGER NOT NULL,
+                    loser INTEGER NOT NULL
+                )
+            ''')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS meta (
+                    key TEXT PRIMARY KEY,
+                    value INTEGER NOT NULL
+                )
+            ''')
+            # Rounds of token tournaments already voted on, see tournament.RoundClaims
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS token_rounds (
+                    seed INTEGER NOT NULL,
+                    cursor INTEGER NOT NULL,
+                    claimed_at REAL NOT NULL,
+                    PRIMARY KEY (seed, cursor)
+                ) WITHOUT ROWID
+            ''')
+            conn.execute("CREATE INDEX IF NOT EXISTS token_rounds_by_time ON token_rounds (claimed_at)")
+            # Covers the full leaderboard's keyset pages in (wins DESC, id) order
+            conn.execute("CREATE INDEX IF NOT EXISTS wins_by_wins ON wins (wins DESC, id)")
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(fragrances)")}
+            for column in FRAGRANCE_ATTRIBUTES:
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE fragrances ADD COLUMN {column} TEXT")
+                conn.execute(f"CREATE INDEX IF NOT EXISTS fragrances_{column} ON fragrances ({column} COLLATE NOCASE)")
+    finally:
+        conn.close()
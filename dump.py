@@ -0,0 +1,284 @@
+"""Stream the game data out as NDJSON or CSV and load it back in bulk
+
+    python dump.py export fragrances -o fragrances.ndjson
+    python dump.py export matches --format csv -o matches.csv --resume
+    python dump.py import wins wins.ndjson --db new.db
+
+Exports walk each table in primary-key order, a batch at a time, so memory
+stays constant however big the table is. Every row carries its id, so an
+interrupted export resumes after the last id written, with --resume or
+?after= on the app's /export (enabled by EXPORT_TOKEN). Imports parse the
+file lazily and commit every batch_size rows, and they are idempotent, so
+an interrupted import can simply be run again.
+"""
+import argparse
+import csv
+import io
+import itertools
+import json
+import logging
+import os
+import time
+from typing import Any, Dict, Iterable, Iterator, Optional, Tuple
+
+from database import BUMP_CATALOG_VERSION_SQL, connect, ensure_schema
+
+FORMATS = ("ndjson", "csv")
+
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+COLUMNS = {
+    "fragrances": ("id", "name", "image_url", "local_image_path", "brand", "category"),
+    "wins": ("id", "wins"),
+    "matches": ("id", "winner", "loser"),
+}
+
+INTEGER_COLUMNS = {"id", "wins", "winner", "loser"}
+
+# Keyset pagination: each batch is its own short query starting after the
+# last id seen, so no read transaction stays open for the whole export and
+# a deep batch costs the same as the first. matches has no id column, so
+# its rowid is exported as id.
+SELECT_SQL = {
+    "fragrances": '''
+        SELECT id, name, image_url, local_image_path, brand, category
+        FROM fragrances WHERE id > ? ORDER BY id LIMIT ?
+    ''',
+    "wins": "SELECT id, wins FROM wins WHERE id > ? ORDER BY id LIMIT ?",
+    "matches": "SELECT rowid, winner, loser FROM matches WHERE rowid > ? ORDER BY rowid LIMIT ?",
+}
+
+# Imports restore rows as they were exported, replacing whatever has the
+# same id, so loading a file twice changes nothing the second time
+IMPORT_SQL = {
+    "fragrances": '''
+        INSERT INTO fragrances (id, name, image_url, local_image_path, brand, category)
+        VALUES (:id, :name, :image_url, :local_image_path, :brand, :category)
+        ON CONFLICT(id) DO UPDATE SET
+            name = excluded.name,
+            image_url = excluded.image_url,
+            local_image_path = excluded.local_image_path,
+            brand = excluded.brand,
+            category = excluded.category
+    ''',
+    "wins": '''
+        INSERT INTO wins (id, wins) VALUES (:id, :wins)
+        ON CONFLICT(id) DO UPDATE SET wins = excluded.wins
+    ''',
+    "matches": "INSERT OR IGNORE INTO matches (rowid, winner, loser) VALUES (:id, :winner, :loser)",
+}
+
+BATCH_SIZE = 5000
+IMPORT_BATCH_SIZE = 50000
+
+# Encoded rows are handed out in chunks of about this many characters
+CHUNK_SIZE = 64 * 1024
+
+# Smaller than any SQLite integer key
+FIRST_KEY = -(2 ** 63)
+
+
+def check_table(table: str, fmt: str = "ndjson"):
+    if table not in COLUMNS:
+        raise ValueError(f"Unknown table: {table}")
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown format: {fmt}")
+
+
+def iter_rows(db_path: str, table: str, after: Optional[int] = None, batch_size: int = BATCH_SIZE) -> Iterator[Tuple]:
+    """Yield the rows of table in id order, starting after the id after"""
+    check_table(table)
+    conn = connect(db_path, readonly=True)
+    try:
+        exists = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)
+        ).fetchone()
+        if not exists:
+            return
+        key = FIRST_KEY if after is None else after
+        while True:
+            rows = conn.execute(SELECT_SQL[table], (key, batch_size)).fetchall()
+            yield from rows
+            if len(rows) < batch_size:
+                return
+            key = rows[-1][0]
+    finally:
+        conn.close()
+
+
+def encode(rows: Iterable[Tuple], table: str, fmt: str, header: bool = True) -> Iterator[str]:
+    """Encode rows as NDJSON or CSV, yielding chunks of whole lines"""
+    columns = COLUMNS[table]
+    buffer = io.StringIO()
+    if fmt == "csv":
+        writer = csv.writer(buffer, lineterminator="\n")
+        if header:
+            writer.writerow(columns)
+        for row in rows:
+            writer.writerow(row)
+            if buffer.tell() >= CHUNK_SIZE:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+    else:
+        for row in rows:
+            buffer.write(json.dumps(dict(zip(columns, row)), ensure_ascii=False))
+            buffer.write("\n")
+            if buffer.tell() >= CHUNK_SIZE:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def export_chunks(db_path: str, table: str, fmt: str = "ndjson", after: Optional[int] = None) -> Iterator[str]:
+    """Stream a table as text; a resumed CSV export has no header row"""
+    check_table(table, fmt)
+    return encode(iter_rows(db_path, table, after), table, fmt, header=after is None)
+
+
+def decode(lines: Iterable[str], table: str, fmt: str) -> Iterator[Dict[str, Any]]:
+    """Parse NDJSON or CSV lines into row dicts, one line at a time"""
+    columns = COLUMNS[table]
+    if fmt == "csv":
+        for record in csv.DictReader(lines):
+            row = {}
+            for column in columns:
+                value = record.get(column)
+                if value == "" or value is None:
+                    row[column] = None
+                elif column in INTEGER_COLUMNS:
+                    row[column] = int(value)
+                else:
+                    row[column] = value
+            yield row
+    else:
+        for line in lines:
+            if line.strip():
+                record = json.loads(line)
+                yield {column: record.get(column) for column in columns}
+
+
+def import_rows(db_path: str, table: str, rows: Iterable[Dict[str, Any]], batch_size: int = IMPORT_BATCH_SIZE) -> int:
+    """Load rows into table, committing every batch_size rows; returns the row count"""
+    check_table(table)
+    ensure_schema(db_path)
+    conn = connect(db_path, timeout=30, isolation_level=None)
+    rows = iter(rows)
+    total = 0
+    try:
+        for first in rows:
+            # executemany pulls the rest of the batch straight from the parser
+            batch = itertools.chain((first,), itertools.islice(rows, batch_size - 1))
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                total += conn.executemany(IMPORT_SQL[table], batch).rowcount
+                if table == "fragrances":
+                    conn.execute(BUMP_CATALOG_VERSION_SQL)
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+    finally:
+        conn.close()
+    return total
+
+
+def import_file(db_path: str, table: str, path: str, fmt: Optional[str] = None, batch_size: int = IMPORT_BATCH_SIZE) -> int:
+    """Import a file written by export; the format defaults to its extension"""
+    fmt = fmt or format_for(path)
+    check_table(table, fmt)
+    with open(path, newline="", encoding="utf-8") as f:
+        return import_rows(db_path, table, decode(f, table, fmt), batch_size)
+
+
+def format_for(path: str) -> str:
+    return "csv" if path.lower().endswith(".csv") else "ndjson"
+
+
+def resume_point(path: str, table: str, fmt: str) -> Optional[int]:
+    """Return the last id written to an export file, or None to start over
+
+    A last line without a newline was cut off mid-write; it is truncated
+    away so the export continues from the row before it.
+    """
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb+") as f:
+        size = f.seek(0, os.SEEK_END)
+        tail_start = max(0, size - CHUNK_SIZE)
+        f.seek(tail_start)
+        tail = f.read()
+        if tail and not tail.endswith(b"\n"):
+            cut = tail.rfind(b"\n") + 1
+            f.truncate(tail_start + cut)
+            tail = tail[:cut]
+    lines = tail.decode("utf-8", errors="replace").splitlines()
+    for line in reversed(lines):
+        if not line.strip():
+            continue
+        if fmt == "csv":
+            key = next(csv.reader([line]))[0]
+            return int(key) if key.lstrip("-").isdigit() else None
+        try:
+            return json.loads(line)["id"]
+        except (ValueError, KeyError, TypeError):
+            return None
+    return None
+
+
+def export_file(db_path: str, table: str, path: str, fmt: Optional[str] = None, resume: bool = False) -> int:
+    """Write a table to path, appending after its last row if resume is set"""
+    fmt = fmt or format_for(path)
+    check_table(table, fmt)
+    after = resume_point(path, table, fmt) if resume else None
+    rows = 0
+
+    def counted():
+        # Counted as they are encoded: a quoted CSV field may span lines
+        nonlocal rows
+        for row in iter_rows(db_path, table, after):
+            rows += 1
+            yield row
+
+    with open(path, "a" if after is not None else "w", newline="", encoding="utf-8") as f:
+        for chunk in encode(counted(), table, fmt, header=after is None):
+            f.write(chunk)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export or import fragrances, wins and matches")
+    parser.add_argument("--db", default="fragrances.db")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = commands.add_parser("export", help="stream a table to a file")
+    export_parser.add_argument("table", choices=COLUMNS)
+    export_parser.add_argument("-o", "--output", help="defaults to <table>.<format>")
+    export_parser.add_argument("--format", choices=FORMATS, help="defaults to the output's extension")
+    export_parser.add_argument("--resume", action="store_true", help="continue after the last row in the output")
+
+    import_parser = commands.add_parser("import", help="load a file written by export")
+    import_parser.add_argument("table", choices=COLUMNS)
+    import_parser.add_argument("input")
+    import_parser.add_argument("--format", choices=FORMATS, help="defaults to the input's extension")
+    import_parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE, help="rows per transaction")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    started = time.monotonic()
+    if args.command == "export":
+        path = args.output or f"{args.table}.{args.format or 'ndjson'}"
+        rows = export_file(args.db, args.table, path, args.format, args.resume)
+        logging.info(f"Exported {rows} {args.table} rows to {path} in {time.monotonic() - started:.1f}s")
+    else:
+        rows = import_file(args.db, args.table, args.input, args.format, args.batch_size)
+        logging.info(f"Imported {rows} {args.table} rows from {args.input} in {time.monotonic() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""Local stand-in for fragrantica.com and fimgs.net built from recorded responses
+
+    python main.py --pages 5 --cache-mode record          # record once against the live site
+    python fixture_server.py --port 8765 --latency 50     # then serve the recording
+    python main.py --db offline.db --pages 5 --restart \\
+        --listing-url "http://127.0.0.1:8765/www.fragrantica.com/search/?page={page}"
+
+A recorded https://<host>/<path> is served at http://127.0.0.1:<port>/<host>/<path>,
+and absolute links in served HTML are rewritten the same way. A crawl then
+goes through the browser, aiohttp, parsing and the DB exactly as it does
+live, offline and repeatably. Anything that was not recorded is a 404.
+"""
+import argparse
+import asyncio
+import re
+
+from aiohttp import web
+
+from http_cache import ResponseCache
+
+ABSOLUTE_URL = re.compile(rb"https?://([a-z0-9.-]+\.[a-z]{2,})/", re.IGNORECASE)
+
+
+def make_app(cache: ResponseCache, latency: float = 0.0) -> web.Application:
+    """Return an aiohttp app serving the responses in cache"""
+
+    async def serve(request: web.Request) -> web.StreamResponse:
+        host, _, path = request.rel_url.path_qs.lstrip('/').partition('/')
+        cached = None
+        for scheme in ('https', 'http'):
+            cached = await asyncio.to_thread(cache.get, f"{scheme}://{host}/{path}")
+            if cached is not None:
+                break
+        if latency:
+            await asyncio.sleep(latency)
+        if cached is None:
+            raise web.HTTPNotFound()
+
+        etag = cached.headers.get('ETag')
+        if etag and request.headers.get('If-None-Match') == etag:
+            return web.Response(status=304, headers={'ETag': etag})
+        body = cached.body
+        content_type = cached.headers.get('Content-Type', 'application/octet-stream')
+        if content_type.startswith('text/html'):
+            base = f"http://{request.host}/".encode()
+            body = ABSOLUTE_URL.sub(lambda m: base + m.group(1) + b"/", body)
+        headers = {key: value for key, value in cached.headers.items() if key != 'Content-Type'}
+        return web.Response(status=cached.status, body=body, content_type=content_type.split(';')[0], headers=headers)
+
+    app = web.Application()
+    app.router.add_get('/{tail:.*}', serve)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--cache-dir", default="http_cache")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="milliseconds added to every response")
+    args = parser.parse_args()
+
+    cache = ResponseCache(args.cache_dir, mode="replay")
+    print(f"Serving {len(cache)} recorded responses from {args.cache_dir} at http://{args.host}:{args.port}/")
+    web.run_app(make_app(cache, args.latency / 1000), host=args.host, port=args.port, print=None)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+import time
+from typing import Dict, List, Optional
+
+from database import connect
+
+
+class CrawlFrontier:
+    """Persisted list of listing pages to crawl, with a checkpoint per page.
+
+    A page is only marked done after the fragrances found on it have been
+    committed, so a crash or a block never loses work: the next run picks up
+    every page that is still pending or failed fewer than max_attempts times.
+    """
+
+    def __init__(self, db_path: str, max_attempts: int = 5):
+        self.db_path = db_path
+        self.max_attempts = max_attempts
+
+    def _connect(self):
+        return connect(self.db_path, timeout=30)
+
+    def setup(self):
+        conn = self._connect()
+        try:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS crawl_frontier (
+                    url TEXT PRIMARY KEY,
+                    page INTEGER NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    fragrances INTEGER NOT NULL DEFAULT 0,
+                    last_error TEXT,
+                    updated_at REAL,
+                    category TEXT
+                )
+            ''')
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(crawl_frontier)")}
+            if 'category' not in columns:
+                conn.execute("ALTER TABLE crawl_frontier ADD COLUMN category TEXT")
+            conn.commit()
+        finally:
+            conn.close()
+
+    def seed(self, urls: List[str], category: Optional[str] = None):
+        """Add listing pages that are not in the frontier yet
+
+        A category, if given, is also recorded on pages already there.
+        """
+        conn = self._connect()
+        try:
+            conn.executemany(
+                '''
+                INSERT INTO crawl_frontier (url, page, updated_at, category) VALUES (?, ?, ?, ?)
+                ON CONFLICT(url) DO UPDATE SET category = COALESCE(excluded.category, category)
+                ''',
+                [(url, page, time.time(), category) for page, url in enumerate(urls, start=1)]
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+    def reset(self):
+        """Mark every page pending again, e.g. for a full re-crawl"""
+        conn = self._connect()
+        try:
+            conn.execute("UPDATE crawl_frontier SET status = 'pending', attempts = 0, last_error = NULL")
+            conn.commit()
+        finally:
+            conn.close()
+
+    def pending(self) -> List[str]:
+        """Return the pages still to crawl, in page order"""
+        conn = self._connect()
+        try:
+            rows = conn.execute('''
+                SELECT url FROM crawl_frontier
+                WHERE status != 'done' AND attempts < ?
+                ORDER BY page
+            ''', (self.max_attempts,)).fetchall()
+        finally:
+            conn.close()
+        return [row[0] for row in rows]
+
+    def categories(self) -> Dict[str, str]:
+        """Return the category of every page that was seeded with one"""
+        conn = self._connect()
+        try:
+            rows = conn.execute("SELECT url, category FROM crawl_frontier WHERE category IS NOT NULL").fetchall()
+        finally:
+            conn.close()
+        return dict(rows)
+
+    def mark_done(self, url: str, fragrances: int):
+        conn = self._connect()
+        try:
+            conn.execute('''
+                UPDATE crawl_frontier
+                SET status = 'done', attempts = attempts + 1, fragrances = ?, last_error = NULL, updated_at = ?
+                WHERE url = ?
+            ''', (fragrances, time.time(), url))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def mark_failed(self, url: str, error: str):
+        conn = self._connect()
+        try:
+            conn.execute('''
+                UPDATE crawl_frontier
+                SET status = 'failed', attempts = attempts + 1, last_error = ?, updated_at = ?
+                WHERE url = ?
+            ''', (error, time.time(), url))
+            conn.commit()
+        finally:
+            conn.close()
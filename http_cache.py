@@ -0,0 +1,189 @@
+import asyncio
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Optional, Dict
+
+from multidict import CIMultiDict
+
+from database import connect
+
+# off: no cache. record: always fetch and store. replay: never touch the
+# network, misses fail. refresh: serve entries younger than max_age, fetch
+# and store the rest.
+CACHE_MODES = ("off", "record", "replay", "refresh")
+
+
+class CacheMiss(Exception):
+    """A URL is not in the cache and replay mode forbids fetching it"""
+
+
+class CachedResponse:
+    """Just enough of an aiohttp response for the scraper's callers"""
+
+    def __init__(self, status: int, headers: Dict[str, str], body: bytes, fetched_at: float = None):
+        self.status = status
+        self.headers = CIMultiDict(headers)
+        self.body = body
+        self.fetched_at = fetched_at
+        self.content = self
+
+    async def iter_chunked(self, size: int):
+        for start in range(0, len(self.body), size):
+            yield self.body[start:start + size]
+
+    async def read(self) -> bytes:
+        return self.body
+
+    async def text(self, encoding: str = 'utf-8') -> str:
+        return self.body.decode(encoding, errors='replace')
+
+
+class ResponseCache:
+    """On-disk, content-addressed, gzip-compressed HTTP response cache.
+
+    Bodies are stored once per SHA-256 under objects/<aa>/<sha>.gz, so an
+    image served at several URLs takes the space of one. An index.db maps
+    each URL to its status, headers, body hash and fetch time.
+    """
+
+    def __init__(self, directory: str = "http_cache", mode: str = "off", max_age: float = 24 * 60 * 60):
+        if mode not in CACHE_MODES:
+            raise ValueError(f"Unknown cache mode: {mode}")
+        self.directory = Path(directory)
+        self.mode = mode
+        self.max_age = max_age
+        self.stats = {'hits': 0, 'stored': 0, 'bytes_stored': 0}
+        self._local = threading.local()
+        if mode != "off":
+            (self.directory / "objects").mkdir(parents=True, exist_ok=True)
+            self._conn().execute('''
+                CREATE TABLE IF NOT EXISTS responses (
+                    url TEXT PRIMARY KEY,
+                    status INTEGER NOT NULL,
+                    headers TEXT NOT NULL,
+                    sha256 TEXT NOT NULL,
+                    fetched_at REAL NOT NULL
+                )
+            ''')
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode != "off"
+
+    @property
+    def offline(self) -> bool:
+        return self.mode == "replay"
+
+    def __len__(self):
+        if not self.enabled:
+            return 0
+        return self._conn().execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = connect(str(self.directory / "index.db"), timeout=30, isolation_level=None)
+            self._local.conn = conn
+        return conn
+
+    def _object_path(self, sha256: str) -> Path:
+        return self.directory / "objects" / sha256[:2] / f"{sha256}.gz"
+
+    def get(self, url: str) -> Optional[CachedResponse]:
+        """Return the stored response for url, whatever its age"""
+        if not self.enabled:
+            return None
+        row = self._conn().execute(
+            "SELECT status, headers, sha256, fetched_at FROM responses WHERE url = ?", (url,)
+        ).fetchone()
+        if row is None:
+            return None
+        status, headers, sha256, fetched_at = row
+        try:
+            with gzip.open(self._object_path(sha256), 'rb') as f:
+                body = f.read()
+        except OSError:
+            return None
+        return CachedResponse(status, json.loads(headers), body, fetched_at)
+
+    def lookup(self, url: str) -> Optional[CachedResponse]:
+        """Return the response to serve for url under the current mode, if any
+
+        Raises CacheMiss in replay mode when url was never recorded.
+        """
+        if self.mode in ("off", "record"):
+            return None
+        cached = self.get(url)
+        if cached is not None and (self.offline or time.time() - cached.fetched_at < self.max_age):
+            self.stats['hits'] += 1
+            return cached
+        if self.offline:
+            raise CacheMiss(f"Not in the response cache: {url}")
+        return None
+
+    def store(self, url: str, status: int, headers: Dict[str, str], body: bytes):
+        """Record a response; the body is written only if no URL has it yet"""
+        if self.mode not in ("record", "refresh"):
+            return
+        sha256 = hashlib.sha256(body).hexdigest()
+        path = self._object_path(sha256)
+        if not path.exists():
+            path.parent.mkdir(exist_ok=True)
+            tmp = path.with_suffix(f".{threading.get_ident()}.tmp")
+            with gzip.open(tmp, 'wb', compresslevel=6) as f:
+                f.write(body)
+            os.replace(tmp, path)
+            self.stats['bytes_stored'] += path.stat().st_size
+        self._conn().execute(
+            "INSERT OR REPLACE INTO responses (url, status, headers, sha256, fetched_at) VALUES (?, ?, ?, ?, ?)",
+            (url, status, json.dumps(dict(headers)), sha256, time.time())
+        )
+        self.stats['stored'] += 1
+
+
+class RecordingSession:
+    """Wraps an aiohttp.ClientSession so successful GETs are recorded.
+
+    Responses are read whole (listing pages and bottle images are small)
+    so they can be stored, then handed back as CachedResponse objects.
+    Callers look the cache up themselves first, so a hit also skips their
+    rate limiting. Anything else, such as cookie_jar, is the wrapped
+    session's.
+    """
+
+    def __init__(self, session, cache: ResponseCache):
+        self.session = session
+        self.cache = cache
+
+    def __getattr__(self, name):
+        return getattr(self.session, name)
+
+    def get(self, url: str, **kwargs):
+        return _RecordedGet(self, url, kwargs)
+
+
+class _RecordedGet:
+    def __init__(self, owner: RecordingSession, url: str, kwargs):
+        self.owner = owner
+        self.url = url
+        self.kwargs = kwargs
+
+    async def __aenter__(self) -> CachedResponse:
+        cache = self.owner.cache
+        async with self.owner.session.get(self.url, **self.kwargs) as response:
+            body = await response.read()
+            headers = {
+                key: value for key, value in response.headers.items()
+                if key.lower() in ('content-type', 'etag', 'last-modified')
+            }
+            if response.status == 200:
+                await asyncio.to_thread(cache.store, self.url, response.status, headers, body)
+            return CachedResponse(response.status, headers, body, time.time())
+
+    async def __aexit__(self, *exc_info):
+        return False
@@ -0,0 +1,187 @@
+import asyncio
+import hashlib
+import logging
+import os
+import sqlite3
+import tempfile
+import time
+from contextlib import nullcontext
+from pathlib import Path
+from typing import Optional, Dict, Any
+
+import aiohttp
+
+from database import connect
+from http_cache import ResponseCache
+from pipeline import HostRateLimiter
+from scrape_log import StageTimer
+
+CONTENT_TYPE_EXTENSIONS = {
+    'image/jpeg': '.jpg',
+    'image/jpg': '.jpg',
+    'image/png': '.png',
+    'image/webp': '.webp',
+    'image/gif': '.gif',
+    'image/avif': '.avif',
+}
+
+CHUNK_SIZE = 64 * 1024
+
+
+class ImageDownloader:
+    """Streaming, deduplicating image downloads for the scraper.
+
+    Images are streamed in chunks to a temporary file and renamed into place
+    under the hash of their content, so a bottle shared by several
+    fragrances is stored once. ETag and Last-Modified are kept in the
+    images table and sent back on re-crawls, so unchanged images come back
+    as 304s with no body.
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        images_dir: Path,
+        session: aiohttp.ClientSession,
+        limiter: HostRateLimiter,
+        concurrency: int = 8,
+        flush_every: int = 50,
+        timer: Optional[StageTimer] = None,
+        cache: Optional[ResponseCache] = None
+    ):
+        self.db_path = db_path
+        self.images_dir = images_dir
+        self.session = session
+        self.limiter = limiter
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.flush_every = flush_every
+        self.timer = timer or StageTimer()
+        self.cache = cache if cache is not None else ResponseCache()
+        self.known: Dict[int, Dict[str, Any]] = {}
+        self.updates: Dict[int, Dict[str, Any]] = {}
+        self.stats = {'downloaded': 0, 'not_modified': 0, 'deduplicated': 0, 'failed': 0, 'bytes': 0}
+
+    def setup(self):
+        """Create the images table and load what earlier runs recorded"""
+        conn = connect(self.db_path, timeout=30)
+        try:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS images (
+                    fragrance_id INTEGER PRIMARY KEY,
+                    url TEXT NOT NULL,
+                    etag TEXT,
+                    last_modified TEXT,
+                    sha256 TEXT,
+                    path TEXT,
+                    content_type TEXT,
+                    fetched_at REAL
+                )
+            ''')
+            conn.commit()
+            conn.row_factory = sqlite3.Row
+            self.known = {row['fragrance_id']: dict(row) for row in conn.execute("SELECT * FROM images")}
+        finally:
+            conn.close()
+
+    async def fetch(self, url: str, fragrance_id: int) -> Optional[str]:
+        """Download an image (or revalidate a known one) and return its local path"""
+        async with self.semaphore:
+            try:
+                return await self._fetch(url, fragrance_id)
+            except Exception as e:
+                self.stats['failed'] += 1
+                logging.error(f"Error downloading image for {fragrance_id}: {str(e)}")
+                return None
+
+    async def _fetch(self, url: str, fragrance_id: int) -> Optional[str]:
+        known = self.known.get(fragrance_id)
+        headers = {}
+        if known and known['url'] == url and known['path'] and os.path.exists(known['path']):
+            if known['etag']:
+                headers['If-None-Match'] = known['etag']
+            if known['last_modified']:
+                headers['If-Modified-Since'] = known['last_modified']
+
+        # A cached image is served without waiting for the host's rate limit
+        cached = await asyncio.to_thread(self.cache.lookup, url)
+        if cached is None:
+            with self.timer.stage('rate_limit', url=url):
+                await self.limiter.acquire(url)
+        with self.timer.stage('image_download', fragrance_id=fragrance_id, cached=cached is not None) as event:
+            return await self._download(url, fragrance_id, known, headers, event, cached)
+
+    async def _download(self, url, fragrance_id, known, headers, event, cached) -> Optional[str]:
+        if cached is not None:
+            request = nullcontext(cached)
+        else:
+            request = self.session.get(url, headers=headers, timeout=aiohttp.ClientTimeout(total=30))
+        async with request as response:
+            event['status'] = response.status
+            if response.status == 304:
+                self.stats['not_modified'] += 1
+                logging.debug(f"Image unchanged for fragrance {fragrance_id}")
+                return known['path']
+            if response.status != 200:
+                self.stats['failed'] += 1
+                logging.warning(f"Failed to download image for {fragrance_id}: HTTP {response.status}")
+                return None
+
+            content_type = response.headers.get('Content-Type', '').split(';')[0].strip().lower()
+            extension = CONTENT_TYPE_EXTENSIONS.get(content_type) or Path(url).suffix.lower() or '.jpg'
+            digest = hashlib.sha256()
+            size = 0
+            fd, tmp_path = tempfile.mkstemp(dir=self.images_dir, suffix='.part')
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                        digest.update(chunk)
+                        size += len(chunk)
+                        await asyncio.to_thread(f.write, chunk)
+                sha256 = digest.hexdigest()
+                local_path = self.images_dir / f"{sha256[:32]}{extension}"
+                if local_path.exists():
+                    os.remove(tmp_path)
+                    self.stats['deduplicated'] += 1
+                else:
+                    os.replace(tmp_path, local_path)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+
+            self.stats['downloaded'] += 1
+            self.stats['bytes'] += size
+            event['bytes'] = size
+            logging.debug(f"Successfully downloaded image for fragrance {fragrance_id}")
+            record = {
+                'fragrance_id': fragrance_id,
+                'url': url,
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified'),
+                'sha256': sha256,
+                'path': str(local_path),
+                'content_type': content_type or None,
+                'fetched_at': time.time(),
+            }
+        self.known[fragrance_id] = record
+        self.updates[fragrance_id] = record
+        if len(self.updates) >= self.flush_every:
+            await asyncio.to_thread(self.flush)
+        return record['path']
+
+    def flush(self):
+        """Write recorded validators and hashes to the images table"""
+        updates, self.updates = self.updates, {}
+        if not updates:
+            return
+        conn = connect(self.db_path, timeout=30)
+        try:
+            with conn:
+                conn.executemany('''
+                    INSERT OR REPLACE INTO images
+                        (fragrance_id, url, etag, last_modified, sha256, path, content_type, fetched_at)
+                    VALUES
+                        (:fragrance_id, :url, :etag, :last_modified, :sha256, :path, :content_type, :fetched_at)
+                ''', updates.values())
+        finally:
+            conn.close()
@@ -0,0 +1,130 @@
+import threading
+import time
+
+# The top of the leaderboard straight off the wins_by_wins index
+TOP_SQL = "SELECT id, wins FROM wins ORDER BY wins DESC, id LIMIT ?"
+
+
+class Leaderboard:
+    """Top-K fragrances by wins, read from the wins table.
+
+    The top-K is reloaded at most every interval seconds when the Hall of
+    Fame is rendered, and after each WinRecorder flush, so every worker
+    converges on the table, imports included. The query is an index scan
+    of 2K rows. version changes only when the top-K does, which is what
+    the rendered Hall of Fame fragment is cached on.
+    """
+
+    def __init__(self, db, k=10, interval=5.0):
+        self.db = db
+        self.k = k
+        self.interval = interval
+        # Extra room so ids missing from the catalog can be skipped on render
+        self.capacity = k * 2
+        self.version = 0
+        self._top = []
+        self._loaded_at = None
+        self._lock = threading.Lock()
+        self._fragment = (None, None)
+
+    def load(self):
+        """Reload the top-K, bumping version if it changed"""
+        rows = self.db.query(TOP_SQL, (self.capacity,))
+        top = [(-row["wins"], row["id"]) for row in rows]
+        with self._lock:
+            self._loaded_at = time.monotonic()
+            if top != self._top:
+                self._top = top
+                self.version += 1
+
+    def refresh(self):
+        if self._loaded_at is None or time.monotonic() - self._loaded_at >= self.interval:
+            self.load()
+
+    def top(self, catalog):
+        """Return the top-K as dicts with id, name, image_url and wins"""
+        results = []
+        for neg_wins, fragrance_id in self._top:
+            fragrance = catalog.get(fragrance_id)
+            if fragrance is None:
+                continue
+            fragrance["wins"] = -neg_wins
+            results.append(fragrance)
+            if len(results) == self.k:
+                break
+        return results
+
+    def fragment(self, catalog, render):
+        """Return render(top) from cache, re-rendering only if the top-K changed"""
+        self.refresh()
+        catalog.refresh()
+        key = (self.version, catalog.version)
+        cached_key, html = self._fragment
+        if cached_key != key:
+            html = render(self.top(catalog))
+            self._fragment = (key, html)
+        return html
+
+
+def win_counts(db, fragrance_ids):
+    """Return {id: wins} for the given ids; ids without a win are left out"""
+    fragrance_ids = list(fragrance_ids)
+    if not fragrance_ids:
+        return {}
+    placeholders = ", ".join("?" * len(fragrance_ids))
+    rows = db.query(f"SELECT id, wins FROM wins WHERE id IN ({placeholders})", fragrance_ids)
+    return {row["id"]: row["wins"] for row in rows}
+
+
+# Both leaderboard page queries are range seeks on wins_by_wins: first the
+# rest of the tie group the last page ended in, then the lower counts
+TIE_GROUP_SQL = "SELECT id, wins FROM wins WHERE wins = ? AND id > ? ORDER BY id LIMIT ?"
+BELOW_SQL = "SELECT id, wins FROM wins WHERE wins < ? ORDER BY wins DESC, id LIMIT ?"
+FIRST_SQL = "SELECT id, wins FROM wins ORDER BY wins DESC, id LIMIT ?"
+
+
+def encode_cursor(wins, fragrance_id, position, rank):
+    return f"{wins}.{fragrance_id}.{position}.{rank}"
+
+
+def decode_cursor(cursor):
+    """Return (wins, id, position, rank) from a cursor, or None if it is malformed"""
+    try:
+        wins, fragrance_id, position, rank = (int(part) for part in cursor.split("."))
+    except (AttributeError, ValueError):
+        return None
+    return wins, fragrance_id, position, rank
+
+
+def leaderboard_page(db, catalog, cursor=None, limit=50):
+    """Return one page of the full leaderboard and the cursor of the next
+
+    Pages are keyset-paginated on (wins DESC, id), so every page costs the
+    same however deep it is. Ranks are competition ranks (ties share one)
+    and continue from the position and rank carried in the cursor, so
+    nothing is counted. The next cursor is None on the last page.
+    """
+    after = decode_cursor(cursor) if cursor else None
+    if after is None:
+        wins, fragrance_id, position, rank = None, None, 0, 0
+        rows = db.query(FIRST_SQL, (limit,))
+    else:
+        wins, fragrance_id, position, rank = after
+        rows = db.query(TIE_GROUP_SQL, (wins, fragrance_id, limit))
+        if len(rows) < limit:
+            rows += db.query(BELOW_SQL, (wins, limit - len(rows)))
+
+    entries = []
+    for row in rows:
+        position += 1
+        if row["wins"] != wins:
+            rank = position
+        wins, fragrance_id = row["wins"], row["id"]
+        fragrance = catalog.get(fragrance_id)
+        if fragrance is None:
+            continue
+        fragrance["wins"] = wins
+        fragrance["rank"] = rank
+        entries.append(fragrance)
+    next_cursor = encode_cursor(wins, fragrance_id, position, rank) if len(rows) == limit else None
+    return entries, next_cursor
@@ -1,24 +1,28 @@
+import argparse
 import asyncio
 import logging
 import os
 import random
 import sqlite3
+import time
+from http.cookies import SimpleCookie
 from pathlib import Path
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
+from urllib.parse import urlparse
 
 import aiohttp
-from bs4 import BeautifulSoup
-from playwright.async_api import async_playwright, Browser, Page, TimeoutError
-
-# Set up logging with more detailed format
-logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('scraper.log'),
-        logging.StreamHandler()
-    ]
-)
+from playwright.async_api import async_playwright, Browser, BrowserContext, Page, Route, TimeoutError
+from yarl import URL
+
+from bulk_load import BulkLoader
+from database import ensure_schema
+from frontier import CrawlFrontier
+from http_cache import CACHE_MODES, CacheMiss, RecordingSession, ResponseCache
+from images import ImageDownloader
+from parsing import CARD_SELECTORS, parse_listing
+from snapshots import ingest_snapshots
+from pipeline import STOP, HostRateLimiter, run_stage
+from scrape_log import StageTimer, setup_logging
 
 # List of common user agents that are known to work with Cloudflare
 USER_AGENTS = [
@@ -28,46 +32,91 @@ USER_AGENTS = [
     'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.2 Safari/605.1.15'
 ]
 
+# Paginated listing pages that seed the crawl frontier
+LISTING_URL = "https://www.fragrantica.com/search/?page={page}"
+
+# Requests per second and burst size for each remote host
+HOST_RATE_LIMITS = {
+    "www.fragrantica.com": (0.15, 1),
+    "fimgs.net": (2.0, 4),
+    # The local fixture server (fixture_server.py)
+    "127.0.0.1": (200.0, 50),
+}
+
+# Write scraped fragrances in batches of this many rows, or after
+# FLUSH_INTERVAL seconds when fewer arrive
+COMMIT_EVERY = 500
+FLUSH_INTERVAL = 5.0
+
+# Give up on the rest of a run after this many listing pages fail in a row
+MAX_CONSECUTIVE_FAILURES = 3
+
+# Requests the browser never needs to render a listing page's cards
+BLOCKED_RESOURCE_TYPES = {"image", "media", "font", "stylesheet"}
+BLOCKED_HOSTS = (
+    "doubleclick.net",
+    "googlesyndication.com",
+    "google-analytics.com",
+    "googletagmanager.com",
+    "googletagservices.com",
+    "adnxs.com",
+    "amazon-adsystem.com",
+    "criteo.com",
+    "facebook.net",
+)
+
+# Cookie Cloudflare sets once a challenge is passed
+CLEARANCE_COOKIE = "cf_clearance"
+
+# Stop trying listing pages over plain HTTP after this many need a browser
+MAX_HTTP_LISTING_MISSES = 3
+
+
 class FragranceScraper:
-    def __init__(self):
+    def __init__(
+        self,
+        fetch_workers: int = 1,
+        parse_workers: int = 2,
+        download_workers: int = 8,
+        limiter: Optional[HostRateLimiter] = None,
+        db_path: str = "fragrances.db",
+        cache: Optional[ResponseCache] = None
+    ):
         self.browser: Optional[Browser] = None
+        self.context: Optional[BrowserContext] = None
         self.page: Optional[Page] = None
         self.session: Optional[aiohttp.ClientSession] = None
-        self.db_path = "fragrances.db"
+        self.images: Optional[ImageDownloader] = None
+        self.db_path = db_path
+        self.cache = cache if cache is not None else ResponseCache()
         self.images_dir = Path("static/images/fragrances")
         self.images_dir.mkdir(parents=True, exist_ok=True)
         self.user_agent = random.choice(USER_AGENTS)
+        self.fetch_workers = fetch_workers
+        self.parse_workers = parse_workers
+        self.download_workers = download_workers
+        self.limiter = limiter or HostRateLimiter(limits=HOST_RATE_LIMITS)
+        self.frontier = CrawlFrontier(self.db_path)
+        # Fragrances from each listing page still on their way to the DB
+        self.outstanding: Dict[str, int] = {}
+        # Category of the listing pages seeded for a category crawl
+        self.page_categories: Dict[str, str] = {}
+        self.consecutive_failures = 0
+        self.timer = StageTimer()
+        self.pages_fetched = 0
+        # Warm browser contexts, one per fetch worker, reused for every page
+        self.contexts: List[BrowserContext] = []
+        self.cookie_fingerprint = None
+        self.clearance = False
+        self.http_listings = 0
+        self.http_listing_misses = 0
+        self.blocked_requests = 0
 
     async def setup_database(self):
-        """Initialize the database with minimal schema"""
+        """Create any missing tables; existing fragrances and wins are kept"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            # Drop existing tables
-            cursor.execute("DROP TABLE IF EXISTS wins")
-            cursor.execute("DROP TABLE IF EXISTS fragrances")
-            
-            # Create simple tables
-            cursor.execute('''
-                CREATE TABLE fragrances (
-                    id INTEGER PRIMARY KEY,
-                    name TEXT NOT NULL,
-                    image_url TEXT,
-                    local_image_path TEXT
-                )
-            ''')
-            
-            cursor.execute('''
-                CREATE TABLE wins (
-                    id INTEGER PRIMARY KEY,
-                    wins INTEGER DEFAULT 0,
-                    FOREIGN KEY (id) REFERENCES fragrances(id)
-                )
-            ''')
-            
-            conn.commit()
-            conn.close()
+            ensure_schema(self.db_path)
+            self.frontier.setup()
             logging.info("Database setup completed successfully")
         except Exception as e:
             logging.error(f"Database setup failed: {str(e)}")
@@ -78,28 +127,7 @@ class FragranceScraper:
         if not url:
             logging.warning(f"No image URL provided for fragrance {fragrance_id}")
             return None
-            
-        try:
-            local_path = self.images_dir / f"{fragrance_id}.jpg"
-            
-            # Skip if image already exists
-            if local_path.exists():
-                logging.info(f"Image already exists for fragrance {fragrance_id}")
-                return str(local_path)
-            
-            async with self.session.get(url, timeout=30) as response:
-                if response.status == 200:
-                    with open(local_path, 'wb') as f:
-                        f.write(await response.read())
-                    logging.info(f"Successfully downloaded image for fragrance {fragrance_id}")
-                    return str(local_path)
-                else:
-                    logging.warning(f"Failed to download image for {fragrance_id}: HTTP {response.status}")
-                    return None
-                    
-        except Exception as e:
-            logging.error(f"Error downloading image for {fragrance_id}: {str(e)}")
-            return None
+        return await self.images.fetch(url, fragrance_id)
 
     async def setup_browser(self):
         """Initialize browser with advanced stealth settings for Cloudflare"""
@@ -163,147 +191,9 @@ class FragranceScraper:
                 ]
             )
             
-            # Create a new context with specific settings
-            context = await self.browser.new_context(
-                viewport={'width': 1920, 'height': 1080},
-                user_agent=self.user_agent,
-                java_script_enabled=True,
-                bypass_csp=True,
-                ignore_https_errors=True,
-                locale='en-US',
-                timezone_id='America/New_York',
-                geolocation={'latitude': 40.7128, 'longitude': -74.0060},
-                permissions=['geolocation'],
-                color_scheme='light',
-                reduced_motion='no-preference',
-                forced_colors='none',
-                accept_downloads=True,
-                has_touch=True,
-                is_mobile=False,
-                device_scale_factor=1
-            )
-            
-            # Add advanced stealth scripts
-            await context.add_init_script("""
-                // Overwrite the 'webdriver' property
-                Object.defineProperty(navigator, 'webdriver', {
-                    get: () => undefined
-                });
-                
-                // Add plugins
-                Object.defineProperty(navigator, 'plugins', {
-                    get: () => [
-                        {
-                            0: {type: "application/x-google-chrome-pdf"},
-                            description: "Portable Document Format",
-                            filename: "internal-pdf-viewer",
-                            length: 1,
-                            name: "Chrome PDF Plugin"
-                        },
-                        {
-                            0: {type: "application/pdf"},
-                            description: "Portable Document Format",
-                            filename: "mhjfbmdgcfjbbpaeojofohoefgiehjai",
-                            length: 1,
-                            name: "Chrome PDF Viewer"
-                        },
-                        {
-                            0: {type: "application/x-nacl"},
-                            description: "Native Client Executable",
-                            filename: "internal-nacl-plugin",
-                            length: 1,
-                            name: "Native Client"
-                        }
-                    ]
-                });
-                
-                // Add languages
-                Object.defineProperty(navigator, 'languages', {
-                    get: () => ['en-US', 'en']
-                });
-                
-                // Add chrome object
-                window.chrome = {
-                    runtime: {},
-                    loadTimes: function() {},
-                    csi: function() {},
-                    app: {
-                        isInstalled: false,
-                        InstallState: {
-                            DISABLED: 'disabled',
-                            INSTALLED: 'installed',
-                            NOT_INSTALLED: 'not_installed'
-                        },
-                        RunningState: {
-                            CANNOT_RUN: 'cannot_run',
-                            READY_TO_RUN: 'ready_to_run',
-                            RUNNING: 'running'
-                        }
-                    },
-                    webstore: {
-                        onInstallStageChanged: {},
-                        onDownloadProgress: {}
-                    }
-                };
-                
-                // Add permissions
-                const originalQuery = window.navigator.permissions.query;
-                window.navigator.permissions.query = (parameters) => (
-                    parameters.name === 'notifications' ?
-                        Promise.resolve({state: Notification.permission}) :
-                        originalQuery(parameters)
-                );
-                
-                // Add WebGL
-                const getParameter = WebGLRenderingContext.prototype.getParameter;
-                WebGLRenderingContext.prototype.getParameter = function(parameter) {
-                    if (parameter === 37445) {
-                        return 'Intel Inc.';
-                    }
-                    if (parameter === 37446) {
-                        return 'Intel Iris OpenGL Engine';
-                    }
-                    return getParameter.apply(this, [parameter]);
-                };
-                
-                // Add canvas fingerprint
-                const originalGetContext = HTMLCanvasElement.prototype.getContext;
-                HTMLCanvasElement.prototype.getContext = function(type) {
-                    const context = originalGetContext.apply(this, arguments);
-                    if (type === '2d') {
-                        const originalGetImageData = context.getImageData;
-                        context.getImageData = function() {
-                            const imageData = originalGetImageData.apply(this, arguments);
-                            // Add some noise to the image data
-                            for (let i = 0; i < imageData.data.length; i += 4) {
-                                imageData.data[i] = imageData.data[i] + Math.random() * 2 - 1;
-                            }
-                            return imageData;
-                        };
-                    }
-                    return context;
-                };
-            """)
-            
-            self.page = await context.new_page()
+            self.context = await self.new_context()
             
-            # Set extra headers to look more like a real browser
-            await self.page.set_extra_http_headers({
-                'Accept-Language': 'en-US,en;q=0.9',
-                'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7',
-                'Accept-Encoding': 'gzip, deflate, br',
-                'Connection': 'keep-alive',
-                'Upgrade-Insecure-Requests': '1',
-                'Sec-Fetch-Dest': 'document',
-                'Sec-Fetch-Mode': 'navigate',
-                'Sec-Fetch-Site': 'none',
-                'Sec-Fetch-User': '?1',
-                'Cache-Control': 'max-age=0',
-                'Sec-Ch-Ua': '"Not A(Brand";v="99", "Google Chrome";v="121", "Chromium";v="121"',
-                'Sec-Ch-Ua-Mobile': '?0',
-                'Sec-Ch-Ua-Platform': '"Windows"',
-                'DNT': '1'
-            })
+            self.page = await self.context.new_page()
             
             # Add random mouse movements
             for _ in range(3):
@@ -314,17 +204,7 @@ class FragranceScraper:
                 )
                 await asyncio.sleep(random.uniform(0.5, 1.5))
             
-            self.session = aiohttp.ClientSession(headers={
-                'User-Agent': self.user_agent,
-                'Accept-Language': 'en-US,en;q=0.9',
-                'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-                'Accept-Encoding': 'gzip, deflate, br',
-                'Connection': 'keep-alive',
-                'Sec-Ch-Ua': '"Not A(Brand";v="99", "Google Chrome";v="121", "Chromium";v="121"',
-                'Sec-Ch-Ua-Mobile': '?0',
-                'Sec-Ch-Ua-Platform': '"Windows"',
-                'DNT': '1'
-            })
+            self.session = self.new_session()
             
             logging.info("Browser setup completed successfully")
             
@@ -332,27 +212,257 @@ class FragranceScraper:
             logging.error(f"Browser setup failed: {str(e)}")
             raise
 
-    async def handle_cloudflare(self):
+    def new_session(self):
+        """Open the aiohttp session, recording responses if the cache is on"""
+        session = aiohttp.ClientSession(headers={
+            'User-Agent': self.user_agent,
+            'Accept-Language': 'en-US,en;q=0.9',
+            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+            'Accept-Encoding': 'gzip, deflate, br',
+            'Connection': 'keep-alive',
+            'Sec-Ch-Ua': '"Not A(Brand";v="99", "Google Chrome";v="121", "Chromium";v="121"',
+            'Sec-Ch-Ua-Mobile': '?0',
+            'Sec-Ch-Ua-Platform': '"Windows"',
+            'DNT': '1'
+        })
+        if self.cache.mode in ("record", "refresh"):
+            return RecordingSession(session, self.cache)
+        return session
+
+    async def new_context(self) -> BrowserContext:
+        """Open a browser context with the stealth settings and resource blocking"""
+        # Create a new context with specific settings
+        context = await self.browser.new_context(
+            viewport={'width': 1920, 'height': 1080},
+            user_agent=self.user_agent,
+            java_script_enabled=True,
+            bypass_csp=True,
+            ignore_https_errors=True,
+            locale='en-US',
+            timezone_id='America/New_York',
+            geolocation={'latitude': 40.7128, 'longitude': -74.0060},
+            permissions=['geolocation'],
+            color_scheme='light',
+            reduced_motion='no-preference',
+            forced_colors='none',
+            accept_downloads=True,
+            has_touch=True,
+            is_mobile=False,
+            device_scale_factor=1
+        )
+        
+        # Add advanced stealth scripts
+        await context.add_init_script("""
+            // Overwrite the 'webdriver' property
+            Object.defineProperty(navigator, 'webdriver', {
+                get: () => undefined
+            });
+            
+            // Add plugins
+            Object.defineProperty(navigator, 'plugins', {
+                get: () => [
+                    {
+                        0: {type: "application/x-google-chrome-pdf"},
+                        description: "Portable Document Format",
+                        filename: "internal-pdf-viewer",
+                        length: 1,
+                        name: "Chrome PDF Plugin"
+                    },
+                    {
+                        0: {type: "application/pdf"},
+                        description: "Portable Document Format",
+                        filename: "mhjfbmdgcfjbbpaeojofohoefgiehjai",
+                        length: 1,
+                        name: "Chrome PDF Viewer"
+                    },
+                    {
+                        0: {type: "application/x-nacl"},
+                        description: "Native Client Executable",
+                        filename: "internal-nacl-plugin",
+                        length: 1,
+                        name: "Native Client"
+                    }
+                ]
+            });
+            
+            // Add languages
+            Object.defineProperty(navigator, 'languages', {
+                get: () => ['en-US', 'en']
+            });
+            
+            // Add chrome object
+            window.chrome = {
+                runtime: {},
+                loadTimes: function() {},
+                csi: function() {},
+                app: {
+                    isInstalled: false,
+                    InstallState: {
+                        DISABLED: 'disabled',
+                        INSTALLED: 'installed',
+                        NOT_INSTALLED: 'not_installed'
+                    },
+                    RunningState: {
+                        CANNOT_RUN: 'cannot_run',
+                        READY_TO_RUN: 'ready_to_run',
+                        RUNNING: 'running'
+                    }
+                },
+                webstore: {
+                    onInstallStageChanged: {},
+                    onDownloadProgress: {}
+                }
+            };
+            
+            // Add permissions
+            const originalQuery = window.navigator.permissions.query;
+            window.navigator.permissions.query = (parameters) => (
+                parameters.name === 'notifications' ?
+                    Promise.resolve({state: Notification.permission}) :
+                    originalQuery(parameters)
+            );
+            
+            // Add WebGL
+            const getParameter = WebGLRenderingContext.prototype.getParameter;
+            WebGLRenderingContext.prototype.getParameter = function(parameter) {
+                if (parameter === 37445) {
+                    return 'Intel Inc.';
+                }
+                if (parameter === 37446) {
+                    return 'Intel Iris OpenGL Engine';
+                }
+                return getParameter.apply(this, [parameter]);
+            };
+            
+            // Add canvas fingerprint
+            const originalGetContext = HTMLCanvasElement.prototype.getContext;
+            HTMLCanvasElement.prototype.getContext = function(type) {
+                const context = originalGetContext.apply(this, arguments);
+                if (type === '2d') {
+                    const originalGetImageData = context.getImageData;
+                    context.getImageData = function() {
+                        const imageData = originalGetImageData.apply(this, arguments);
+                        // Add some noise to the image data
+                        for (let i = 0; i < imageData.data.length; i += 4) {
+                            imageData.data[i] = imageData.data[i] + Math.random() * 2 - 1;
+                        }
+                        return imageData;
+                    };
+                }
+                return context;
+            };
+        """)
+        
+        # Set extra headers to look more like a real browser
+        await context.set_extra_http_headers({
+            'Accept-Language': 'en-US,en;q=0.9',
+            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7',
+            'Accept-Encoding': 'gzip, deflate, br',
+            'Connection': 'keep-alive',
+            'Upgrade-Insecure-Requests': '1',
+            'Sec-Fetch-Dest': 'document',
+            'Sec-Fetch-Mode': 'navigate',
+            'Sec-Fetch-Site': 'none',
+            'Sec-Fetch-User': '?1',
+            'Cache-Control': 'max-age=0',
+            'Sec-Ch-Ua': '"Not A(Brand";v="99", "Google Chrome";v="121", "Chromium";v="121"',
+            'Sec-Ch-Ua-Mobile': '?0',
+            'Sec-Ch-Ua-Platform': '"Windows"',
+            'DNT': '1'
+        })
+        
+        # Skip everything we never parse; scripts stay for the Cloudflare check
+        await context.route("**/*", self.block_resources)
+        self.contexts.append(context)
+        return context
+
+    async def block_resources(self, route: Route):
+        """Abort requests for resource types and hosts listing pages don't need"""
+        request = route.request
+        host = urlparse(request.url).hostname or ''
+        if request.resource_type in BLOCKED_RESOURCE_TYPES or host.endswith(BLOCKED_HOSTS):
+            self.blocked_requests += 1
+            await route.abort()
+        else:
+            await route.continue_()
+
+    async def share_cookies(self, source: BrowserContext):
+        """Copy a context's cookies (Cloudflare clearance included) everywhere else
+
+        The other pooled contexts get them so they skip the challenge, and the
+        aiohttp session gets them so images and listing pages can be fetched
+        without a browser. Only runs when the cookies changed.
+        """
+        cookies = await source.cookies()
+        fingerprint = sorted((c['domain'], c['name'], c['value']) for c in cookies)
+        if fingerprint == self.cookie_fingerprint:
+            return
+        self.cookie_fingerprint = fingerprint
+        for context in self.contexts:
+            if context is not source:
+                await context.add_cookies(cookies)
+        for cookie in cookies:
+            morsel = SimpleCookie()
+            morsel[cookie['name']] = cookie['value']
+            morsel[cookie['name']]['domain'] = cookie['domain']
+            morsel[cookie['name']]['path'] = cookie['path']
+            host = cookie['domain'].lstrip('.')
+            self.session.cookie_jar.update_cookies(morsel, response_url=URL(f"https://{host}/"))
+        self.clearance = any(c['name'] == CLEARANCE_COOKIE for c in cookies)
+        logging.info(f"Shared {len(cookies)} browser cookies (clearance: {self.clearance})")
+
+    async def fetch_listing_http(self, url: str) -> Optional[str]:
+        """Try a listing page over plain HTTP with the browser's cookies
+
+        Returns None when the page needs a browser: no clearance yet, a
+        challenge or error came back, or the cards are rendered by script.
+        After MAX_HTTP_LISTING_MISSES such pages in a row, HTTP is not tried
+        again this run.
+        """
+        if not self.clearance or self.http_listing_misses >= MAX_HTTP_LISTING_MISSES:
+            return None
+        try:
+            with self.timer.stage('http_listing', url=url) as event:
+                await self.limiter.acquire(url)
+                async with self.session.get(url, timeout=aiohttp.ClientTimeout(total=30)) as response:
+                    event['status'] = response.status
+                    content = await response.text() if response.status == 200 else None
+        except Exception as e:
+            logging.debug(f"HTTP fetch of {url} failed: {str(e)}")
+            content = None
+        if content and '/perfume/' in content and 'challenge-running' not in content:
+            self.http_listing_misses = 0
+            self.http_listings += 1
+            return content
+        self.http_listing_misses += 1
+        if self.http_listing_misses == MAX_HTTP_LISTING_MISSES:
+            logging.info("Listing pages need a browser render, not trying plain HTTP again this run")
+        return None
+
+    async def handle_cloudflare(self, page: Page):
         """Handle Cloudflare challenge if present"""
         try:
             # Wait for Cloudflare challenge
-            challenge_present = await self.page.wait_for_selector(
-                '#challenge-running, #challenge-stage, #cf-please-wait, #cf-challenge-running',
-                timeout=5000
-            )
+            with self.timer.stage('cloudflare_check'):
+                challenge_present = await page.wait_for_selector(
+                    '#challenge-running, #challenge-stage, #cf-please-wait, #cf-challenge-running',
+                    timeout=5000
+                )
             
             if challenge_present:
                 logging.info("Cloudflare challenge detected, waiting for it to complete...")
                 
                 # Wait for the challenge to complete
-                await self.page.wait_for_selector(
-                    '#challenge-running, #challenge-stage, #cf-please-wait, #cf-challenge-running',
-                    state='hidden',
-                    timeout=30000
-                )
+                with self.timer.stage('cloudflare_wait'):
+                    await page.wait_for_selector(
+                        '#challenge-running, #challenge-stage, #cf-please-wait, #cf-challenge-running',
+                        state='hidden',
+                        timeout=30000
+                    )
                 
                 # Additional wait to ensure page is fully loaded
-                await asyncio.sleep(5)
+                with self.timer.stage('sleep', reason='cloudflare'):
+                    await asyncio.sleep(5)
                 
                 logging.info("Cloudflare challenge completed")
                 return True
@@ -364,228 +474,344 @@ class FragranceScraper:
             logging.error(f"Error handling Cloudflare challenge: {str(e)}")
             return False
 
-    async def extract_fragrance_data(self, card: BeautifulSoup) -> Optional[Dict[str, Any]]:
-        """Extract just name and image data"""
-        try:
-            link_tag = card.select_one("a[href*='/perfume/']")
-            if not link_tag:
-                logging.debug("No link tag found in card")
-                return None
-            
-            href = link_tag['href']
-            name = link_tag.get_text(strip=True)
-            
-            if not name:
-                logging.debug("No name found in link tag")
-                return None
-            
-            # Extract ID from URL
+    async def load_listing(self, page: Page, url: str) -> Optional[str]:
+        """Load a listing page with retries and return its HTML"""
+        for attempt in range(3):
             try:
-                frag_id = int(href.split('-')[-1].replace('.html', ''))
-            except (ValueError, IndexError) as e:
-                logging.warning(f"Could not extract ID from URL {href}: {str(e)}")
-                return None
-            
-            # Get image URL
-            img_tag = card.select_one("img")
-            image_url = img_tag['src'] if img_tag else None
-            
-            if not image_url:
-                logging.warning(f"No image URL found for fragrance {name}")
-            
-            return {
-                'id': frag_id,
-                'name': name,
-                'image_url': image_url
-            }
-            
-        except Exception as e:
-            logging.error(f"Error extracting data from card: {str(e)}")
-            return None
-
-    async def scrape_fragrances(self):
-        """Main scraping function with Cloudflare handling"""
-        try:
-            await self.setup_browser()
-            await self.setup_database()
-            
-            logging.info("Starting fragrance data collection...")
-            
-            # Try to load the page with multiple attempts
-            for attempt in range(3):
-                try:
-                    logging.info(f"Attempt {attempt + 1} to load page...")
-                    
-                    # Add longer random delay before request
-                    await asyncio.sleep(random.uniform(5, 10))
-                    
-                    # Try loading the search page directly
-                    response = await self.page.goto(
-                        "https://www.fragrantica.com/search/",
+                logging.info(f"Attempt {attempt + 1} to load {url}...")
+                
+                with self.timer.stage('rate_limit', url=url):
+                    await self.limiter.acquire(url)
+                with self.timer.stage('page_load', url=url, attempt=attempt + 1):
+                    response = await page.goto(
+                        url,
                         wait_until="domcontentloaded",
                         timeout=60000
                     )
+                
+                if not response:
+                    logging.error("Failed to get response from search page")
+                    continue
                     
-                    if not response:
-                        logging.error("Failed to get response from search page")
-                        continue
-                        
-                    logging.info(f"Search page status: {response.status}")
-                    
-                    # Handle Cloudflare challenge if present
-                    await self.handle_cloudflare()
-                    
-                    # More human-like scrolling
+                logging.info(f"Search page status: {response.status}")
+                
+                # Handle Cloudflare challenge if present
+                await self.handle_cloudflare(page)
+                
+                # More human-like scrolling
+                with self.timer.stage('sleep', reason='scroll'):
                     for _ in range(3):
                         scroll_amount = random.randint(100, 300)
-                        await self.page.evaluate(f"""
+                        await page.evaluate(f"""
                             window.scrollTo({{
                                 top: {scroll_amount},
                                 behavior: 'smooth'
                             }});
                         """)
                         await asyncio.sleep(random.uniform(1, 3))
-                    
-                    # Take a screenshot for debugging
-                    await self.page.screenshot(path="debug_screenshot.png")
-                    logging.info("Saved debug screenshot")
-                    
-                    # Get the page content and log what we see
-                    content = await self.page.content()
-                    logging.debug(f"Page content length: {len(content)}")
-                    
-                    # Check if we're being blocked
-                    if "captcha" in content.lower() or "robot" in content.lower():
-                        logging.error("Detected anti-bot protection")
-                        # Wait longer if captcha detected
-                        if "captcha" in content.lower():
-                            logging.info("Waiting 2 minutes before retrying...")
+                
+                # Take a screenshot for debugging
+                with self.timer.stage('screenshot'):
+                    await page.screenshot(path="debug_screenshot.png")
+                logging.debug("Saved debug screenshot")
+                
+                # Get the page content and log what we see
+                content = await page.content()
+                logging.debug(f"Page content length: {len(content)}")
+                
+                # Check if we're being blocked
+                if "captcha" in content.lower() or "robot" in content.lower():
+                    logging.error("Detected anti-bot protection")
+                    # Wait longer if captcha detected
+                    if "captcha" in content.lower():
+                        logging.info("Waiting 2 minutes before retrying...")
+                        with self.timer.stage('sleep', reason='captcha'):
                             await asyncio.sleep(120)
-                        raise Exception("Website is blocking automated access")
-                    
-                    # Try different selectors with longer timeouts
-                    selectors = [
-                        "div.card-product",
-                        ".card-product",
-                        "div[class*='card']",
-                        "div[class*='product']"
-                    ]
-                    
-                    for selector in selectors:
-                        try:
-                            logging.info(f"Trying selector: {selector}")
-                            await self.page.wait_for_selector(selector, timeout=10000)  # Increased timeout
-                            logging.info(f"Found selector: {selector}")
-                            break
-                        except Exception as e:
-                            logging.debug(f"Selector {selector} not found: {str(e)}")
-                            continue
-                    else:
-                        logging.error("Could not find any fragrance cards on the page")
-                        logging.debug(f"Page content preview: {content[:1000]}")
-                        raise Exception("No fragrance cards found")
-                    
-                    logging.info("Successfully loaded the search page")
-                    break
-                    
-                except TimeoutError as e:
-                    logging.warning(f"Timeout on attempt {attempt + 1}: {str(e)}")
-                    if attempt == 2:
-                        raise
+                    raise Exception("Website is blocking automated access")
+                
+                # Try different selectors with longer timeouts
+                for selector in CARD_SELECTORS:
+                    try:
+                        logging.debug(f"Trying selector: {selector}")
+                        with self.timer.stage('card_wait', selector=selector):
+                            await page.wait_for_selector(selector, timeout=10000)  # Increased timeout
+                        logging.debug(f"Found selector: {selector}")
+                        break
+                    except Exception as e:
+                        logging.debug(f"Selector {selector} not found: {str(e)}")
+                        continue
+                else:
+                    logging.error("Could not find any fragrance cards on the page")
+                    logging.debug(f"Page content preview: {content[:1000]}")
+                    raise Exception("No fragrance cards found")
+                
+                logging.info("Successfully loaded the search page")
+                return await page.content()
+                
+            except TimeoutError as e:
+                logging.warning(f"Timeout on attempt {attempt + 1}: {str(e)}")
+                if attempt == 2:
+                    raise
+                with self.timer.stage('sleep', reason='retry'):
                     await asyncio.sleep(random.uniform(10, 20))
-                except Exception as e:
-                    logging.warning(f"Error on attempt {attempt + 1}: {str(e)}")
-                    if attempt == 2:
-                        raise
+            except Exception as e:
+                logging.warning(f"Error on attempt {attempt + 1}: {str(e)}")
+                if attempt == 2:
+                    raise
+                with self.timer.stage('sleep', reason='retry'):
                     await asyncio.sleep(random.uniform(10, 20))
-            
-            # Get the page content
-            content = await self.page.content()
-            soup = BeautifulSoup(content, 'html.parser')
-            
-            # Try different selectors for the cards
-            cards = []
-            for selector in selectors:
-                cards = soup.select(selector)
-                if cards:
-                    logging.info(f"Found {len(cards)} cards using selector: {selector}")
-                    break
-            
-            if not cards:
-                logging.error("No fragrance cards found on the page")
+        return None
+
+    async def fetch_stage(self, url: str, listings: asyncio.Queue):
+        """Stage 1: load a listing page from the cache, over HTTP, or in a pooled browser context"""
+        if self.consecutive_failures >= MAX_CONSECUTIVE_FAILURES:
+            # Probably blocked; leave the page pending for the next run
+            return
+        error = "Empty response"
+        try:
+            cached = await asyncio.to_thread(self.cache.lookup, url)
+        except CacheMiss as e:
+            cached = None
+            error = str(e)
+        if cached is not None:
+            content = await cached.text()
+        elif self.cache.offline:
+            content = None
+        else:
+            content = await self.fetch_listing_http(url)
+        if content is None and not self.cache.offline:
+            page = await self.pages.get()
+            try:
+                content = await self.load_listing(page, url)
+                if content:
+                    await self.share_cookies(page.context)
+                    await asyncio.to_thread(
+                        self.cache.store, url, 200, {'Content-Type': 'text/html; charset=utf-8'}, content.encode()
+                    )
+            except Exception as e:
+                logging.error(f"Giving up on {url}: {str(e)}")
+                content = None
+                error = str(e)
+            finally:
+                self.pages.put_nowait(page)
+        if not content:
+            self.consecutive_failures += 1
+            await asyncio.to_thread(self.frontier.mark_failed, url, error)
+            if self.consecutive_failures == MAX_CONSECUTIVE_FAILURES:
+                logging.error("Too many failed listing pages in a row, stopping this run")
+            return
+        self.consecutive_failures = 0
+        self.pages_fetched += 1
+        await listings.put((url, content))
+
+    async def parse_stage(self, listing, fragrances: asyncio.Queue):
+        """Stage 2: parse cards off the event loop"""
+        url, content = listing
+        with self.timer.stage('parse', url=url) as event:
+            found = await asyncio.to_thread(parse_listing, content)
+            event['cards'] = len(found)
+        if not found:
+            # Likely a challenge or block page; leave it for a later run
+            logging.error(f"No fragrance cards found on {url}")
+            await asyncio.to_thread(self.frontier.mark_failed, url, "no cards")
+            return
+        self.outstanding[url] = len(found)
+        category = self.page_categories.get(url)
+        for fragrance_data in found:
+            fragrance_data['source_url'] = url
+            fragrance_data['category'] = category
+            await fragrances.put(fragrance_data)
+
+    async def download_stage(self, fragrance_data: Dict[str, Any], downloaded: asyncio.Queue):
+        """Stage 3: download the bottle image"""
+        fragrance_data['local_image_path'] = await self.download_image(
+            fragrance_data['image_url'],
+            fragrance_data['id']
+        )
+        await downloaded.put(fragrance_data)
+
+    async def persist_stage(self, downloaded: asyncio.Queue) -> int:
+        """Stage 4: merge fragrances into the DB in batches
+
+        Rows are buffered and written by a BulkLoader once COMMIT_EVERY have
+        arrived or FLUSH_INTERVAL seconds have passed, so the write lock the
+        web app competes for is taken once per batch. Listing pages whose
+        fragrances are all committed are then checkpointed as done in the
+        crawl frontier.
+        """
+        loader = BulkLoader(self.db_path)
+        finished_pages: Dict[str, int] = {}
+        page_counts: Dict[str, int] = {}
+        flushed_at = time.monotonic()
+
+        async def flush():
+            if not loader.pending and not finished_pages:
                 return
+            with self.timer.stage('db_write', rows=len(loader), pages=len(finished_pages)) as event:
+                try:
+                    event.update(await asyncio.to_thread(loader.flush))
+                except sqlite3.Error as e:
+                    # The loader keeps the rows; pages wait for the next flush
+                    logging.error(f"Database error writing {len(loader)} fragrances: {str(e)}")
+                    return
+                for url, count in finished_pages.items():
+                    await asyncio.to_thread(self.frontier.mark_done, url, count)
+            finished_pages.clear()
+            logging.info(f"Committed fragrances to database: {loader.counts}")
+
+        while True:
+            try:
+                fragrance_data = await asyncio.wait_for(downloaded.get(), FLUSH_INTERVAL)
+            except asyncio.TimeoutError:
+                fragrance_data = None
+            if fragrance_data is STOP:
+                break
+            if fragrance_data is not None:
+                url = fragrance_data['source_url']
+                loader.add(fragrance_data)
+                page_counts[url] = page_counts.get(url, 0) + 1
+                self.outstanding[url] -= 1
+                if self.outstanding[url] == 0:
+                    del self.outstanding[url]
+                    finished_pages[url] = page_counts.pop(url, 0)
+
+            if len(loader) >= COMMIT_EVERY or (
+                (loader.pending or finished_pages) and time.monotonic() - flushed_at >= FLUSH_INTERVAL
+            ):
+                await flush()
+                flushed_at = time.monotonic()
+        await flush()
+        return sum(loader.counts.values())
+
+    async def scrape_fragrances(
+        self,
+        max_pages: int = 50,
+        restart: bool = False,
+        listing_url: str = LISTING_URL,
+        category: Optional[str] = None
+    ):
+        """Main scraping function: fetch -> parse -> download -> persist stages
+
+        Resumes from the crawl frontier: only listing pages that are not
+        checkpointed as done are fetched. Pages seeded with a category (e.g.
+        a listing of niche houses) tag every fragrance found on them. Ends
+        with a summary of throughput and per-stage timings.
+        """
+        stored = 0
+        try:
+            if self.cache.offline:
+                # Replaying recorded responses needs no browser
+                self.session = self.new_session()
+            else:
+                await self.setup_browser()
+            await self.setup_database()
+            self.images = ImageDownloader(
+                self.db_path,
+                self.images_dir,
+                self.session,
+                self.limiter,
+                concurrency=self.download_workers,
+                timer=self.timer,
+                cache=self.cache
+            )
+            self.images.setup()
             
-            # Limit the number of fragrances we process
-            MAX_FRAGRANCES = 20  # Reduced from previous unlimited amount
-            cards = cards[:MAX_FRAGRANCES]
-            logging.info(f"Processing {len(cards)} fragrances (limited to {MAX_FRAGRANCES})")
-            
-            # Process fragrances with delays between each
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
+            logging.info("Starting fragrance data collection...")
             
-            processed_count = 0
-            for card in cards:
-                # Add delay between processing each fragrance
-                await asyncio.sleep(random.uniform(2, 4))
-                
-                fragrance_data = await self.extract_fragrance_data(card)
-                if fragrance_data:
-                    # Add delay before downloading image
-                    await asyncio.sleep(random.uniform(1, 3))
-                    
-                    # Download image
-                    local_image_path = await self.download_image(
-                        fragrance_data['image_url'], 
-                        fragrance_data['id']
-                    )
-                    
-                    # Add delay before database operation
-                    await asyncio.sleep(random.uniform(1, 2))
-                    
-                    # Store in database
-                    try:
-                        cursor.execute('''
-                            INSERT INTO fragrances (id, name, image_url, local_image_path)
-                            VALUES (?, ?, ?, ?)
-                        ''', (
-                            fragrance_data['id'],
-                            fragrance_data['name'],
-                            fragrance_data['image_url'],
-                            local_image_path
-                        ))
-                        processed_count += 1
-                        
-                        # Commit more frequently
-                        if processed_count % 5 == 0:  # Changed from 10 to 5
-                            conn.commit()
-                            logging.info(f"Committed {processed_count} fragrances to database")
-                            
-                    except sqlite3.Error as e:
-                        logging.error(f"Database error for fragrance {fragrance_data['name']}: {str(e)}")
-                        continue
+            # One warm context and tab per fetch worker
+            self.pages = asyncio.Queue()
+            if self.page:
+                self.pages.put_nowait(self.page)
+                for _ in range(self.fetch_workers - 1):
+                    context = await self.new_context()
+                    self.pages.put_nowait(await context.new_page())
+            
+            urls = asyncio.Queue()
+            listings = asyncio.Queue(maxsize=self.parse_workers * 2)
+            fragrances = asyncio.Queue(maxsize=self.download_workers * 4)
+            downloaded = asyncio.Queue(maxsize=self.download_workers * 4)
+            
+            self.frontier.seed(
+                [listing_url.format(page=page) for page in range(1, max_pages + 1)],
+                category=category
+            )
+            if restart:
+                self.frontier.reset()
+            pending = self.frontier.pending()
+            self.page_categories = self.frontier.categories()
+            logging.info(f"{len(pending)} listing pages left to crawl")
+            for url in pending:
+                urls.put_nowait(url)
+            urls.put_nowait(STOP)
+            
+            results = await asyncio.gather(
+                run_stage(self.fetch_stage, urls, listings, self.fetch_workers),
+                run_stage(self.parse_stage, listings, fragrances, self.parse_workers),
+                run_stage(self.download_stage, fragrances, downloaded, self.download_workers),
+                self.persist_stage(downloaded)
+            )
             
-            conn.commit()
-            logging.info(f"Successfully stored {processed_count} fragrances in the database")
+            stored = results[-1]
+            logging.info(f"Successfully stored {stored} fragrances in the database")
+            logging.info(f"Image downloads: {self.images.stats}")
             
         except Exception as e:
             logging.error(f"An error occurred during scraping: {str(e)}")
             raise
         finally:
+            if self.images:
+                self.images.flush()
             if self.browser:
                 await self.browser.close()
             if self.session:
                 await self.session.close()
-            if 'conn' in locals():
-                conn.close()
+            self.timer.summary(
+                pages=self.pages_fetched,
+                http_listings=self.http_listings,
+                fragrances=stored,
+                images_downloaded=self.images.stats['downloaded'] if self.images else 0,
+                blocked_requests=self.blocked_requests,
+                cache_hits=self.cache.stats['hits'],
+                cache_stored=self.cache.stats['stored']
+            )
 
 async def main():
+    parser = argparse.ArgumentParser(description="Scrape fragrances from Fragrantica")
+    parser.add_argument("--pages", type=int, default=50, help="number of listing pages in the frontier")
+    parser.add_argument("--restart", action="store_true", help="re-crawl pages already checkpointed as done")
+    parser.add_argument("--snapshots", metavar="PATH", help="ingest saved HTML pages from a directory or tarball instead of crawling")
+    parser.add_argument("--workers", type=int, help="processes used to parse snapshots")
+    parser.add_argument("--category", help="tag everything crawled or ingested in this run, e.g. niche")
+    parser.add_argument("--listing-url", default=LISTING_URL,
+                        help="listing page template with a {page} placeholder, e.g. a category search")
+    parser.add_argument("--log-level", default="INFO", choices=("DEBUG", "INFO", "WARNING", "ERROR"))
+    parser.add_argument("--db", default="fragrances.db", help="database to fill")
+    parser.add_argument("--cache-mode", choices=CACHE_MODES, default="off",
+                        help="record responses, replay them offline, or refresh stale ones")
+    parser.add_argument("--cache-dir", default="http_cache", help="where recorded responses are kept")
+    parser.add_argument("--cache-max-age", type=float, default=24 * 60 * 60,
+                        help="seconds a recorded response stays fresh in refresh mode")
+    args = parser.parse_args()
+    
+    listener = setup_logging(level=getattr(logging, args.log_level))
     try:
-        scraper = FragranceScraper()
-        await scraper.scrape_fragrances()
+        cache = ResponseCache(args.cache_dir, args.cache_mode, args.cache_max_age)
+        scraper = FragranceScraper(db_path=args.db, cache=cache)
+        if args.snapshots:
+            await scraper.setup_database()
+            ingest_snapshots(args.snapshots, scraper.db_path, args.workers, category=args.category)
+            return
+        await scraper.scrape_fragrances(
+            max_pages=args.pages,
+            restart=args.restart,
+            listing_url=args.listing_url,
+            category=args.category
+        )
     except Exception as e:
         logging.error(f"Script failed: {str(e)}")
         raise
+    finally:
+        listener.stop()
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -0,0 +1,215 @@
+import hmac
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections import Counter, defaultdict
+
+from flask import Response, g, has_request_context, request
+
+# Latency buckets in seconds, Prometheus-style (cumulative, plus +Inf)
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class Histogram:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self, name, labels):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            cumulative += count
+            le = "+Inf" if bound == float("inf") else repr(bound)
+            lines.append(f'{name}_bucket{{{labels},le="{le}"}} {cumulative}')
+        lines.append(f"{name}_sum{{{labels}}} {self.sum}")
+        lines.append(f"{name}_count{{{labels}}} {self.count}")
+        return lines
+
+
+class SlowRequestProfiler:
+    """Samples the stacks of in-flight requests and logs the slow ones.
+
+    A daemon thread wakes every `interval` seconds and records where each
+    request thread is; a request that ends up slower than `threshold` gets
+    its most frequent stacks logged.
+    """
+
+    def __init__(self, threshold, interval=0.005, top=5):
+        self.threshold = threshold
+        self.interval = interval
+        self.top = top
+        self.active = {}
+        self._lock = threading.Lock()
+        threading.Thread(target=self._run, name="slow-request-profiler", daemon=True).start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                active = list(self.active.items())
+            if not active:
+                continue
+            frames = sys._current_frames()
+            for ident, samples in active:
+                frame = frames.get(ident)
+                if frame is not None:
+                    stack = tuple(
+                        f"{entry.filename}:{entry.lineno} {entry.name}"
+                        for entry in traceback.extract_stack(frame, limit=12)
+                    )
+                    samples[stack] += 1
+
+    def start(self):
+        with self._lock:
+            self.active[threading.get_ident()] = Counter()
+
+    def stop(self, route, elapsed):
+        with self._lock:
+            samples = self.active.pop(threading.get_ident(), None)
+        if samples is None or elapsed < self.threshold:
+            return
+        total = sum(samples.values())
+        lines = [f"Slow request {route}: {elapsed * 1000:.1f}ms, {total} samples"]
+        for stack, count in samples.most_common(self.top):
+            lines.append(f"  {count}/{total} samples:")
+            lines.extend(f"    {frame}" for frame in stack)
+        logging.getLogger(__name__).warning("\n".join(lines))
+
+
+class Metrics:
+    """Request, SQL, session and tournament metrics exposed at /metrics
+
+    The page names routes and traffic volumes, so it is only served to
+    requests bearing the configured token, and not at all without one.
+    """
+
+    def __init__(self):
+        self.latency = defaultdict(Histogram)
+        self.sql_per_request = defaultdict(lambda: Histogram((0, 1, 2, 5, 10, 25, 50, 100)))
+        self.sql_time = defaultdict(Histogram)
+        self.requests = Counter()
+        self.counters = Counter()
+        self.sql_queries = 0
+        self.sql_seconds = 0.0
+        self.profiler = None
+        self.session_store = None
+        self.token = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app, db=None, session_store=None, slow_request_ms=None, token=None):
+        self.session_store = session_store
+        self.token = token
+        if db is not None:
+            db.listeners.append(self.record_sql)
+        if slow_request_ms:
+            self.profiler = SlowRequestProfiler(slow_request_ms / 1000)
+        app.before_request(self._before)
+        app.teardown_request(self._teardown)
+        app.add_url_rule("/metrics", "metrics", self.serve)
+
+    def _before(self):
+        g.metrics_started = time.perf_counter()
+        g.sql_queries = 0
+        g.sql_seconds = 0.0
+        if self.profiler:
+            self.profiler.start()
+
+    def _teardown(self, exc):
+        started = g.pop("metrics_started", None)
+        if started is None:
+            return
+        elapsed = time.perf_counter() - started
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        with self._lock:
+            self.latency[route].observe(elapsed)
+            self.sql_per_request[route].observe(g.sql_queries)
+            self.sql_time[route].observe(g.sql_seconds)
+            self.requests[route] += 1
+        if self.profiler:
+            self.profiler.stop(route, elapsed)
+
+    def record_sql(self, elapsed):
+        with self._lock:
+            self.sql_queries += 1
+            self.sql_seconds += elapsed
+        if has_request_context() and "sql_queries" in g:
+            g.sql_queries += 1
+            g.sql_seconds += elapsed
+
+    def inc(self, name, n=1):
+        """Bump a plain counter such as tournaments_completed_total"""
+        with self._lock:
+            self.counters[name] += n
+
+    def allowed(self):
+        """Return True if the current request may read the metrics"""
+        if not self.token:
+            return False
+        expected = f"Bearer {self.token}"
+        return hmac.compare_digest(request.headers.get("Authorization", "").encode(), expected.encode())
+
+    def serve(self):
+        if not self.allowed():
+            return Response("Not Found\n", status=404, mimetype="text/plain")
+        return self.render()
+
+    def render(self):
+        lines = [
+            "# HELP http_request_duration_seconds Request latency by route",
+            "# TYPE http_request_duration_seconds histogram",
+        ]
+        with self._lock:
+            for route, histogram in sorted(self.latency.items()):
+                lines.extend(histogram.render("http_request_duration_seconds", f'route="{route}"'))
+            lines.append("# HELP sql_queries_per_request SQL statements run by one request")
+            lines.append("# TYPE sql_queries_per_request histogram")
+            for route, histogram in sorted(self.sql_per_request.items()):
+                lines.extend(histogram.render("sql_queries_per_request", f'route="{route}"'))
+            lines.append("# HELP sql_seconds_per_request Time spent in SQL by one request")
+            lines.append("# TYPE sql_seconds_per_request histogram")
+            for route, histogram in sorted(self.sql_time.items()):
+                lines.extend(histogram.render("sql_seconds_per_request", f'route="{route}"'))
+            lines.append("# TYPE sql_queries_total counter")
+            lines.append(f"sql_queries_total {self.sql_queries}")
+            lines.append("# TYPE sql_seconds_total counter")
+            lines.append(f"sql_seconds_total {self.sql_seconds}")
+            for name, value in sorted(self.counters.items()):
+                lines.append(f"# TYPE {name} counter")
+                lines.append(f"{name} {value}")
+
+        if self.session_store is not None:
+            stats = self.session_store.stats.as_dict(self.session_store.size())
+            for name in ("hits", "misses", "writes", "deletes", "expired"):
+                lines.append(f"# TYPE session_store_{name}_total counter")
+                lines.append(f"session_store_{name}_total {stats[name]}")
+            lines.extend([
+                "# HELP session_store_hit_rate Share of session lookups that found a live session",
+                "# TYPE session_store_hit_rate gauge",
+                f"session_store_hit_rate {stats['hit_rate']}",
+                "# HELP session_read_bytes Size of session payloads read",
+                "# TYPE session_read_bytes summary",
+                f"session_read_bytes_sum {stats['bytes_read']}",
+                f"session_read_bytes_count {stats['hits']}",
+                "# HELP session_write_bytes Size of session payloads written",
+                "# TYPE session_write_bytes summary",
+                f"session_write_bytes_sum {stats['bytes_written']}",
+                f"session_write_bytes_count {stats['writes']}",
+                "# TYPE session_store_size gauge",
+                f"session_store_size {stats['size']}",
+            ])
+        return Response("\n".join(lines) + "\n", mimetype="text/plain; version=0.0.4")
@@ -0,0 +1,95 @@
+import logging
+import re
+from typing import Optional, Dict, Any, List
+from urllib.parse import unquote
+
+from bs4 import BeautifulSoup, SoupStrainer
+
+# Selectors tried in order to find fragrance cards on a listing page
+CARD_SELECTORS = [
+    "div.card-product",
+    ".card-product",
+    "div[class*='card']",
+    "div[class*='product']"
+]
+
+
+def brand_from_url(href: str) -> Optional[str]:
+    """Return the brand in a /perfume/<Brand>/<Name>-<id>.html link"""
+    parts = href.split('/perfume/', 1)[-1].split('/')
+    if len(parts) < 2 or not parts[0]:
+        return None
+    return unquote(parts[0]).replace('-', ' ')
+
+
+def extract_fragrance_data(card: BeautifulSoup) -> Optional[Dict[str, Any]]:
+    """Extract name, brand and image data"""
+    try:
+        link_tag = card.select_one("a[href*='/perfume/']")
+        if not link_tag:
+            logging.debug("No link tag found in card")
+            return None
+        
+        href = link_tag['href']
+        name = link_tag.get_text(strip=True)
+        
+        if not name:
+            logging.debug("No name found in link tag")
+            return None
+        
+        # Extract ID from URL
+        try:
+            frag_id = int(href.split('-')[-1].replace('.html', ''))
+        except (ValueError, IndexError) as e:
+            logging.warning(f"Could not extract ID from URL {href}: {str(e)}")
+            return None
+        
+        # Get image URL
+        img_tag = card.select_one("img")
+        image_url = img_tag['src'] if img_tag else None
+        
+        if not image_url:
+            logging.warning(f"No image URL found for fragrance {name}")
+        
+        return {
+            'id': frag_id,
+            'name': name,
+            'image_url': image_url,
+            'brand': brand_from_url(href)
+        }
+        
+    except Exception as e:
+        logging.error(f"Error extracting data from card: {str(e)}")
+        return None
+
+
+def find_fragrances(soup: BeautifulSoup) -> List[Dict[str, Any]]:
+    """Return the fragrances on a parsed listing page"""
+    # Try different selectors for the cards
+    cards = []
+    for selector in CARD_SELECTORS:
+        cards = soup.select(selector)
+        if cards:
+            logging.info(f"Found {len(cards)} cards using selector: {selector}")
+            break
+    
+    fragrances = []
+    for card in cards:
+        fragrance_data = extract_fragrance_data(card)
+        if fragrance_data:
+            fragrances.append(fragrance_data)
+    return fragrances
+
+
+def parse_listing(content: str) -> List[Dict[str, Any]]:
+    """Parse a listing page and return the fragrances found on it"""
+    return find_fragrances(BeautifulSoup(content, 'html.parser'))
+
+
+# Only build <div> subtrees that can match one of CARD_SELECTORS
+CARD_STRAINER = SoupStrainer("div", class_=re.compile("card|product"))
+
+
+def parse_snapshot(content: bytes) -> List[Dict[str, Any]]:
+    """Parse a saved listing page, building only the card subtrees"""
+    return find_fragrances(BeautifulSoup(content, 'html.parser', parse_only=CARD_STRAINER))
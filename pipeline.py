@@ -0,0 +1,65 @@
+import asyncio
+import time
+from urllib.parse import urlparse
+
+# Sentinel passed down a queue when the upstream stage has finished
+STOP = object()
+
+
+class TokenBucket:
+    """Async token bucket: `rate` requests per second with bursts up to `burst`"""
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class HostRateLimiter:
+    """One token bucket per host, so politeness only applies to remote requests"""
+
+    def __init__(self, default_rate: float = 1.0, default_burst: int = 1, limits=None):
+        self.default_rate = default_rate
+        self.default_burst = default_burst
+        self.limits = limits or {}
+        self.buckets = {}
+
+    async def acquire(self, url: str):
+        host = urlparse(url).netloc
+        bucket = self.buckets.get(host)
+        if bucket is None:
+            rate, burst = self.limits.get(host, (self.default_rate, self.default_burst))
+            bucket = self.buckets[host] = TokenBucket(rate, burst)
+        await bucket.acquire()
+
+
+async def run_stage(worker, inbox: asyncio.Queue, outbox: asyncio.Queue = None, workers: int = 1):
+    """Run `workers` copies of worker(item, outbox) over inbox until STOP.
+
+    STOP is put back for sibling workers and forwarded to outbox once every
+    worker has finished.
+    """
+    async def loop():
+        while True:
+            item = await inbox.get()
+            if item is STOP:
+                await inbox.put(STOP)
+                return
+            await worker(item, outbox)
+
+    await asyncio.gather(*(loop() for _ in range(workers)))
+    if outbox is not None:
+        await outbox.put(STOP)
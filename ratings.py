@@ -0,0 +1,206 @@
+import heapq
+import logging
+import threading
+import time
+
+import numpy as np
+
+from database import connect
+
+
+def elo_update(ratings, winner, loser, k=32.0, base=1500.0):
+    """Apply one Elo update for a single matchup in place"""
+    rw = ratings.get(winner, base)
+    rl = ratings.get(loser, base)
+    expected = 1.0 / (1.0 + 10.0 ** ((rl - rw) / 400.0))
+    delta = k * (1.0 - expected)
+    ratings[winner] = rw + delta
+    ratings[loser] = rl - delta
+
+
+def load_matches(db_path, after=0, chunk_size=100000):
+    """Read the match log past rowid after into int64 arrays (rowids, winners, losers)"""
+    conn = connect(db_path, readonly=True)
+    try:
+        cursor = conn.execute(
+            "SELECT rowid, winner, loser FROM matches WHERE rowid > ? ORDER BY rowid", (after,)
+        )
+        chunks = []
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            chunks.append(np.array(rows, dtype=np.int64))
+    finally:
+        conn.close()
+    if not chunks:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty, empty
+    rows = np.concatenate(chunks)
+    return rows[:, 0], rows[:, 1], rows[:, 2]
+
+
+def bradley_terry(winners, losers, prior=1.0, max_iter=500, tol=1e-8):
+    """Fit Bradley-Terry strengths with the MM algorithm (Hunter, 2004).
+
+    Matchups are collapsed into unique unordered pairs, so each iteration is
+    a couple of bincounts over the pairs rather than the raw log. Every item
+    gets `prior` virtual wins and losses against a reference of strength 1,
+    which keeps undefeated and winless items finite.
+
+    Returns (ids, strengths) with strengths normalised to a geometric mean
+    of 1.
+    """
+    ids, codes = np.unique(np.concatenate([winners, losers]), return_inverse=True)
+    n = len(ids)
+    if n == 0:
+        return ids, np.empty(0)
+    w, l = codes[:len(winners)], codes[len(winners):]
+
+    wins = np.bincount(w, minlength=n).astype(float) + prior
+    a, b = np.minimum(w, l), np.maximum(w, l)
+    pair_keys, games = np.unique(a * n + b, return_counts=True)
+    a, b = pair_keys // n, pair_keys % n
+    games = games.astype(float)
+
+    p = np.ones(n)
+    for _ in range(max_iter):
+        t = games / (p[a] + p[b])
+        denom = np.bincount(a, t, minlength=n) + np.bincount(b, t, minlength=n)
+        denom += 2.0 * prior / (p + 1.0)
+        new_p = wins / denom
+        if np.max(np.abs(new_p - p)) < tol:
+            p = new_p
+            break
+        p = new_p
+    return ids, p / np.exp(np.mean(np.log(p)))
+
+
+class RatingEngine:
+    """Elo ratings updated per vote plus a periodic Bradley-Terry batch fit.
+
+    Both are kept on an Elo-like scale (1500 = average) so they can be shown
+    side by side. The Bradley-Terry fit runs in a background thread at most
+    once per refit_interval seconds, when a ranking asks for it.
+
+    Elo follows the shared match log in rowid order: sync() applies the
+    matches any worker logged since the last sync, after each WinRecorder
+    flush and at most every sync_interval seconds when the Elo ranking is
+    shown, so every worker converges on the same ratings. Votes recorded
+    here but not yet flushed come back with the next flush.
+    """
+
+    def __init__(self, db_path, k=32.0, base=1500.0, refit_interval=300.0, sync_interval=5.0):
+        self.db_path = db_path
+        self.k = k
+        self.base = base
+        self.refit_interval = refit_interval
+        self.sync_interval = sync_interval
+        self.elo = {}
+        self.bt = {}
+        self.elo_version = 0
+        self.bt_version = 0
+        self._fitted_at = 0.0
+        self._fitting = False
+        self._lock = threading.Lock()
+        self._fragments = {}
+        # Elo replayed from the match log up to _logged_rowid
+        self._logged = {}
+        self._logged_rowid = 0
+        self._synced_at = None
+        self._sync_lock = threading.Lock()
+
+    def load(self):
+        """Replay the match log into Elo and run a first Bradley-Terry fit"""
+        with self._sync_lock:
+            self._logged, self._logged_rowid = {}, 0
+            winners, losers = self._apply_logged()
+        self._fit(winners, losers)
+
+    def _apply_logged(self):
+        # Called with _sync_lock held
+        self._synced_at = time.monotonic()
+        rowids, winners, losers = load_matches(self.db_path, self._logged_rowid)
+        if len(rowids):
+            for winner, loser in zip(winners.tolist(), losers.tolist()):
+                elo_update(self._logged, winner, loser, self.k, self.base)
+            self._logged_rowid = int(rowids[-1])
+            elo = dict(self._logged)
+            with self._lock:
+                self.elo = elo
+                self.elo_version += 1
+        return winners, losers
+
+    def sync(self):
+        """Apply the matches logged by any worker since the last sync"""
+        with self._sync_lock:
+            self._apply_logged()
+
+    def refresh(self):
+        if self._synced_at is None or time.monotonic() - self._synced_at >= self.sync_interval:
+            self.sync()
+
+    def record(self, winner, loser):
+        """Apply the incremental Elo update for one vote"""
+        with self._lock:
+            elo_update(self.elo, winner, loser, self.k, self.base)
+            self.elo_version += 1
+
+    def _fit(self, winners=None, losers=None):
+        started = time.monotonic()
+        if winners is None:
+            _, winners, losers = load_matches(self.db_path)
+        ids, strengths = bradley_terry(winners, losers)
+        scores = self.base + 400.0 * np.log10(strengths)
+        with self._lock:
+            self.bt = dict(zip(ids.tolist(), scores.tolist()))
+            self.bt_version += 1
+            self._fitted_at = time.monotonic()
+        logging.info(f"Bradley-Terry fit over {len(winners)} matches took {time.monotonic() - started:.2f}s")
+
+    def _refit_in_background(self):
+        try:
+            self._fit()
+        except Exception:
+            logging.exception("Bradley-Terry fit failed")
+        finally:
+            self._fitting = False
+
+    def maybe_refit(self):
+        """Start a background Bradley-Terry fit if the last one is stale"""
+        if self._fitting or time.monotonic() - self._fitted_at < self.refit_interval:
+            return
+        self._fitting = True
+        threading.Thread(target=self._refit_in_background, name="bt-fit", daemon=True).start()
+
+    def top(self, kind, catalog, k=10):
+        """Return the k best rated fragrances as dicts with a rating key"""
+        # record() adds ids under the lock, so rank a snapshot
+        with self._lock:
+            items = list((self.elo if kind == "elo" else self.bt).items())
+        best = heapq.nlargest(k * 2, items, key=lambda item: item[1])
+        results = []
+        for fragrance_id, rating in best:
+            fragrance = catalog.get(fragrance_id)
+            if fragrance is None:
+                continue
+            fragrance["rating"] = rating
+            results.append(fragrance)
+            if len(results) == k:
+                break
+        return results
+
+    def fragment(self, kind, catalog, render, k=10):
+        """Return render(top) for a rating kind, cached until the ratings change"""
+        if kind == "bt":
+            self.maybe_refit()
+        else:
+            self.refresh()
+        catalog.refresh()
+        version = self.elo_version if kind == "elo" else self.bt_version
+        key = (version, catalog.version)
+        cached_key, html = self._fragments.get(kind, (None, None))
+        if cached_key != key:
+            html = render(self.top(kind, catalog, k))
+            self._fragments[kind] = (key, html)
+        return html
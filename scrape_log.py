@@ -0,0 +1,120 @@
+import json
+import logging
+import logging.handlers
+import multiprocessing
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Dict, Any
+
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+# Rotate the text log and the event log at this size, keeping BACKUP_COUNT old files
+MAX_LOG_BYTES = 10 * 1024 * 1024
+BACKUP_COUNT = 5
+
+EVENTS_LOGGER = 'scraper.events'
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: the event name, a timestamp and its fields"""
+
+    def format(self, record):
+        event = {'ts': round(record.created, 3), 'event': record.getMessage()}
+        event.update(getattr(record, 'fields', {}))
+        return json.dumps(event, default=str)
+
+
+def setup_logging(
+    log_path: str = 'scraper.log',
+    events_path: str = 'scraper_events.jsonl',
+    level: int = logging.INFO
+) -> logging.handlers.QueueListener:
+    """Route all logging through a queue so the event loop never touches disk.
+
+    Records are written by a QueueListener thread to a rotating text log,
+    the console, and (for stage events only) a rotating JSON lines file.
+    The queue is a multiprocessing one so forked parse workers log through
+    it too. Call .stop() on the returned listener to flush on exit.
+    """
+    queue = multiprocessing.Queue(-1)
+
+    text = logging.handlers.RotatingFileHandler(log_path, maxBytes=MAX_LOG_BYTES, backupCount=BACKUP_COUNT)
+    text.setFormatter(logging.Formatter(LOG_FORMAT))
+    text.addFilter(lambda record: record.name != EVENTS_LOGGER)
+    console = logging.StreamHandler()
+    console.setFormatter(logging.Formatter(LOG_FORMAT))
+    console.addFilter(lambda record: record.name != EVENTS_LOGGER)
+    events = logging.handlers.RotatingFileHandler(events_path, maxBytes=MAX_LOG_BYTES, backupCount=BACKUP_COUNT)
+    events.setFormatter(JsonFormatter())
+    events.addFilter(lambda record: record.name == EVENTS_LOGGER)
+
+    root = logging.getLogger()
+    root.handlers[:] = [logging.handlers.QueueHandler(queue)]
+    root.setLevel(level)
+    # Stage events are always recorded, whatever the text log level
+    logging.getLogger(EVENTS_LOGGER).setLevel(logging.INFO)
+
+    listener = logging.handlers.QueueListener(queue, text, console, events, respect_handler_level=True)
+    listener.start()
+    return listener
+
+
+class StageTimer:
+    """Per-stage wall-clock timings for a crawl.
+
+    Every timed step is logged as a JSON event with its duration, and the
+    totals feed the end-of-run summary. Stages run concurrently, so their
+    totals add up to more than the wall time of the run.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.seconds: Dict[str, float] = defaultdict(float)
+        self.counts: Dict[str, int] = defaultdict(int)
+        self.log = logging.getLogger(EVENTS_LOGGER)
+
+    @contextmanager
+    def stage(self, name: str, **fields):
+        """Time the body of a with block as one step of stage `name`"""
+        started = time.perf_counter()
+        ok = True
+        try:
+            yield fields
+        except BaseException:
+            ok = False
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            self.seconds[name] += elapsed
+            self.counts[name] += 1
+            self.log.info('stage', extra={'fields': {
+                'stage': name, 'seconds': round(elapsed, 4), 'ok': ok, **fields
+            }})
+
+    def summary(self, **totals) -> Dict[str, Any]:
+        """Log and return throughput and where the time went"""
+        elapsed = time.perf_counter() - self.started
+        stages = {
+            name: {
+                'count': self.counts[name],
+                'seconds': round(seconds, 3),
+                'mean_seconds': round(seconds / self.counts[name], 4),
+                'share_of_wall': round(seconds / elapsed, 3) if elapsed else None,
+            }
+            for name, seconds in sorted(self.seconds.items(), key=lambda item: -item[1])
+        }
+        summary = {'wall_seconds': round(elapsed, 3), **totals}
+        for name, value in totals.items():
+            if isinstance(value, (int, float)) and elapsed:
+                summary[f'{name}_per_second'] = round(value / elapsed, 3)
+        summary['stages'] = stages
+        self.log.info('run_summary', extra={'fields': summary})
+
+        logging.info(f"Run finished in {elapsed:.1f}s: " + ', '.join(f"{k}={v}" for k, v in totals.items()))
+        for name, stats in stages.items():
+            logging.info(
+                f"  {name:<14} {stats['seconds']:9.1f}s over {stats['count']:5d} steps "
+                f"(mean {stats['mean_seconds']:.3f}s, {stats['share_of_wall']:.0%} of wall time)"
+            )
+        return summary
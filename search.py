@@ -0,0 +1,134 @@
+import heapq
+import re
+import threading
+import unicodedata
+from bisect import bisect_left
+
+WORD = re.compile(r"[a-z0-9]+")
+
+
+def normalize(text):
+    """Lowercase, strip accents and split into words"""
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return WORD.findall(text.lower())
+
+
+def trigrams(word):
+    padded = f"  {word}"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def within_distance(a, b, limit):
+    """Return the Levenshtein distance of a and b if it is <= limit, else None"""
+    if abs(len(a) - len(b)) > limit:
+        return None
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        if min(current) > limit:
+            return None
+        previous = current
+    return previous[-1] if previous[-1] <= limit else None
+
+
+class SearchIndex:
+    """In-memory prefix and typo-tolerant index over fragrance names.
+
+    Every word of every name is kept in one sorted list, so the names with a
+    word starting with a query word are a bisect away. Query words that
+    match nothing as a prefix fall back to vocabulary words sharing a
+    trigram with them and within a small edit distance, compared on the
+    same-length prefix so a typo mid-word still autocompletes. The index is
+    rebuilt when the catalog version changes.
+    """
+
+    def __init__(self, catalog):
+        self.catalog = catalog
+        self.version = None
+        self._words = []
+        self._postings = {}
+        self._trigrams = {}
+        self._names = {}
+        self._lock = threading.Lock()
+
+    def _build(self):
+        postings = {}
+        names = {}
+        for fragrance_id, (name, _) in self.catalog.records.items():
+            words = normalize(name)
+            names[fragrance_id] = " ".join(words)
+            for word in words:
+                postings.setdefault(word, set()).add(fragrance_id)
+        grams = {}
+        for word in postings:
+            for gram in trigrams(word):
+                grams.setdefault(gram, []).append(word)
+        self._words = sorted(postings)
+        self._postings = postings
+        self._trigrams = grams
+        self._names = names
+
+    def refresh(self):
+        self.catalog.refresh()
+        if self.version != self.catalog.version:
+            with self._lock:
+                if self.version != self.catalog.version:
+                    version = self.catalog.version
+                    self._build()
+                    self.version = version
+
+    def _prefix_ids(self, prefix):
+        ids = set()
+        i = bisect_left(self._words, prefix)
+        while i < len(self._words) and self._words[i].startswith(prefix):
+            ids |= self._postings[self._words[i]]
+            i += 1
+        return ids
+
+    def _fuzzy_ids(self, word):
+        limit = 1 if len(word) <= 5 else 2
+        candidates = set()
+        for gram in trigrams(word):
+            candidates.update(self._trigrams.get(gram, ()))
+        ids = set()
+        for candidate in candidates:
+            if within_distance(word, candidate[:len(word)], limit) is not None:
+                ids |= self._postings[candidate]
+        return ids
+
+    def search(self, query, limit=10):
+        """Return up to limit (fragrance_id, fuzzy) pairs, best matches first
+
+        Every query word must match a word of the name, as a prefix or
+        failing that fuzzily. Names that start with the query come first,
+        then shorter names.
+        """
+        self.refresh()
+        words = normalize(query)
+        if not words:
+            return []
+        ids = None
+        fuzzy = False
+        # Longer (usually rarer) words first keeps the intersections small
+        for word in sorted(words, key=len, reverse=True):
+            matches = self._prefix_ids(word)
+            if not matches and len(word) >= 3:
+                matches = self._fuzzy_ids(word)
+                fuzzy = True
+            ids = matches if ids is None else ids & matches
+            if not ids:
+                return []
+        phrase = " ".join(words)
+        ranked = heapq.nsmallest(
+            limit,
+            ids,
+            key=lambda fragrance_id: (
+                not self._names[fragrance_id].startswith(phrase),
+                len(self._names[fragrance_id]),
+                self._names[fragrance_id],
+            )
+        )
+        return [(fragrance_id, fuzzy) for fragrance_id in ranked]
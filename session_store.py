@@ -0,0 +1,327 @@
+import os
+import pickle
+import re
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+
+from database import connect
+
+# Session ids are secrets.token_urlsafe(32); anything else in the cookie is
+# ignored before it reaches a store, so it can never name a file
+SID_PATTERN = re.compile(r"[A-Za-z0-9_-]{43}")
+
+
+def valid_sid(sid):
+    return bool(sid) and SID_PATTERN.fullmatch(sid) is not None
+
+
+class StoreStats:
+    """Counters shared by all session backends"""
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.deletes = 0
+        self.expired = 0
+        self.bytes_read = 0
+        self.bytes_written = 0
+
+    def as_dict(self, size):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "writes": self.writes,
+            "deletes": self.deletes,
+            "expired": self.expired,
+            "bytes_read": self.bytes_read,
+            "bytes_written": self.bytes_written,
+            "size": size,
+        }
+
+
+class MemoryStore:
+    """In-process LRU of sessions with a TTL, bounded to maxsize entries"""
+
+    def __init__(self, ttl, maxsize=10000):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.stats = StoreStats()
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, sid):
+        with self._lock:
+            entry = self._data.get(sid)
+            if entry is None:
+                self.stats.misses += 1
+                return None
+            expires, payload = entry
+            if expires < time.time():
+                del self._data[sid]
+                self.stats.expired += 1
+                self.stats.misses += 1
+                return None
+            self._data.move_to_end(sid)
+            self.stats.hits += 1
+            return payload
+
+    def set(self, sid, payload):
+        with self._lock:
+            self._data[sid] = (time.time() + self.ttl, payload)
+            self._data.move_to_end(sid)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+            self.stats.writes += 1
+            self.stats.bytes_written += len(payload)
+
+    def delete(self, sid):
+        with self._lock:
+            if self._data.pop(sid, None) is not None:
+                self.stats.deletes += 1
+
+    def size(self):
+        return len(self._data)
+
+
+class SQLiteStore:
+    """Sessions in a SQLite table (WAL mode) shared by every worker on a host
+
+    Expired rows are removed in batches every sweep_interval seconds rather
+    than on each request.
+    """
+
+    def __init__(self, path, ttl, sweep_interval=60.0, sweep_batch=1000):
+        self.path = path
+        self.ttl = ttl
+        self.sweep_interval = sweep_interval
+        self.sweep_batch = sweep_batch
+        self.stats = StoreStats()
+        self._local = threading.local()
+        self._next_sweep = 0.0
+        conn = self._conn()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS sessions (
+                sid TEXT PRIMARY KEY,
+                data BLOB NOT NULL,
+                expires REAL NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS sessions_expires ON sessions (expires)")
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = connect(self.path, isolation_level=None)
+            self._local.conn = conn
+        return conn
+
+    def get(self, sid):
+        row = self._conn().execute(
+            "SELECT data FROM sessions WHERE sid = ? AND expires >= ?", (sid, time.time())
+        ).fetchone()
+        if row is None:
+            self.stats.misses += 1
+            return None
+        self.stats.hits += 1
+        return row[0]
+
+    def set(self, sid, payload):
+        now = time.time()
+        self._conn().execute(
+            "INSERT OR REPLACE INTO sessions (sid, data, expires) VALUES (?, ?, ?)",
+            (sid, payload, now + self.ttl),
+        )
+        self.stats.writes += 1
+        self.stats.bytes_written += len(payload)
+        if now >= self._next_sweep:
+            self._next_sweep = now + self.sweep_interval
+            self.sweep(now)
+
+    def delete(self, sid):
+        self._conn().execute("DELETE FROM sessions WHERE sid = ?", (sid,))
+        self.stats.deletes += 1
+
+    def sweep(self, now=None):
+        """Delete expired sessions, sweep_batch rows per statement"""
+        now = time.time() if now is None else now
+        conn = self._conn()
+        while True:
+            deleted = conn.execute("""
+                DELETE FROM sessions WHERE rowid IN (
+                    SELECT rowid FROM sessions WHERE expires < ? LIMIT ?
+                )
+            """, (now, self.sweep_batch)).rowcount
+            self.stats.expired += deleted
+            if deleted < self.sweep_batch:
+                break
+
+    def size(self):
+        return self._conn().execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+
+class FileStore:
+    """One file per session in a directory, with a TTL and a file-count cap
+
+    This is the original filesystem mode; expired and excess files are
+    pruned every sweep_interval seconds.
+    """
+
+    def __init__(self, directory, ttl, threshold=500, sweep_interval=60.0):
+        self.directory = directory
+        self.ttl = ttl
+        self.threshold = threshold
+        self.sweep_interval = sweep_interval
+        self.stats = StoreStats()
+        self._next_sweep = 0.0
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, sid):
+        if not valid_sid(sid):
+            raise ValueError("Invalid session id")
+        return os.path.join(self.directory, sid)
+
+    def _remove(self, name):
+        try:
+            os.remove(os.path.join(self.directory, name))
+            self.stats.deletes += 1
+        except OSError:
+            pass
+
+    def get(self, sid):
+        path = self._path(sid)
+        try:
+            if os.path.getmtime(path) + self.ttl < time.time():
+                os.remove(path)
+                self.stats.expired += 1
+                self.stats.misses += 1
+                return None
+            with open(path, "rb") as f:
+                payload = f.read()
+        except OSError:
+            self.stats.misses += 1
+            return None
+        self.stats.hits += 1
+        return payload
+
+    def set(self, sid, payload):
+        path = self._path(sid)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(payload)
+        os.replace(tmp, path)
+        self.stats.writes += 1
+        self.stats.bytes_written += len(payload)
+        now = time.time()
+        if now >= self._next_sweep:
+            self._next_sweep = now + self.sweep_interval
+            self.sweep(now)
+
+    def delete(self, sid):
+        self._remove(os.path.basename(self._path(sid)))
+
+    def sweep(self, now=None):
+        """Remove expired files, then the oldest ones beyond the threshold"""
+        now = time.time() if now is None else now
+        entries = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                try:
+                    mtime = entry.stat().st_mtime
+                except OSError:
+                    continue
+                if mtime + self.ttl < now:
+                    self._remove(entry.name)
+                    self.stats.expired += 1
+                else:
+                    entries.append((mtime, entry.name))
+        if len(entries) > self.threshold:
+            entries.sort()
+            for _, name in entries[:len(entries) - self.threshold]:
+                self._remove(name)
+
+    def size(self):
+        with os.scandir(self.directory) as it:
+            return sum(1 for _ in it)
+
+
+class StoreSession(CallbackDict, SessionMixin):
+    """Server-side session whose cookie only carries the session id"""
+
+    def __init__(self, initial=None, sid=None, new=False):
+        def on_update(self):
+            self.modified = True
+
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.new = new
+        self.modified = False
+
+
+class StoreSessionInterface(SessionInterface):
+    """Flask session interface backed by one of the stores above"""
+
+    def __init__(self, store):
+        self.store = store
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if valid_sid(sid):
+            payload = self.store.get(sid)
+            if payload is not None:
+                self.store.stats.bytes_read += len(payload)
+                try:
+                    return StoreSession(pickle.loads(payload), sid=sid)
+                except Exception:
+                    pass
+        return StoreSession(sid=secrets.token_urlsafe(32), new=True)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        if not session:
+            if session.modified:
+                self.store.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+        if not session.modified:
+            return
+        self.store.set(session.sid, pickle.dumps(dict(session), pickle.HIGHEST_PROTOCOL))
+        response.set_cookie(
+            name,
+            session.sid,
+            expires=self.get_expiration_time(app, session),
+            httponly=self.get_cookie_httponly(app),
+            domain=domain,
+            path=path,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app),
+        )
+
+
+def init_session(app):
+    """Install the session backend named by app.config["SESSION_TYPE"]"""
+    backend = app.config.get("SESSION_TYPE", "filesystem")
+    ttl = app.config.get("SESSION_TTL", 24 * 60 * 60)
+    if backend == "memory":
+        store = MemoryStore(ttl, maxsize=app.config.get("SESSION_MAXSIZE", 10000))
+    elif backend == "sqlite":
+        store = SQLiteStore(app.config.get("SESSION_SQLITE_PATH", "sessions.db"), ttl)
+    elif backend == "filesystem":
+        store = FileStore(
+            app.config.get("SESSION_FILE_DIR", "flask_session"),
+            ttl,
+            threshold=app.config.get("SESSION_FILE_THRESHOLD", 500),
+        )
+    else:
+        raise ValueError(f"Unknown session backend: {backend}")
+    app.session_interface = StoreSessionInterface(store)
+    return store
@@ -0,0 +1,94 @@
+import itertools
+import logging
+import os
+import tarfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Optional, Dict, Any, Iterator, List
+
+from bulk_load import upsert_fragrances
+from parsing import parse_snapshot
+
+SNAPSHOT_SUFFIXES = ('.html', '.htm')
+
+# Tarball pages are read and handed to the pool this many per worker at a
+# time, so only a bounded number of pages is ever held in memory
+TARBALL_BATCH_PER_WORKER = 64
+
+
+def parse_snapshot_file(path: str) -> List[Dict[str, Any]]:
+    """Worker entry point: read and parse one saved page"""
+    with open(path, 'rb') as f:
+        return parse_snapshot(f.read())
+
+
+def iter_tarball(path: str) -> Iterator[bytes]:
+    """Yield the contents of every HTML page in a tarball"""
+    with tarfile.open(path) as tar:
+        for member in tar:
+            if member.isfile() and member.name.lower().endswith(SNAPSHOT_SUFFIXES):
+                yield tar.extractfile(member).read()
+
+
+def map_in_batches(executor, fn, items: Iterator, batch_size: int) -> Iterator:
+    """Like executor.map, but only batch_size items are pulled from items at once
+
+    Executor.map submits everything up front, which would read a whole
+    tarball into memory.
+    """
+    items = iter(items)
+    while True:
+        batch = list(itertools.islice(items, batch_size))
+        if not batch:
+            return
+        yield from executor.map(fn, batch, chunksize=16)
+
+
+def ingest_snapshots(
+    source: str,
+    db_path: str,
+    workers: Optional[int] = None,
+    category: Optional[str] = None
+) -> Dict[str, int]:
+    """Parse a directory or tarball of saved listing pages and load them.
+
+    Pages are parsed on a process pool, results are deduplicated by
+    fragrance id (first occurrence wins) and written in one transaction,
+    tagged with category if one is given. No browser or network access is
+    needed.
+    """
+    started = time.monotonic()
+    workers = workers or os.cpu_count() or 1
+    fragrances: Dict[int, Dict[str, Any]] = {}
+    pages = 0
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        if os.path.isdir(source):
+            # Workers read the files themselves, so only paths cross processes
+            paths = sorted(
+                str(path) for path in Path(source).rglob('*')
+                if path.suffix.lower() in SNAPSHOT_SUFFIXES
+            )
+            results = executor.map(parse_snapshot_file, paths, chunksize=16)
+        elif tarfile.is_tarfile(source):
+            results = map_in_batches(
+                executor, parse_snapshot, iter_tarball(source), workers * TARBALL_BATCH_PER_WORKER
+            )
+        else:
+            raise ValueError(f"Not a directory or tarball: {source}")
+
+        for found in results:
+            pages += 1
+            for fragrance_data in found:
+                if category:
+                    fragrance_data['category'] = category
+                fragrances.setdefault(fragrance_data['id'], fragrance_data)
+
+    counts = upsert_fragrances(db_path, fragrances.values())
+    logging.info(
+        f"Ingested {len(fragrances)} unique fragrances from {pages} pages "
+        f"in {time.monotonic() - started:.1f}s using {workers} processes: "
+        f"{counts['inserted']} inserted, {counts['updated']} updated, {counts['unchanged']} unchanged"
+    )
+    return counts
@@ -1,13 +1,13 @@
 function updateImage(option) {
     $.get("/random_image", function(data) {
-        $("#" + option + "-img").attr("src", "https://fimgs.net/mdimg/perfume/375x500." + data.image_id + ".jpg");
+        $("#" + option + "-img").attr("src", "/images/" + data.image_id + "?w=375");
     });
 }
 
 function saveVote(option) {
     // Ensure URL splitting logic is robust
     const src = $("#" + option + "-img").attr("src");
-    const imageId = src.match(/375x500\.(\d+)\.jpg/)[1]; // Extract ID using regex
+    const imageId = src.match(/\/images\/(\d+)/)[1]; // Extract ID using regex
     console.log("Parsed image_id:", imageId);  // Debug parsed image ID
 
     $.ajax({
@@ -36,7 +36,7 @@ function fetchResults() {
             resultsHTML += `
                 <div class="grid-item">
                     <img id="option${result.image_id}-img"
-                         src="https://fimgs.net/mdimg/perfume/375x500.${result.image_id}.jpg"
+                         src="/images/${result.image_id}?w=192"
                          alt="Option ${result.image_id} Image"
                          class="custom-img2">
                     <p>${result.votes} votes</p>
@@ -0,0 +1,113 @@
+import hashlib
+import os
+import re
+import threading
+
+from flask import Response, request
+
+# Far-future caching for URLs that carry the content hash of the file
+IMMUTABLE = "public, max-age=31536000, immutable"
+# Unversioned static URLs may be cached but must be revalidated (ETag/304)
+REVALIDATE = "public, no-cache"
+
+CSS_URL = re.compile(r"""url\((['"]?)/static/([^'")?#]+)\1\)""")
+
+
+class StaticAssets:
+    """Content-hash fingerprints for files under the static folder.
+
+    url_for("static", filename=...) gets a ?v=<hash> argument. A request
+    whose v matches the current hash is served as immutable; anything else
+    falls back to ETag revalidation. Stylesheets are served with their own
+    /static/ url() references fingerprinted as well, so fonts referenced
+    from CSS are covered too.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.static_folder = app.static_folder
+        self._hashes = {}
+        self._css = {}
+        self._lock = threading.Lock()
+        self._send_static_file = app.view_functions["static"]
+        app.view_functions["static"] = self.serve
+        app.url_defaults(self.add_fingerprint)
+
+    def _path(self, filename):
+        path = os.path.realpath(os.path.join(self.static_folder, filename))
+        if not path.startswith(os.path.realpath(self.static_folder) + os.sep):
+            return None
+        return path
+
+    def fingerprint(self, filename):
+        """Return a short content hash of a static file, or None if missing"""
+        path = self._path(filename)
+        if path is None:
+            return None
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        key = (st.st_mtime_ns, st.st_size)
+        if filename.endswith(".css"):
+            return self._rewrite_css(filename, path, key)[1]
+        cached = self._hashes.get(filename)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        with open(path, "rb") as f:
+            body = f.read()
+        digest = hashlib.sha256(body).hexdigest()[:12]
+        with self._lock:
+            self._hashes[filename] = (key, digest)
+        return digest
+
+    def _rewrite_css(self, filename, path, key):
+        """Return a stylesheet with fingerprinted url()s, and its hash
+
+        It is rewritten when the file or any file it references changes.
+        """
+        cached = self._css.get(filename)
+        if (
+            cached is not None and cached[0] == key
+            and all(self.fingerprint(target) == digest for target, digest in cached[1])
+        ):
+            return cached[2], cached[3]
+        with open(path, encoding="utf-8") as f:
+            css = f.read()
+        references = []
+
+        def versioned(match):
+            quote, target = match.group(1), match.group(2)
+            digest = self.fingerprint(target)
+            references.append((target, digest))
+            suffix = f"?v={digest}" if digest else ""
+            return f"url({quote}/static/{target}{suffix}{quote})"
+
+        body = CSS_URL.sub(versioned, css).encode("utf-8")
+        digest = hashlib.sha256(body).hexdigest()[:12]
+        with self._lock:
+            self._css[filename] = (key, references, body, digest)
+        return body, digest
+
+    def add_fingerprint(self, endpoint, values):
+        if endpoint != "static" or "v" in values or "filename" not in values:
+            return
+        digest = self.fingerprint(values["filename"])
+        if digest:
+            values["v"] = digest
+
+    def serve(self, filename):
+        if filename.endswith(".css") and self.fingerprint(filename):
+            path = self._path(filename)
+            st = os.stat(path)
+            body, digest = self._rewrite_css(filename, path, (st.st_mtime_ns, st.st_size))
+            response = Response(body, mimetype="text/css")
+            response.set_etag(digest)
+            response.make_conditional(request)
+        else:
+            response = self._send_static_file(filename=filename)
+        if request.args.get("v") and request.args.get("v") == self.fingerprint(filename):
+            response.headers["Cache-Control"] = IMMUTABLE
+        else:
+            response.headers["Cache-Control"] = REVALIDATE
+        return response
@@ -0,0 +1,62 @@
+"""Shared fixtures
+
+app.py reads its configuration from the environment when it is imported,
+so a throwaway database with a small catalog is set up here first.
+"""
+import os
+import sqlite3
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import BUMP_CATALOG_VERSION_SQL, ensure_schema  # noqa: E402
+
+DATA_DIR = tempfile.mkdtemp(prefix="scent-showdown-tests-")
+DATABASE_PATH = os.path.join(DATA_DIR, "fragrances.db")
+
+# 8 fragrances, so a full tournament is 7 votes
+FRAGRANCES = [
+    (i, f"Fragrance {i}", f"https://fimgs.net/mdimg/perfume/375x500.{i}.jpg", None, f"Brand {i % 2}",
+     "niche" if i <= 4 else "designer")
+    for i in range(1, 9)
+]
+
+os.environ.update({
+    "DATABASE_PATH": DATABASE_PATH,
+    "SESSION_TYPE": "memory",
+    "TOURNAMENT_MODE": "session",
+    "IMAGE_CACHE_DIR": os.path.join(DATA_DIR, "image_cache"),
+    "SECRET_KEY": "test-secret",
+})
+for name in ("EXPORT_TOKEN", "METRICS_TOKEN", "PROFILE_SLOW_MS"):
+    os.environ.pop(name, None)
+
+ensure_schema(DATABASE_PATH)
+with sqlite3.connect(DATABASE_PATH) as conn:
+    conn.executemany(
+        "INSERT OR REPLACE INTO fragrances (id, name, image_url, local_image_path, brand, category) "
+        "VALUES (?, ?, ?, ?, ?, ?)",
+        FRAGRANCES
+    )
+    conn.execute(BUMP_CATALOG_VERSION_SQL)
+
+
+@pytest.fixture(scope="session")
+def web():
+    """The app module, imported once against the test database"""
+    import app
+    app.app.config["TESTING"] = True
+    return app
+
+
+@pytest.fixture
+def client(web):
+    return web.app.test_client()
+
+
+@pytest.fixture
+def token_mode(web, monkeypatch):
+    monkeypatch.setitem(web.app.config, "TOURNAMENT_MODE", "token")
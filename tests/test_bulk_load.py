@@ -0,0 +1,99 @@
+import sqlite3
+
+import pytest
+
+from bulk_load import BulkLoader, upsert_fragrances
+from database import CATALOG_VERSION_SQL, ensure_schema
+
+
+def fragrance(i, **fields):
+    return dict({"id": i, "name": f"Fragrance {i}", "image_url": f"https://img/{i}.jpg"}, **fields)
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / "fragrances.db")
+    ensure_schema(path)
+    return path
+
+
+def rows(db_path):
+    with sqlite3.connect(db_path) as conn:
+        return {
+            row[0]: row[1:]
+            for row in conn.execute("SELECT id, name, local_image_path, brand, category FROM fragrances")
+        }
+
+
+def catalog_version(db_path):
+    with sqlite3.connect(db_path) as conn:
+        row = conn.execute(CATALOG_VERSION_SQL).fetchone()
+    return row[0] if row else 0
+
+
+def test_counts_inserted_updated_and_unchanged(db_path):
+    assert upsert_fragrances(db_path, [fragrance(1), fragrance(2), fragrance(3)]) == {
+        "inserted": 3, "updated": 0, "unchanged": 0
+    }
+    batch = [fragrance(1), fragrance(2, name="Renamed"), fragrance(4)]
+    assert upsert_fragrances(db_path, batch) == {"inserted": 1, "updated": 1, "unchanged": 1}
+    assert rows(db_path)[2][0] == "Renamed"
+    assert len(rows(db_path)) == 4
+
+
+def test_unscraped_fields_keep_their_values(db_path):
+    upsert_fragrances(db_path, [fragrance(1, brand="Creed", category="niche", local_image_path="images/1.jpg")])
+    # A crawl that did not see the category or download the image changes nothing
+    assert upsert_fragrances(db_path, [fragrance(1)]) == {"inserted": 0, "updated": 0, "unchanged": 1}
+    assert rows(db_path)[1] == ("Fragrance 1", "images/1.jpg", "Creed", "niche")
+    assert upsert_fragrances(db_path, [fragrance(1, category="designer")])["updated"] == 1
+    assert rows(db_path)[1] == ("Fragrance 1", "images/1.jpg", "Creed", "designer")
+
+
+def test_later_rows_for_an_id_win(db_path):
+    counts = upsert_fragrances(db_path, [fragrance(1, name="First"), fragrance(1, name="Second")])
+    assert counts == {"inserted": 1, "updated": 0, "unchanged": 0}
+    assert rows(db_path)[1][0] == "Second"
+
+
+def test_wins_are_never_touched(db_path):
+    upsert_fragrances(db_path, [fragrance(1)])
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("INSERT INTO wins (id, wins) VALUES (1, 7)")
+    upsert_fragrances(db_path, [fragrance(1, name="Renamed")])
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute("SELECT wins FROM wins WHERE id = 1").fetchone() == (7,)
+
+
+def test_catalog_version_moves_only_on_changes(db_path):
+    upsert_fragrances(db_path, [fragrance(1)])
+    version = catalog_version(db_path)
+    assert version
+    upsert_fragrances(db_path, [fragrance(1)])
+    assert catalog_version(db_path) == version
+    upsert_fragrances(db_path, [fragrance(1, name="Renamed")])
+    assert catalog_version(db_path) > version
+
+
+def test_loader_keeps_running_totals(db_path):
+    loader = BulkLoader(db_path)
+    assert loader.flush() == {"inserted": 0, "updated": 0, "unchanged": 0}
+    loader.extend([fragrance(1), fragrance(2)])
+    assert len(loader) == 2
+    loader.flush()
+    assert len(loader) == 0
+    loader.extend([fragrance(2), fragrance(3, name="New")])
+    loader.add(fragrance(1, name="Renamed"))
+    assert loader.flush() == {"inserted": 1, "updated": 1, "unchanged": 1}
+    assert loader.counts == {"inserted": 3, "updated": 1, "unchanged": 1}
+
+
+def test_failed_flush_keeps_the_rows(db_path):
+    loader = BulkLoader(db_path)
+    loader.add(fragrance(1))
+    loader.add(fragrance(2, name=None))
+    with pytest.raises(sqlite3.IntegrityError):
+        loader.flush()
+    assert len(loader) == 2
+    assert rows(db_path) == {}
+    assert loader.counts == {"inserted": 0, "updated": 0, "unchanged": 0}
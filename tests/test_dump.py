@@ -0,0 +1,132 @@
+import json
+import sqlite3
+
+import pytest
+
+import dump
+from database import CATALOG_VERSION_SQL, ensure_schema
+
+FRAGRANCES = [
+    (1, "Aventus", "https://img/1.jpg", "images/1.jpg", "Creed", "niche"),
+    (2, 'Eau de "Café", Crème', None, None, None, None),
+    (3, "Terre d'Hermès\nÉdition", "https://img/3.jpg", None, "Hermès", "designer"),
+] + [(i, f"Fragrance {i}", None, None, "Brand", None) for i in range(10, 40)]
+
+
+@pytest.fixture
+def source(tmp_path):
+    path = str(tmp_path / "source.db")
+    ensure_schema(path)
+    with sqlite3.connect(path) as conn:
+        conn.executemany("INSERT INTO fragrances VALUES (?, ?, ?, ?, ?, ?)", FRAGRANCES)
+        conn.executemany("INSERT INTO wins (id, wins) VALUES (?, ?)", [(i, i * 2) for i in range(1, 20)])
+        conn.executemany("INSERT INTO matches (winner, loser) VALUES (?, ?)", [(i, i + 1) for i in range(25)])
+        conn.execute("DELETE FROM matches WHERE winner % 5 = 0")
+    return path
+
+
+def table(path, name):
+    with sqlite3.connect(path) as conn:
+        if name == "matches":
+            return conn.execute("SELECT rowid, winner, loser FROM matches ORDER BY rowid").fetchall()
+        columns = ", ".join(dump.COLUMNS[name])
+        return conn.execute(f"SELECT {columns} FROM {name} ORDER BY id").fetchall()
+
+
+def test_iter_rows_walks_every_batch(source):
+    rows = list(dump.iter_rows(source, "fragrances", batch_size=4))
+    assert rows == table(source, "fragrances")
+    assert list(dump.iter_rows(source, "fragrances", after=30, batch_size=4)) == rows[-9:]
+
+
+def test_iter_rows_of_a_missing_table(tmp_path):
+    path = str(tmp_path / "empty.db")
+    sqlite3.connect(path).close()
+    assert list(dump.iter_rows(path, "matches")) == []
+
+
+def test_unknown_table_or_format():
+    with pytest.raises(ValueError):
+        dump.check_table("sessions")
+    with pytest.raises(ValueError):
+        dump.check_table("wins", "xml")
+
+
+@pytest.mark.parametrize("fmt", dump.FORMATS)
+@pytest.mark.parametrize("name", list(dump.COLUMNS))
+def test_export_import_round_trip(source, tmp_path, name, fmt):
+    path = str(tmp_path / f"{name}.{fmt}")
+    target = str(tmp_path / "target.db")
+    assert dump.export_file(source, name, path) == len(table(source, name))
+    assert dump.import_file(target, name, path, batch_size=7) == len(table(source, name))
+    assert table(target, name) == table(source, name)
+    # Importing again changes nothing
+    dump.import_file(target, name, path, batch_size=7)
+    assert table(target, name) == table(source, name)
+
+
+def test_fragrance_import_bumps_the_catalog_version(source, tmp_path):
+    path = str(tmp_path / "fragrances.ndjson")
+    target = str(tmp_path / "target.db")
+    dump.export_file(source, "fragrances", path)
+    dump.import_file(target, "fragrances", path)
+    with sqlite3.connect(target) as conn:
+        assert conn.execute(CATALOG_VERSION_SQL).fetchone()[0] > 0
+
+
+@pytest.mark.parametrize("fmt", dump.FORMATS)
+def test_interrupted_export_resumes(source, tmp_path, fmt):
+    full = tmp_path / f"full.{fmt}"
+    dump.export_file(source, "fragrances", str(full))
+    expected = full.read_bytes()
+    # Cut off in the middle of a row
+    partial = tmp_path / f"partial.{fmt}"
+    partial.write_bytes(expected[:len(expected) // 2])
+    written = dump.export_file(source, "fragrances", str(partial), resume=True)
+    assert partial.read_bytes() == expected
+    assert 0 < written < len(FRAGRANCES)
+
+
+def test_resume_without_an_existing_file(source, tmp_path):
+    path = tmp_path / "fresh.ndjson"
+    assert dump.resume_point(str(path), "wins", "ndjson") is None
+    assert dump.export_file(source, "wins", str(path), resume=True) == 19
+
+
+def test_resumed_csv_has_no_second_header(source):
+    chunks = "".join(dump.export_chunks(source, "wins", "csv", after=17))
+    assert chunks == "18,36\n19,38\n"
+
+
+@pytest.fixture
+def export_token(web, monkeypatch):
+    monkeypatch.setattr(web, "EXPORT_TOKEN", "s3cret")
+    return {"Authorization": "Bearer s3cret"}
+
+
+def test_export_endpoint_is_off_without_a_token(client):
+    assert client.get("/export/fragrances").status_code == 404
+    assert client.get("/export/fragrances", headers={"Authorization": "Bearer "}).status_code == 404
+
+
+def test_export_endpoint(client, export_token):
+    assert client.get("/export/fragrances", headers={"Authorization": "Bearer wrong"}).status_code == 404
+    response = client.get("/export/fragrances", headers=export_token)
+    assert response.status_code == 200
+    assert response.mimetype == "application/x-ndjson"
+    ids = [json.loads(line)["id"] for line in response.get_data(as_text=True).splitlines()]
+    assert ids == list(range(1, 9))
+    response = client.get("/export/fragrances?format=csv&after=6", headers=export_token)
+    assert response.get_data(as_text=True).splitlines()[0].startswith("7,Fragrance 7,")
+    assert client.get("/export/sessions", headers=export_token).status_code == 404
+    assert client.get("/export/wins?format=xml", headers=export_token).status_code == 404
+
+
+def test_command_line(source, tmp_path, monkeypatch):
+    path = str(tmp_path / "wins.csv")
+    target = str(tmp_path / "target.db")
+    monkeypatch.setattr("sys.argv", ["dump.py", "--db", source, "export", "wins", "-o", path])
+    dump.main()
+    monkeypatch.setattr("sys.argv", ["dump.py", "--db", target, "import", "wins", path])
+    dump.main()
+    assert table(target, "wins") == table(source, "wins")
@@ -0,0 +1,101 @@
+import sqlite3
+
+import pytest
+
+from catalog import Catalog
+from database import BUMP_CATALOG_VERSION_SQL, Database, ensure_schema
+from leaderboard import Leaderboard, leaderboard_page
+
+WINS = {1: 5, 2: 5, 3: 3, 4: 3, 5: 3, 6: 1, 7: 0}
+
+
+@pytest.fixture
+def board(tmp_path):
+    path = str(tmp_path / "board.db")
+    ensure_schema(path)
+    with sqlite3.connect(path) as conn:
+        # 5 has wins but is no longer in the catalog
+        conn.executemany(
+            "INSERT INTO fragrances (id, name) VALUES (?, ?)",
+            [(i, f"Fragrance {i}") for i in WINS if i != 5]
+        )
+        conn.executemany("INSERT INTO wins (id, wins) VALUES (?, ?)", WINS.items())
+        conn.execute(BUMP_CATALOG_VERSION_SQL)
+    db = Database(path)
+    catalog = Catalog(db, path)
+    catalog.refresh()
+    return path, db, catalog
+
+
+def ranks(entries):
+    return [(entry["id"], entry["wins"], entry["rank"]) for entry in entries]
+
+
+EXPECTED = [(1, 5, 1), (2, 5, 1), (3, 3, 3), (4, 3, 3), (6, 1, 6), (7, 0, 7)]
+
+
+def test_single_page_has_competition_ranks(board):
+    _, db, catalog = board
+    entries, cursor = leaderboard_page(db, catalog, limit=50)
+    assert ranks(entries) == EXPECTED
+    assert cursor is None
+
+
+@pytest.mark.parametrize("limit", [1, 2, 3, 4])
+def test_pages_continue_the_ranking(board, limit):
+    _, db, catalog = board
+    entries, cursor = leaderboard_page(db, catalog, limit=limit)
+    pages = [entries]
+    while cursor is not None:
+        entries, cursor = leaderboard_page(db, catalog, cursor, limit=limit)
+        pages.append(entries)
+    assert ranks(entry for page in pages for entry in page) == EXPECTED
+
+
+def test_malformed_cursor_starts_over(board):
+    _, db, catalog = board
+    entries, _ = leaderboard_page(db, catalog, "not-a-cursor", limit=2)
+    assert ranks(entries) == EXPECTED[:2]
+
+
+
+def test_top_k_follows_the_wins_table(board):
+    path, db, catalog = board
+    leaderboard = Leaderboard(db, k=3, interval=0)
+    leaderboard.load()
+    version = leaderboard.version
+    assert [f["id"] for f in leaderboard.top(catalog)] == [1, 2, 3]
+
+    leaderboard.load()
+    assert leaderboard.version == version
+    with sqlite3.connect(path) as conn:
+        conn.execute("UPDATE wins SET wins = 9 WHERE id = 7")
+    render = lambda top: [(f["id"], f["wins"]) for f in top]
+    assert leaderboard.fragment(catalog, render) == [(7, 9), (1, 5), (2, 5)]
+    assert leaderboard.version == version + 1
+
+
+def test_entries_endpoint_pages_through_the_leaderboard(web, client):
+    with sqlite3.connect(web.DATABASE_PATH) as conn:
+        conn.executemany(
+            "INSERT INTO wins (id, wins) VALUES (?, 1) ON CONFLICT (id) DO UPDATE SET wins = wins + 1",
+            [(i,) for i in range(1, 9)]
+        )
+    whole = client.get("/leaderboard/entries?limit=100").get_json()
+    assert len(whole["entries"]) == 8
+    assert whole["next"] is None
+    entries, after = [], ""
+    while after is not None:
+        page = client.get(f"/leaderboard/entries?limit=3&after={after}").get_json()
+        assert len(page["entries"]) <= 3
+        entries.extend(page["entries"])
+        after = page["next"]
+    assert entries == whole["entries"]
+    assert client.get("/leaderboard?limit=0").status_code == 200
+
+
+def test_hall_of_fame_follows_flushed_wins(web, client):
+    web.win_recorder.record(3)
+    web.win_recorder.flush()
+    assert 3 in [f["id"] for f in web.leaderboard.top(web.catalog)]
+    assert client.get("/hall_of_fame").status_code == 200
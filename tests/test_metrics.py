@@ -0,0 +1,37 @@
+import pytest
+
+
+@pytest.fixture
+def metrics_token(web, monkeypatch):
+    monkeypatch.setattr(web.metrics, "token", "s3cret")
+    return "s3cret"
+
+
+def test_metrics_are_off_without_a_token(client):
+    assert client.get("/metrics").status_code == 404
+    assert client.get("/metrics", headers={"Authorization": "Bearer "}).status_code == 404
+
+
+def test_metrics_need_the_token(client, metrics_token):
+    assert client.get("/metrics").status_code == 404
+    assert client.get("/metrics", headers={"Authorization": "Bearer wrong"}).status_code == 404
+    # Loopback clients get nothing special behind a reverse proxy
+    assert client.get("/metrics", environ_base={"REMOTE_ADDR": "127.0.0.1"}).status_code == 404
+
+
+def test_metrics_report_requests_and_sql(client, metrics_token):
+    client.get("/")
+    response = client.get("/metrics", headers={"Authorization": f"Bearer {metrics_token}"})
+    assert response.status_code == 200
+    body = response.get_data(as_text=True)
+    assert 'http_request_duration_seconds_count{route="/"}' in body
+    assert "sql_queries_total" in body
+
+
+def test_metrics_report_the_session_store(client, metrics_token):
+    client.get("/")
+    body = client.get("/metrics", headers={"Authorization": f"Bearer {metrics_token}"}).get_data(as_text=True)
+    for name in ("hits", "misses", "writes", "deletes", "expired"):
+        assert f"session_store_{name}_total " in body
+    assert "session_store_hit_rate " in body
+    assert "session_store_size " in body
@@ -0,0 +1,137 @@
+import math
+import sqlite3
+import threading
+
+import numpy as np
+import pytest
+
+from database import ensure_schema
+from ratings import RatingEngine, bradley_terry, elo_update, load_matches
+
+
+class Names:
+    """Just enough of a Catalog for ranking"""
+
+    version = 0
+
+    def refresh(self):
+        pass
+
+    def get(self, fragrance_id):
+        return {"id": fragrance_id}
+
+
+def log_matches(db_path, matches):
+    with sqlite3.connect(db_path) as conn:
+        conn.executemany("INSERT INTO matches (winner, loser) VALUES (?, ?)", matches)
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / "ratings.db")
+    ensure_schema(path)
+    return path
+
+
+def test_elo_update_moves_points_from_loser_to_winner():
+    ratings = {}
+    elo_update(ratings, 1, 2)
+    assert ratings == {1: 1516.0, 2: 1484.0}
+    elo_update(ratings, 1, 2)
+    # The favourite gains less for beating the same opponent again
+    assert 1516.0 < ratings[1] < 1532.0
+    assert ratings[1] + ratings[2] == pytest.approx(3000.0)
+
+
+def test_bradley_terry_single_pair_matches_the_win_ratio():
+    ids, strengths = bradley_terry(np.array([1, 1, 2]), np.array([2, 2, 1]), prior=0.0, max_iter=5000, tol=1e-12)
+    assert ids.tolist() == [1, 2]
+    assert strengths[0] / strengths[1] == pytest.approx(2.0, rel=1e-6)
+
+
+def test_bradley_terry_orders_and_normalises_strengths():
+    winners = np.array([1, 1, 2, 2, 2, 2, 3])
+    losers = np.array([2, 3, 1, 3, 3, 3, 1])
+    ids, strengths = bradley_terry(winners, losers)
+    p = dict(zip(ids.tolist(), strengths.tolist()))
+    assert p[2] > p[1] > p[3]
+    assert math.exp(np.mean(np.log(strengths))) == pytest.approx(1.0)
+
+
+def test_bradley_terry_prior_keeps_undefeated_items_finite():
+    ids, strengths = bradley_terry(np.array([1, 1, 1]), np.array([2, 3, 4]))
+    assert np.all(np.isfinite(strengths))
+    assert ids[np.argmax(strengths)] == 1
+
+
+def test_bradley_terry_without_matches():
+    ids, strengths = bradley_terry(np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64))
+    assert len(ids) == 0 and len(strengths) == 0
+
+
+def test_load_matches_after_a_rowid(db_path):
+    log_matches(db_path, [(1, 2), (3, 4), (5, 6)])
+    rowids, winners, losers = load_matches(db_path, after=1)
+    assert rowids.tolist() == [2, 3]
+    assert winners.tolist() == [3, 5]
+    assert losers.tolist() == [4, 6]
+
+
+def test_load_replays_the_match_log(db_path):
+    log_matches(db_path, [(1, 2), (1, 3), (2, 3)])
+    engine = RatingEngine(db_path)
+    engine.load()
+    expected = {}
+    for winner, loser in [(1, 2), (1, 3), (2, 3)]:
+        elo_update(expected, winner, loser)
+    assert engine.elo == expected
+    assert [f["id"] for f in engine.top("elo", Names(), k=3)] == [1, 2, 3]
+    assert [f["id"] for f in engine.top("bt", Names(), k=3)] == [1, 2, 3]
+
+
+def test_workers_converge_on_the_match_log(db_path):
+    first, second = RatingEngine(db_path), RatingEngine(db_path)
+    first.load()
+    second.load()
+    # first records a vote and its WinRecorder flushes it to the log
+    first.record(1, 2)
+    log_matches(db_path, [(1, 2)])
+    first.sync()
+    assert second.elo == {}
+    second.sync()
+    assert first.elo == second.elo == {1: 1516.0, 2: 1484.0}
+    # Nothing new: the ratings stay as they are
+    version = second.elo_version
+    second.sync()
+    assert second.elo_version == version
+
+
+def test_elo_fragment_picks_up_other_workers_matches(db_path):
+    engine = RatingEngine(db_path, sync_interval=0)
+    engine.load()
+    render = lambda top: [f["id"] for f in top]
+    assert engine.fragment("elo", Names(), render) == []
+    log_matches(db_path, [(7, 8)])
+    assert engine.fragment("elo", Names(), render) == [7, 8]
+
+
+def test_top_while_votes_are_recorded(db_path):
+    engine = RatingEngine(db_path)
+    engine.load()
+    errors = []
+
+    def vote():
+        # Every vote adds two new ids to the ratings
+        for i in range(0, 40000, 2):
+            engine.record(i, i + 1)
+
+    voter = threading.Thread(target=vote)
+    voter.start()
+    try:
+        while voter.is_alive():
+            engine.top("elo", Names())
+    except RuntimeError as e:
+        errors.append(e)
+    finally:
+        voter.join()
+    assert errors == []
@@ -0,0 +1,147 @@
+"""Crawls of a recorded listing, replayed offline and served by fixture_server
+
+No browser is launched: the fake scraper's "browser" fetches listing pages
+over its aiohttp session, so everything else runs as in a live crawl.
+"""
+import asyncio
+import os
+import sqlite3
+
+import pytest
+from aiohttp import web
+
+import fixture_server
+from http_cache import ResponseCache
+from main import LISTING_URL, FragranceScraper
+from pipeline import HostRateLimiter
+
+IMAGE_URL = "https://fimgs.net/mdimg/perfume/375x500.{id}.jpg"
+
+LISTING = "<html><body>" + "".join(
+    f'<div class="card-product"><a href="/perfume/Brand-{i % 2}/Name-{i}.html">Name {i}</a>'
+    f'<img src="{IMAGE_URL.format(id=i)}"></div>'
+    for i in (101, 102, 103)
+) + "</body></html>"
+
+# What a challenge or block page looks like to the parser
+NO_CARDS = "<html><body><p>Just a moment...</p></body></html>"
+
+
+class FakeContext:
+    async def cookies(self):
+        return []
+
+    async def add_cookies(self, cookies):
+        pass
+
+    async def new_page(self):
+        return FakePage(self)
+
+
+class FakePage:
+    def __init__(self, context):
+        self.context = context
+
+
+class FakeScraper(FragranceScraper):
+    async def setup_browser(self):
+        self.context = FakeContext()
+        self.contexts.append(self.context)
+        self.page = FakePage(self.context)
+        self.session = self.new_session()
+
+    async def new_context(self):
+        context = FakeContext()
+        self.contexts.append(context)
+        return context
+
+    async def load_listing(self, page, url):
+        async with self.session.get(url) as response:
+            return await response.text() if response.status == 200 else None
+
+
+@pytest.fixture
+def recording(tmp_path, monkeypatch):
+    """A response cache holding listing pages 1 (three cards) and 2 (none) and the bottles"""
+    # Images are saved under ./static/images
+    monkeypatch.chdir(tmp_path)
+    cache = ResponseCache(str(tmp_path / "http_cache"), mode="record")
+    html = {"Content-Type": "text/html; charset=utf-8"}
+    cache.store(LISTING_URL.format(page=1), 200, html, LISTING.encode())
+    cache.store(LISTING_URL.format(page=2), 200, html, NO_CARDS.encode())
+    for i in (101, 102, 103):
+        cache.store(IMAGE_URL.format(id=i), 200, {"Content-Type": "image/jpeg"}, b"\xff\xd8" + bytes([i]) * 64)
+    return tmp_path / "http_cache"
+
+
+def scraper(db_path, cache):
+    return FakeScraper(fetch_workers=1, limiter=HostRateLimiter(1000, 100), db_path=str(db_path), cache=cache)
+
+
+def crawl_results(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        fragrances = conn.execute(
+            "SELECT id, name, brand, local_image_path FROM fragrances ORDER BY id"
+        ).fetchall()
+        frontier = dict(
+            (page, (status, last_error))
+            for page, status, last_error in conn.execute("SELECT page, status, last_error FROM crawl_frontier")
+        )
+    finally:
+        conn.close()
+    return fragrances, frontier
+
+
+def check_crawl(db_path):
+    fragrances, frontier = crawl_results(db_path)
+    assert [(row[0], row[1], row[2]) for row in fragrances] == [
+        (101, "Name 101", "Brand 1"),
+        (102, "Name 102", "Brand 0"),
+        (103, "Name 103", "Brand 1"),
+    ]
+    for row in fragrances:
+        assert row[3] and os.path.getsize(row[3]) == 66
+    assert frontier == {1: ("done", None), 2: ("failed", "no cards")}
+
+
+def test_replay(recording, tmp_path):
+    cache = ResponseCache(str(recording), mode="replay")
+    crawler = scraper(tmp_path / "replay.db", cache)
+    asyncio.run(crawler.scrape_fragrances(max_pages=2, restart=True))
+    assert crawler.browser is None
+    # Both listings and all three bottles came from the recording
+    assert cache.stats["hits"] == 5
+    check_crawl(tmp_path / "replay.db")
+
+
+def test_unrecorded_page_fails_in_replay(recording, tmp_path):
+    cache = ResponseCache(str(recording), mode="replay")
+    asyncio.run(scraper(tmp_path / "replay.db", cache).scrape_fragrances(max_pages=3, restart=True))
+    _, frontier = crawl_results(tmp_path / "replay.db")
+    assert frontier[3][0] == "failed"
+    assert "Not in the response cache" in frontier[3][1]
+
+
+def test_crawl_through_fixture_server(recording, tmp_path):
+    async def crawl():
+        runner = web.AppRunner(fixture_server.make_app(ResponseCache(str(recording), mode="replay")))
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = runner.addresses[0][1]
+        try:
+            crawler = scraper(tmp_path / "fixture.db", ResponseCache())
+            await crawler.scrape_fragrances(
+                max_pages=2,
+                restart=True,
+                listing_url=f"http://127.0.0.1:{port}/www.fragrantica.com/search/?page={{page}}"
+            )
+            return crawler
+        finally:
+            await runner.cleanup()
+
+    crawler = asyncio.run(crawl())
+    # The bottle URLs were rewritten to the fixture server and downloaded from it
+    assert crawler.images.stats["downloaded"] == 3
+    check_crawl(tmp_path / "fixture.db")
@@ -0,0 +1,96 @@
+import pytest
+
+from search import SearchIndex, normalize, trigrams, within_distance
+
+NAMES = {
+    1: "Aventus",
+    2: "Aventus for Her",
+    3: "Santal 33",
+    4: "Baccarat Rouge 540",
+    5: "Rouge Malachite",
+    6: "Eau de Café Crème",
+    7: "Terre d'Hermès",
+}
+
+
+class Records:
+    """Just enough of a Catalog for the index"""
+
+    def __init__(self, names):
+        self.version = 1
+        self.records = {i: (name, None) for i, name in names.items()}
+
+    def refresh(self):
+        pass
+
+
+@pytest.fixture
+def index():
+    return SearchIndex(Records(NAMES))
+
+
+def ids(results):
+    return [fragrance_id for fragrance_id, _ in results]
+
+
+def test_normalize_strips_accents_and_punctuation():
+    assert normalize("Terre d'Hermès") == ["terre", "d", "hermes"]
+    assert normalize("  ") == []
+
+
+def test_trigrams_are_padded_at_the_start():
+    assert trigrams("ab") == {"  a", " ab"}
+
+
+@pytest.mark.parametrize("a, b, limit, expected", [
+    ("rouge", "rouge", 1, 0),
+    ("rogue", "rouge", 2, 2),
+    ("rogue", "rouge", 1, None),
+    ("santal", "sant", 1, None),
+    ("aventsu", "aventus", 2, 2),
+])
+def test_within_distance(a, b, limit, expected):
+    assert within_distance(a, b, limit) == expected
+
+
+def test_prefixes_match_and_names_starting_with_the_query_come_first(index):
+    assert ids(index.search("rou")) == [5, 4]
+    assert ids(index.search("aven")) == [1, 2]
+    assert index.search("aven", limit=1) == [(1, False)]
+
+
+def test_every_word_must_match(index):
+    assert ids(index.search("rouge bacc")) == [4]
+    assert index.search("rouge santal") == []
+    assert index.search("!!") == []
+
+
+def test_accents_do_not_matter(index):
+    assert ids(index.search("hermes")) == [7]
+    assert ids(index.search("CAFÉ crème")) == [6]
+
+
+def test_typos_fall_back_to_trigrams(index):
+    assert index.search("santl") == [(3, True)]
+    # A typo mid-word still autocompletes
+    assert ids(index.search("bacarat")) == [4]
+    assert index.search("avnetus") == [(1, True), (2, True)]
+    # Short words are only matched as prefixes
+    assert index.search("xy") == []
+
+
+def test_index_is_rebuilt_when_the_catalog_changes(index):
+    assert index.search("oud") == []
+    index.catalog.records[8] = ("Oud Wood", None)
+    assert index.search("oud") == []
+    index.catalog.version += 1
+    assert ids(index.search("oud")) == [8]
+
+
+def test_search_endpoint(client):
+    results = client.get("/search?q=fragrnce 3").get_json()["results"]
+    assert [r["id"] for r in results] == [3]
+    assert results[0]["fuzzy"] is True
+    assert "wins" in results[0] and "rating" in results[0]
+    assert len(client.get("/search?q=fragrance&limit=0").get_json()["results"]) == 1
+    assert client.get("/search").get_json()["results"] == []
@@ -0,0 +1,124 @@
+import os
+import secrets
+import time
+
+import pytest
+from flask import Flask, session
+
+from session_store import FileStore, MemoryStore, SQLiteStore, init_session, valid_sid
+
+
+@pytest.fixture(params=["memory", "sqlite", "filesystem"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        return MemoryStore(ttl=60)
+    if request.param == "sqlite":
+        return SQLiteStore(str(tmp_path / "sessions.db"), ttl=60)
+    return FileStore(str(tmp_path / "sessions"), ttl=60)
+
+
+def sid():
+    return secrets.token_urlsafe(32)
+
+
+def test_valid_sid():
+    assert valid_sid(sid())
+    assert not valid_sid(None)
+    assert not valid_sid("../../etc/passwd")
+    assert not valid_sid(sid()[:-1])
+
+
+def test_round_trip(store):
+    first, second = sid(), sid()
+    assert store.get(first) is None
+    store.set(first, b"one")
+    store.set(second, b"two")
+    store.set(first, b"uno")
+    assert store.get(first) == b"uno"
+    assert store.get(second) == b"two"
+    assert store.size() == 2
+    store.delete(second)
+    assert store.get(second) is None
+    assert store.size() == 1
+    stats = store.stats.as_dict(store.size())
+    assert (stats["hits"], stats["misses"], stats["writes"], stats["deletes"]) == (2, 2, 3, 1)
+    assert stats["hit_rate"] == 0.5
+    assert stats["bytes_written"] == 9
+
+
+def test_expired_session_is_not_returned(store, monkeypatch):
+    key = sid()
+    store.set(key, b"stale")
+    now = time.time()
+    monkeypatch.setattr("session_store.time.time", lambda: now + 61)
+    assert store.get(key) is None
+
+
+def test_sqlite_sweep_deletes_expired_rows_in_batches(tmp_path):
+    store = SQLiteStore(str(tmp_path / "sessions.db"), ttl=60, sweep_batch=2)
+    for _ in range(5):
+        store.set(sid(), b"x")
+    live = sid()
+    store.ttl = 600
+    store.set(live, b"y")
+    store.sweep(time.time() + 61)
+    assert store.stats.expired == 5
+    assert store.size() == 1
+    assert store.get(live) == b"y"
+
+
+def test_sqlite_store_is_shared_by_workers(tmp_path):
+    path = str(tmp_path / "sessions.db")
+    key = sid()
+    SQLiteStore(path, ttl=60).set(key, b"shared")
+    assert SQLiteStore(path, ttl=60).get(key) == b"shared"
+
+
+def test_file_sweep_removes_expired_then_oldest_files(tmp_path):
+    store = FileStore(str(tmp_path / "sessions"), ttl=60, threshold=2)
+    keys = [sid() for _ in range(4)]
+    for age, key in zip((120, 30, 20, 10), keys):
+        store.set(key, b"x")
+        mtime = time.time() - age
+        os.utime(os.path.join(store.directory, key), (mtime, mtime))
+    store.sweep()
+    assert store.stats.expired == 1
+    assert sorted(os.listdir(store.directory)) == sorted(keys[2:])
+
+
+def test_file_store_rejects_a_path_as_sid(tmp_path):
+    store = FileStore(str(tmp_path / "sessions"), ttl=60)
+    with pytest.raises(ValueError):
+        store.set("../escape", b"x")
+
+
+@pytest.mark.parametrize("backend", ["memory", "sqlite", "filesystem"])
+def test_flask_session_round_trip(backend, tmp_path):
+    app = Flask(__name__)
+    app.config.update(
+        SECRET_KEY="test",
+        SESSION_TYPE=backend,
+        SESSION_SQLITE_PATH=str(tmp_path / "sessions.db"),
+        SESSION_FILE_DIR=str(tmp_path / "sessions"),
+    )
+    store = init_session(app)
+
+    @app.route("/count")
+    def count():
+        session["n"] = session.get("n", 0) + 1
+        return str(session["n"])
+
+    @app.route("/clear")
+    def clear():
+        session.clear()
+        return ""
+
+    client = app.test_client()
+    assert client.get("/count").data == b"1"
+    assert client.get("/count").data == b"2"
+    assert store.size() == 1
+    client.get("/clear")
+    assert store.size() == 0
+    # A cookie that is not a session id never reaches the store
+    client.set_cookie("session", "../../etc/passwd")
+    assert client.get("/count").data == b"1"
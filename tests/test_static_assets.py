@@ -0,0 +1,89 @@
+import os
+
+import pytest
+from flask import Flask, url_for
+
+from static_assets import IMMUTABLE, REVALIDATE, StaticAssets
+
+
+@pytest.fixture
+def site(tmp_path):
+    static = tmp_path / "static"
+    (static / "fonts").mkdir(parents=True)
+    (static / "app.js").write_text("console.log('hi')")
+    (static / "fonts" / "serif.woff2").write_bytes(b"font v1")
+    (static / "style.css").write_text(
+        "@font-face { src: url('/static/fonts/serif.woff2') }\n"
+        "body { background: url(/static/missing.png) }\n"
+    )
+    app = Flask(__name__, static_folder=str(static))
+    return app, StaticAssets(app), static
+
+
+def static_url(app, filename):
+    with app.test_request_context():
+        return url_for("static", filename=filename)
+
+
+def test_urls_carry_the_content_hash(site):
+    app, assets, _ = site
+    assert static_url(app, "app.js") == f"/static/app.js?v={assets.fingerprint('app.js')}"
+    assert static_url(app, "missing.js") == "/static/missing.js"
+    assert assets.fingerprint("../../etc/passwd") is None
+
+
+def test_fingerprint_follows_the_content(site):
+    _, assets, static = site
+    before = assets.fingerprint("app.js")
+    (static / "app.js").write_text("console.log('bye')")
+    os.utime(static / "app.js", ns=(0, 10**18))
+    assert assets.fingerprint("app.js") != before
+
+
+def test_fingerprinted_request_is_immutable(site):
+    app, _, _ = site
+    client = app.test_client()
+    response = client.get(static_url(app, "app.js"))
+    assert response.headers["Cache-Control"] == IMMUTABLE
+    response.close()
+    for url in ("/static/app.js", "/static/app.js?v=stale"):
+        response = client.get(url)
+        assert response.headers["Cache-Control"] == REVALIDATE
+        response.close()
+
+
+def test_revalidation_returns_304(site):
+    app, _, _ = site
+    client = app.test_client()
+    for filename in ("app.js", "style.css"):
+        response = client.get(f"/static/{filename}")
+        etag = response.headers["ETag"]
+        response.close()
+        response = client.get(f"/static/{filename}", headers={"If-None-Match": etag})
+        assert response.status_code == 304
+        response.close()
+
+
+def test_stylesheet_references_are_fingerprinted(site):
+    app, assets, static = site
+    client = app.test_client()
+    css = client.get("/static/style.css").get_data(as_text=True)
+    font = assets.fingerprint("fonts/serif.woff2")
+    assert f"url('/static/fonts/serif.woff2?v={font}')" in css
+    assert "url(/static/missing.png)" in css
+
+    # A new font changes the stylesheet, so its URL changes too
+    before = static_url(app, "style.css")
+    (static / "fonts" / "serif.woff2").write_bytes(b"font v2 ")
+    font = assets.fingerprint("fonts/serif.woff2")
+    assert static_url(app, "style.css") != before
+    css = client.get(static_url(app, "style.css")).get_data(as_text=True)
+    assert f"url('/static/fonts/serif.woff2?v={font}')" in css
+
+
+def test_pages_link_fingerprinted_assets(web, client):
+    page = client.get("/").get_data(as_text=True)
+    digest = web.static_assets.fingerprint("styles.css")
+    assert f'href="/static/styles.css?v={digest}"' in page
+    response = client.get(f"/static/styles.css?v={digest}")
+    assert response.headers["Cache-Control"] == IMMUTABLE
@@ -0,0 +1,172 @@
+import os
+import sqlite3
+import threading
+import time
+
+import pytest
+from PIL import Image
+
+from database import BUMP_CATALOG_VERSION_SQL
+from thumbnails import Thumbnails, negotiate_format, snap_width
+
+
+@pytest.fixture
+def sources(tmp_path):
+    """Three 375x500 bottles with different content"""
+    paths = []
+    for i, color in enumerate(("red", "green", "blue")):
+        path = tmp_path / f"bottle{i}.png"
+        Image.new("RGB", (375, 500), color).save(path)
+        paths.append(str(path))
+    return paths
+
+
+def test_snap_width():
+    assert snap_width(1) == 96
+    assert snap_width(96) == 96
+    assert snap_width(100) == 192
+    assert snap_width(5000) == 375
+
+
+def test_negotiate_format():
+    assert negotiate_format("png", "image/webp") == "png"
+    assert negotiate_format(None, "image/avif,image/webp,*/*") == "webp"
+    assert negotiate_format("gif", "image/png") == "jpeg"
+    assert negotiate_format(None, None) == "jpeg"
+
+
+def test_variant_is_generated_once(tmp_path, sources):
+    thumbnails = Thumbnails(tmp_path / "cache")
+    path = thumbnails.get(sources[0], 96, "webp")
+    with Image.open(path) as image:
+        assert image.format == "WEBP"
+        assert image.size == (96, 128)
+    assert thumbnails.get(sources[0], 96, "webp") == path
+    assert thumbnails.stats["generated"] == 1
+    assert thumbnails.stats["hits"] == 1
+
+
+def test_missing_source(tmp_path):
+    thumbnails = Thumbnails(tmp_path / "cache")
+    assert thumbnails.get(str(tmp_path / "gone.png"), 96, "jpeg") is None
+    assert thumbnails.open(str(tmp_path / "gone.png"), 96, "jpeg") is None
+
+
+def test_least_recently_used_is_evicted(tmp_path, sources):
+    thumbnails = Thumbnails(tmp_path / "cache")
+    first = thumbnails.get(sources[0], 192, "png")
+    size = first.stat().st_size
+    # Room for about two variants
+    thumbnails.max_bytes = size * 2 + size // 2
+    second = thumbnails.get(sources[1], 192, "png")
+    thumbnails.get(sources[0], 192, "png")
+    third = thumbnails.get(sources[2], 192, "png")
+    assert thumbnails.stats["evicted"] == 1
+    assert not second.exists()
+    assert first.exists() and third.exists()
+    assert thumbnails._bytes == sum(p.stat().st_size for p in (first, third))
+
+
+def test_order_survives_a_restart(tmp_path, sources):
+    thumbnails = Thumbnails(tmp_path / "cache")
+    paths = [thumbnails.get(source, 96, "png") for source in sources]
+    for age, path in zip((30, 10, 20), paths):
+        os.utime(path, (time.time() - age, time.time() - age))
+    (tmp_path / "cache" / "leftover.part").write_bytes(b"half a file")
+    max_bytes = sum(p.stat().st_size for p in paths) - 1
+    restarted = Thumbnails(tmp_path / "cache", max_bytes=max_bytes)
+    # The oldest by mtime goes first; unfinished writes are removed
+    assert not paths[0].exists()
+    assert paths[1].exists() and paths[2].exists()
+    assert not (tmp_path / "cache" / "leftover.part").exists()
+    assert list(restarted._files) == [paths[2].name, paths[1].name]
+
+
+def test_concurrent_requests_share_one_resize(tmp_path, sources, monkeypatch):
+    thumbnails = Thumbnails(tmp_path / "cache")
+    generate = thumbnails._generate
+    started = threading.Event()
+
+    def slow_generate(*args):
+        started.set()
+        time.sleep(0.2)
+        return generate(*args)
+
+    monkeypatch.setattr(thumbnails, "_generate", slow_generate)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(thumbnails.get(sources[0], 288, "jpeg")))]
+    threads[0].start()
+    started.wait()
+    for _ in range(5):
+        thread = threading.Thread(target=lambda: results.append(thumbnails.get(sources[0], 288, "jpeg")))
+        thread.start()
+        threads.append(thread)
+    for thread in threads:
+        thread.join()
+    assert len(set(results)) == 1 and results[0].exists()
+    assert thumbnails.stats["generated"] == 1
+    assert thumbnails.stats["coalesced"] == 5
+
+
+def test_variant_evicted_by_another_worker_is_regenerated(tmp_path, sources):
+    first = Thumbnails(tmp_path / "cache")
+    second = Thumbnails(tmp_path / "cache")
+    path = first.get(sources[0], 96, "webp")
+    second._load()
+    os.remove(path)
+    assert second.get(sources[0], 96, "webp") == path
+    assert path.exists()
+    assert second.stats["generated"] == 1
+    assert second._bytes == path.stat().st_size
+
+
+def test_open_survives_eviction_before_and_during_the_send(tmp_path, sources, monkeypatch):
+    thumbnails = Thumbnails(tmp_path / "cache")
+    get = thumbnails.get
+    calls = []
+
+    def get_then_evict(*args):
+        path = get(*args)
+        calls.append(path)
+        if len(calls) == 1:
+            # Another worker evicts it right after this one looked it up
+            os.remove(path)
+        return path
+
+    monkeypatch.setattr(thumbnails, "get", get_then_evict)
+    image = thumbnails.open(sources[0], 96, "png")
+    try:
+        assert len(calls) == 2
+        os.remove(calls[1])
+        # Still readable once open
+        assert image.read(8) == b"\x89PNG\r\n\x1a\n"
+    finally:
+        image.close()
+
+
+def test_image_endpoint(web, client, sources):
+    with sqlite3.connect(web.DATABASE_PATH) as conn:
+        conn.execute("UPDATE fragrances SET local_image_path = ? WHERE id = 8", (sources[0],))
+        conn.execute(BUMP_CATALOG_VERSION_SQL)
+    web.catalog.refresh(force=True)
+
+    response = client.get("/images/8?w=100&fmt=jpeg")
+    assert response.status_code == 200
+    assert response.mimetype == "image/jpeg"
+    etag = response.headers["ETag"]
+    assert "max-age=86400" in response.headers["Cache-Control"]
+    assert client.get("/images/8?w=100&fmt=jpeg", headers={"If-None-Match": etag}).status_code == 304
+
+    response = client.get("/images/8", headers={"Accept": "image/webp"})
+    assert response.mimetype == "image/webp"
+    assert "Accept" in response.headers["Vary"]
+
+    # Evicted by another worker: generated again instead of a 500
+    for name in os.listdir(web.thumbnails.directory):
+        os.remove(web.thumbnails.directory / name)
+    assert client.get("/images/8?w=100&fmt=jpeg").status_code == 200
+
+    response = client.get("/images/7")
+    assert response.status_code == 302
+    assert response.location == "https://fimgs.net/mdimg/perfume/375x500.7.jpg"
+    assert client.get("/images/999").status_code == 404
@@ -0,0 +1,95 @@
+import time
+
+import pytest
+
+from database import Database, ensure_schema
+from tournament import Bracket, RoundClaims, TokenError, TournamentTokens
+
+
+@pytest.mark.parametrize("n", [2, 3, 8, 100, 1000])
+def test_bracket_is_a_permutation_of_the_ids(n):
+    ids = tuple(range(10, 10 + n))
+    bracket = Bracket(ids, seed=12345)
+    assert len(bracket) == n
+    assert sorted(bracket[:]) == list(ids)
+
+
+def test_bracket_order_depends_only_on_the_seed():
+    ids = tuple(range(500))
+    assert Bracket(ids, 1)[:] == Bracket(ids, 1)[:]
+    assert Bracket(ids, 1)[:] != Bracket(ids, 2)[:]
+
+
+def test_bracket_indexing():
+    ids = tuple(range(20))
+    bracket = Bracket(ids, 7)
+    assert bracket[-1] == bracket[19]
+    assert bracket[3:6] == [bracket[3], bracket[4], bracket[5]]
+    with pytest.raises(IndexError):
+        bracket[20]
+
+
+STATE = {"seed": 42, "cursor": 5, "champion": 3, "size": 8, "pool": "category:niche"}
+
+
+def test_token_round_trip():
+    tokens = TournamentTokens("secret")
+    assert tokens.load(tokens.dump(STATE)) == STATE
+
+
+def test_token_from_another_key_is_rejected():
+    token = TournamentTokens("other").dump(STATE)
+    with pytest.raises(TokenError):
+        TournamentTokens("secret").load(token)
+
+
+@pytest.mark.parametrize("token", ["", "garbage", "a.b.c", "e30.AAAA"])
+def test_malformed_token_is_rejected(token):
+    with pytest.raises(TokenError):
+        TournamentTokens("secret").load(token)
+
+
+def test_tampered_token_is_rejected():
+    tokens = TournamentTokens("secret")
+    signature = tokens.dump(STATE).split(".")[1]
+    forged = TournamentTokens("secret").dump(dict(STATE, champion=4)).split(".")[0]
+    with pytest.raises(TokenError):
+        tokens.load(f"{forged}.{signature}")
+
+
+def test_expired_token_is_rejected(monkeypatch):
+    tokens = TournamentTokens("secret", max_age=60)
+    token = tokens.dump(STATE)
+    now = time.time()
+    monkeypatch.setattr("tournament.time.time", lambda: now + 61)
+    with pytest.raises(TokenError, match="expired"):
+        tokens.load(token)
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / "claims.db")
+    ensure_schema(path)
+    return path
+
+
+def test_round_is_claimed_once_across_processes(db_path):
+    # Two workers, each with its own connections to the same database
+    first = RoundClaims(Database(db_path), max_age=60)
+    second = RoundClaims(Database(db_path), max_age=60)
+    assert first.claim(STATE)
+    assert not first.claim(STATE)
+    assert not second.claim(STATE)
+    assert second.claim(dict(STATE, cursor=6))
+    assert second.claim(dict(STATE, seed=43))
+
+
+def test_claims_older_than_a_token_are_swept(db_path, monkeypatch):
+    db = Database(db_path)
+    claims = RoundClaims(db, max_age=60, sweep_interval=0)
+    claims.claim(STATE)
+    now = time.time()
+    monkeypatch.setattr("tournament.time.time", lambda: now + 61)
+    claims.claim(dict(STATE, cursor=6))
+    rows = db.query("SELECT cursor FROM token_rounds")
+    assert rows == [{"cursor": 6}]
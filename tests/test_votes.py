@@ -0,0 +1,235 @@
+import re
+
+import pytest
+
+from database import Database
+from tournament import RoundClaims
+
+OPTION_ID = re.compile(r'data-id="(\d+)"')
+TOKEN = re.compile(r'let token = "([^"]+)"')
+
+
+def start(client, query=""):
+    """Start a tournament; returns the two challengers and the token, if any"""
+    page = client.get(f"/{query}").get_data(as_text=True)
+    ids = [int(i) for i in OPTION_ID.findall(page)][:2]
+    token = TOKEN.search(page)
+    return ids, token.group(1) if token else None
+
+
+def wins(web, fragrance_id):
+    web.win_recorder.flush()
+    rows = web.db.query("SELECT wins FROM wins WHERE id = ?", (fragrance_id,))
+    return rows[0]["wins"] if rows else 0
+
+
+def matches(web):
+    web.win_recorder.flush()
+    return web.db.query("SELECT COUNT(*) AS n FROM matches")[0]["n"]
+
+
+def play(client, ids, token=None):
+    """Vote for the first challenger every round; returns the last response"""
+    while True:
+        vote = {"voted_id": ids[0], "displayed_ids": ids}
+        if token:
+            vote["token"] = token
+        response = client.post("/save_vote", json=vote)
+        assert response.status_code == 200, response.get_json()
+        data = response.get_json()
+        if "final_champion" in data:
+            return response
+        ids = [fragrance["id"] for fragrance in data["next_round"]]
+        token = data.get("token")
+
+
+def test_session_holds_only_the_bracket_seed_and_cursor(client):
+    ids, token = start(client)
+    assert token is None
+    with client.session_transaction() as session:
+        assert set(session) == {"seed", "cursor", "champion", "size", "pool"}
+        assert session["cursor"] == 2
+        assert session["champion"] is None
+
+
+def test_full_tournament_records_one_win(web, client):
+    ids, _ = start(client)
+    before_wins, before_matches = wins(web, ids[0]), matches(web)
+    data = play(client, ids).get_json()
+    assert data["message"] == "Tournament complete."
+    assert data["final_champion"]["id"] == ids[0]
+    assert wins(web, ids[0]) == before_wins + 1
+    assert matches(web) == before_matches + 7
+    # The session's tournament is over
+    response = client.post("/save_vote", json={"voted_id": ids[0], "displayed_ids": ids})
+    assert response.status_code == 400
+
+
+def test_every_fragrance_plays_once(client):
+    ids, _ = start(client)
+    seen = set(ids)
+    while True:
+        data = client.post("/save_vote", json={"voted_id": ids[1], "displayed_ids": ids}).get_json()
+        if "final_champion" in data:
+            break
+        ids = [fragrance["id"] for fragrance in data["next_round"]]
+        assert ids[1] not in seen
+        seen.add(ids[1])
+    assert seen == set(range(1, 9))
+
+
+def test_category_tournament_stays_in_its_pool(client):
+    page = client.get("/").get_data(as_text=True)
+    assert 'href="/?category=niche"' in page
+    ids, _ = start(client, "?category=niche")
+    assert set(ids) <= {1, 2, 3, 4}
+    with client.session_transaction() as session:
+        assert session["size"] == 4
+    data = play(client, ids).get_json()
+    assert data["final_champion"]["id"] in {1, 2, 3, 4}
+
+
+def test_brand_tournament_stays_in_its_pool(client):
+    ids, _ = start(client, "?brand=Brand 1")
+    assert set(ids) <= {1, 3, 5, 7}
+    assert play(client, ids).get_json()["final_champion"]["id"] in {1, 3, 5, 7}
+
+
+def test_pool_that_is_too_small_is_rejected(client):
+    assert client.get("/?category=unknown").status_code == 404
+
+
+@pytest.mark.parametrize("vote", [
+    {},
+    {"voted_id": 1, "displayed_ids": [1]},
+    {"voted_id": "x", "displayed_ids": [1, 2]},
+    {"voted_id": 999, "displayed_ids": [999, 1]},
+])
+def test_invalid_votes_are_rejected(client, vote):
+    start(client)
+    assert client.post("/save_vote", json=vote).status_code == 400
+
+
+def test_vote_for_another_round_is_rejected(web, client):
+    ids, _ = start(client)
+    other = next(i for i in web.catalog.ids if i not in ids)
+    response = client.post("/save_vote", json={"voted_id": ids[0], "displayed_ids": [ids[0], other]})
+    assert response.status_code == 400
+    assert response.get_json()["error"] == "Vote does not match the current round"
+
+
+def test_vote_without_a_tournament_is_rejected(client):
+    response = client.post("/save_vote", json={"voted_id": 1, "displayed_ids": [1, 2]})
+    assert response.status_code == 400
+    assert response.get_json()["error"] == "No tournament in progress"
+
+
+def test_upcoming_lists_the_next_challengers(client):
+    ids, _ = start(client)
+    data = client.get("/upcoming?n=3").get_json()
+    assert data["start"] == 2
+    assert data["total"] == 8
+    challengers = [fragrance["id"] for fragrance in data["challengers"]]
+    assert len(challengers) == 3
+    next_round = client.post("/save_vote", json={"voted_id": ids[0], "displayed_ids": ids}).get_json()["next_round"]
+    assert next_round[1]["id"] == challengers[0]
+
+
+@pytest.mark.parametrize("n, expected", [(0, 1), (-3, 1), (-100, 1), (1000, 6)])
+def test_upcoming_count_is_clamped(client, n, expected):
+    start(client)
+    assert len(client.get(f"/upcoming?n={n}").get_json()["challengers"]) == expected
+
+
+def batch_for(client, ids):
+    """Every vote of a tournament in which the first challenger always wins"""
+    upcoming = client.get("/upcoming?n=32").get_json()["challengers"]
+    votes = [{"voted_id": ids[0], "displayed_ids": ids}]
+    for challenger in upcoming:
+        votes.append({"voted_id": ids[0], "displayed_ids": [ids[0], challenger["id"]]})
+    return votes
+
+
+def test_save_votes_applies_a_whole_tournament(web, client):
+    ids, _ = start(client)
+    before = wins(web, ids[0])
+    response = client.post("/save_votes", json={"votes": batch_for(client, ids)})
+    data = response.get_json()
+    assert response.status_code == 200
+    assert data["accepted"] == 7
+    assert data["final_champion"]["id"] == ids[0]
+    assert wins(web, ids[0]) == before + 1
+
+
+def test_save_votes_stops_at_the_first_invalid_vote(client):
+    ids, _ = start(client)
+    votes = batch_for(client, ids)
+    invalid = votes[:3] + [dict(votes[3], voted_id=ids[1])] + votes[4:]
+    response = client.post("/save_votes", json={"votes": invalid})
+    assert response.status_code == 400
+    assert response.get_json()["accepted"] == 3
+    # The votes before it were kept, so the tournament resumes at that round
+    response = client.post("/save_votes", json={"votes": votes[3:]})
+    assert response.status_code == 200
+    assert response.get_json()["accepted"] == 4
+
+
+def test_save_votes_rejects_bad_batches(client):
+    start(client)
+    assert client.post("/save_votes", json={"votes": []}).status_code == 400
+    assert client.post("/save_votes", json={"votes": [{}] * 65}).status_code == 400
+    assert client.post("/save_votes", data="votes").status_code == 415
+
+
+def test_token_tournament(web, client, token_mode):
+    ids, token = start(client)
+    assert token
+    before = wins(web, ids[0])
+    data = play(client, ids, token).get_json()
+    assert data["final_champion"]["id"] == ids[0]
+    assert "token" not in data
+    assert wins(web, ids[0]) == before + 1
+
+
+def test_token_round_is_counted_once(web, client, token_mode):
+    ids, token = start(client)
+    vote = {"voted_id": ids[0], "displayed_ids": ids, "token": token}
+    before = matches(web)
+    assert client.post("/save_vote", json=vote).status_code == 200
+    response = client.post("/save_vote", json=vote)
+    assert response.status_code == 409
+    assert matches(web) == before + 1
+
+
+def test_replayed_final_token_records_one_win(web, client, token_mode):
+    ids, token = start(client)
+    # Play the whole tournament, keeping the last two votes and their tokens
+    vote = {"voted_id": ids[0], "displayed_ids": ids, "token": token}
+    while True:
+        data = client.post("/save_vote", json=vote).get_json()
+        if "final_champion" in data:
+            break
+        previous = vote
+        ids = [fragrance["id"] for fragrance in data["next_round"]]
+        vote = {"voted_id": ids[0], "displayed_ids": ids, "token": data["token"]}
+    before = wins(web, ids[0])
+    for _ in range(3):
+        assert client.post("/save_vote", json=vote).status_code == 409
+    assert client.post("/save_vote", json=previous).status_code == 409
+    assert wins(web, ids[0]) == before
+
+
+def test_forged_token_is_rejected(client, token_mode):
+    ids, token = start(client)
+    response = client.post("/save_vote", json={"voted_id": ids[0], "displayed_ids": ids, "token": token + "x"})
+    assert response.status_code == 400
+    assert response.get_json()["error"] == "Invalid tournament token"
+
+
+def test_token_round_is_counted_once_by_every_worker(web, client, token_mode):
+    ids, token = start(client)
+    vote = {"voted_id": ids[0], "displayed_ids": ids, "token": token}
+    assert client.post("/save_vote", json=vote).status_code == 200
+    # Another worker sharing the database has its own connections
+    other_worker = RoundClaims(Database(web.DATABASE_PATH), web.tokens.max_age)
+    assert not other_worker.claim(web.tokens.load(token))
@@ -0,0 +1,96 @@
+import sqlite3
+import time
+
+import pytest
+
+from database import ensure_schema
+from win_recorder import WinRecorder
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / "wins.db")
+    ensure_schema(path)
+    return path
+
+
+def table(db_path, sql):
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute(sql).fetchall()
+    finally:
+        conn.close()
+
+
+def test_nothing_is_written_until_a_flush(db_path):
+    recorder = WinRecorder(db_path)
+    recorder.record(1)
+    recorder.record_match(1, 2)
+    assert table(db_path, "SELECT * FROM wins") == []
+    assert table(db_path, "SELECT * FROM matches") == []
+
+
+def test_flush_adds_to_existing_wins_and_logs_matches(db_path):
+    recorder = WinRecorder(db_path)
+    for fragrance_id in (1, 1, 2):
+        recorder.record(fragrance_id)
+    recorder.record_match(1, 2)
+    recorder.record_match(2, 3)
+    assert recorder.flush() == 4
+    recorder.record(1)
+    recorder.flush()
+    assert table(db_path, "SELECT id, wins FROM wins ORDER BY id") == [(1, 3), (2, 1)]
+    assert table(db_path, "SELECT winner, loser FROM matches ORDER BY rowid") == [(1, 2), (2, 3)]
+    assert recorder.flushes == 2
+    # Nothing pending: no transaction and no listeners
+    assert recorder.flush() == 0
+    assert recorder.flushes == 2
+
+
+def test_listeners_run_after_each_flush(db_path):
+    recorder = WinRecorder(db_path)
+    seen = []
+    recorder.listeners.append(lambda: seen.append(table(db_path, "SELECT wins FROM wins")))
+    recorder.record(5)
+    recorder.flush()
+    assert seen == [[(1,)]]
+
+
+def test_failed_flush_keeps_everything_for_the_next_one(tmp_path):
+    path = str(tmp_path / "later.db")
+    recorder = WinRecorder(path)
+    recorder.record(1)
+    recorder.record_match(1, 2)
+    # No tables yet
+    with pytest.raises(sqlite3.OperationalError):
+        recorder.flush()
+    ensure_schema(path)
+    assert recorder.flush() == 2
+    assert table(path, "SELECT id, wins FROM wins") == [(1, 1)]
+
+
+def test_background_thread_flushes_a_full_batch(db_path):
+    recorder = WinRecorder(db_path, max_pending=3, interval=60)
+    recorder.start()
+    try:
+        for _ in range(3):
+            recorder.record(7)
+        deadline = time.monotonic() + 5
+        while recorder.flushes == 0 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert table(db_path, "SELECT id, wins FROM wins") == [(7, 3)]
+    finally:
+        recorder.close()
+
+
+def test_close_flushes_what_is_left(tmp_path):
+    path = str(tmp_path / "fresh.db")
+    recorder = WinRecorder(path, interval=60)
+    # start() creates the schema of a new database
+    recorder.start()
+    recorder.record(4)
+    recorder.record_match(4, 5)
+    recorder.close()
+    assert not recorder._thread.is_alive()
+    assert table(path, "SELECT id, wins FROM wins") == [(4, 1)]
+    assert table(path, "SELECT winner, loser FROM matches") == [(4, 5)]
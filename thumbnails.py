@@ -0,0 +1,206 @@
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from pathlib import Path
+
+from PIL import Image, ImageOps
+
+# Requested widths are rounded up to one of these, so the number of
+# variants per image stays small whatever clients ask for. The scraped
+# bottles are 375px wide and never upscaled.
+WIDTHS = (96, 192, 288, 375)
+
+# fmt= value -> (Pillow format, media type, save options)
+FORMATS = {
+    "webp": ("WEBP", "image/webp", {"quality": 80, "method": 4}),
+    "jpeg": ("JPEG", "image/jpeg", {"quality": 82, "optimize": True, "progressive": True}),
+    "png": ("PNG", "image/png", {"optimize": True}),
+}
+
+
+def snap_width(width):
+    """Return the smallest allowed width >= width (the largest if none is)"""
+    for allowed in WIDTHS:
+        if width <= allowed:
+            return allowed
+    return WIDTHS[-1]
+
+
+def negotiate_format(fmt, accept):
+    """Return fmt if it is supported, else webp if the client accepts it, else jpeg"""
+    if fmt in FORMATS:
+        return fmt
+    return "webp" if "image/webp" in (accept or "") else "jpeg"
+
+
+class Thumbnails:
+    """Resized copies of the scraped bottle images in a size-bounded LRU disk cache.
+
+    A variant is generated on first request and named after the source
+    file, which is itself named after its content hash, so a re-scraped
+    image gets new variants and bottles shared by several fragrances share
+    them too. Files are evicted least recently used first once the cache
+    holds more than max_bytes; the order survives restarts through file
+    mtimes. Concurrent requests for a variant that is being generated wait
+    for that one instead of resizing the image again.
+
+    The index is per process: app workers sharing the directory each keep
+    up to max_bytes, so the disk can hold workers * max_bytes, and a file
+    one worker evicted is regenerated by the others when they next serve it.
+    Serve variants through open(), which keeps working if another worker
+    evicts the file while it is being sent.
+    """
+
+    # Attempts at opening a variant that other workers keep evicting
+    OPEN_ATTEMPTS = 3
+
+    def __init__(self, directory="image_cache", max_bytes=256 * 1024 * 1024, base_dir="."):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.base_dir = Path(base_dir)
+        self.stats = {"hits": 0, "generated": 0, "coalesced": 0, "evicted": 0}
+        self._files = OrderedDict()
+        self._bytes = 0
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._load()
+
+    def _load(self):
+        entries = []
+        for path in self.directory.iterdir():
+            if path.suffix == ".part":
+                path.unlink(missing_ok=True)
+                continue
+            st = path.stat()
+            entries.append((st.st_mtime, path.name, st.st_size))
+        for _, name, size in sorted(entries):
+            self._files[name] = size
+            self._bytes += size
+        self._evict()
+
+    def _evict(self):
+        # Called with the lock held, or before the cache is shared
+        while self._bytes > self.max_bytes and len(self._files) > 1:
+            name, size = self._files.popitem(last=False)
+            self._bytes -= size
+            self.stats["evicted"] += 1
+            try:
+                os.remove(self.directory / name)
+            except FileNotFoundError:
+                pass
+
+    def source_path(self, local_image_path):
+        path = Path(local_image_path)
+        return path if path.is_absolute() else self.base_dir / path
+
+    def get(self, local_image_path, width, fmt):
+        """Return the path of a variant of the image, generating it if needed
+
+        width must be one of WIDTHS and fmt a key of FORMATS. Returns None
+        if the source image is missing.
+        """
+        source = self.source_path(local_image_path)
+        name = f"{source.stem}-{width}.{fmt}"
+        path = self.directory / name
+        with self._lock:
+            hit = name in self._files
+            if hit:
+                self._files.move_to_end(name)
+                self.stats["hits"] += 1
+            else:
+                future = self._inflight.get(name)
+                owner = future is None
+                if owner:
+                    future = self._inflight[name] = Future()
+                else:
+                    self.stats["coalesced"] += 1
+        if hit:
+            # Keeps the LRU order across restarts
+            try:
+                os.utime(path)
+            except FileNotFoundError:
+                # Evicted by another process: forget it and generate it again
+                with self._lock:
+                    self.stats["hits"] -= 1
+                self._forget(name)
+                return self.get(local_image_path, width, fmt)
+            except OSError:
+                pass
+            return path
+        if not owner:
+            return future.result()
+
+        try:
+            size = self._generate(source, path, width, fmt)
+        except FileNotFoundError:
+            result = None
+        except BaseException as e:
+            with self._lock:
+                del self._inflight[name]
+            future.set_exception(e)
+            raise
+        else:
+            result = path
+        with self._lock:
+            del self._inflight[name]
+            if result is not None:
+                self._files[name] = size
+                self._bytes += size
+                self.stats["generated"] += 1
+                self._evict()
+        future.set_result(result)
+        return result
+
+    def open(self, local_image_path, width, fmt):
+        """Return a variant of the image opened for reading, or None
+
+        An open file can still be read after another process deletes it, so
+        only the gap between get() and opening the file can lose it; the
+        variant is then generated again. Returns None if the source image is
+        missing or the variant keeps disappearing.
+        """
+        for _ in range(self.OPEN_ATTEMPTS):
+            path = self.get(local_image_path, width, fmt)
+            if path is None:
+                return None
+            try:
+                return path.open("rb")
+            except FileNotFoundError:
+                self._forget(path.name)
+        logging.warning(f"Gave up opening {path.name}, it was evicted {self.OPEN_ATTEMPTS} times")
+        return None
+
+    def _forget(self, name):
+        with self._lock:
+            size = self._files.pop(name, None)
+            if size is not None:
+                self._bytes -= size
+
+    def _generate(self, source, path, width, fmt):
+        """Resize source to width and write it to path; returns the file size"""
+        pillow_format, _, options = FORMATS[fmt]
+        with Image.open(source) as image:
+            image = ImageOps.exif_transpose(image)
+            if image.width > width:
+                height = max(1, round(image.height * width / image.width))
+                image = image.resize((width, height), Image.LANCZOS)
+            if pillow_format == "JPEG" and image.mode != "RGB":
+                image = image.convert("RGBA")
+                background = Image.new("RGB", image.size, (255, 255, 255))
+                background.paste(image, mask=image.getchannel("A"))
+                image = background
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".part")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    image.save(f, pillow_format, **options)
+                os.replace(tmp_path, path)
+            except BaseException:
+                os.remove(tmp_path)
+                raise
+        size = path.stat().st_size
+        logging.debug(f"Generated {path.name} ({size} bytes)")
+        return size
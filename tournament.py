@@ -0,0 +1,150 @@
+import base64
+import hashlib
+import hmac
+import json
+import random
+import time
+
+
+class Bracket:
+    """The bracket order for a seed, computed lazily one position at a time.
+
+    Position i maps to catalog.ids[perm(i)], where perm is a keyed Feistel
+    permutation of range(n) with cycle-walking. Creating a bracket is O(1)
+    whatever the catalog size and nothing per tournament has to be stored
+    besides the seed.
+    """
+
+    ROUNDS = 4
+
+    def __init__(self, ids, seed):
+        self.ids = ids
+        self.n = len(ids)
+        self.key = seed.to_bytes(8, "big", signed=False)
+        bits = max(2, (self.n - 1).bit_length())
+        self.half_bits = (bits + 1) // 2
+        self.mask = (1 << self.half_bits) - 1
+
+    def _round(self, i, value):
+        digest = hashlib.blake2b(
+            i.to_bytes(1, "big") + value.to_bytes(8, "big"), key=self.key, digest_size=8
+        ).digest()
+        return int.from_bytes(digest, "big") & self.mask
+
+    def _encrypt(self, x):
+        left, right = x >> self.half_bits, x & self.mask
+        for i in range(self.ROUNDS):
+            left, right = right, left ^ self._round(i, right)
+        return (left << self.half_bits) | right
+
+    def position(self, i):
+        """Return the catalog index drawn at bracket position i"""
+        x = self._encrypt(i)
+        # The Feistel domain is at most 4n, so this takes a few steps on average
+        while x >= self.n:
+            x = self._encrypt(x)
+        return x
+
+    def __len__(self):
+        return self.n
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(self.n))]
+        if i < 0:
+            i += self.n
+        if not 0 <= i < self.n:
+            raise IndexError("bracket position out of range")
+        return self.ids[self.position(i)]
+
+
+def new_seed():
+    """Return a random seed for a new bracket"""
+    return random.getrandbits(63)
+
+
+class TokenError(Exception):
+    """Raised for tournament tokens that are malformed, forged or expired"""
+
+
+class TournamentTokens:
+    """HMAC-signed tokens carrying a tournament's whole state.
+
+    A token holds the bracket seed, the cursor, the champion id, the
+    catalog pool and its size, so any app process that shares the secret key can serve
+    the next vote without a session store. Every vote re-stamps the token,
+    so max_age only has to outlast a player's pause between votes.
+    """
+
+    def __init__(self, secret_key, max_age=60 * 60):
+        if isinstance(secret_key, str):
+            secret_key = secret_key.encode()
+        self.secret_key = secret_key
+        self.max_age = max_age
+
+    def _sign(self, body):
+        return hmac.new(self.secret_key, body, hashlib.sha256).digest()
+
+    def dump(self, state):
+        """Serialize and sign a state dict"""
+        payload = {
+            "s": state["seed"],
+            "p": state["cursor"],
+            "c": state.get("champion"),
+            "n": state["size"],
+            "f": state.get("pool"),
+            "t": int(time.time()),
+        }
+        body = base64.urlsafe_b64encode(json.dumps(payload, separators=(",", ":")).encode()).rstrip(b"=")
+        signature = base64.urlsafe_b64encode(self._sign(body)).rstrip(b"=")
+        return (body + b"." + signature).decode()
+
+    def load(self, token):
+        """Verify a token and return its state dict"""
+        try:
+            body, signature = token.encode().split(b".")
+            expected = base64.urlsafe_b64encode(self._sign(body)).rstrip(b"=")
+            if not hmac.compare_digest(signature, expected):
+                raise TokenError("Invalid tournament token")
+            payload = json.loads(base64.urlsafe_b64decode(body + b"=" * (-len(body) % 4)))
+        except (AttributeError, ValueError) as e:
+            raise TokenError("Invalid tournament token") from e
+        if payload["t"] + self.max_age < time.time():
+            raise TokenError("Tournament token expired")
+        return {
+            "seed": payload["s"],
+            "cursor": payload["p"],
+            "champion": payload["c"],
+            "size": payload["n"],
+            "pool": payload.get("f"),
+        }
+
+
+CLAIM_SQL = "INSERT OR IGNORE INTO token_rounds (seed, cursor, claimed_at) VALUES (?, ?, ?)"
+SWEEP_SQL = "DELETE FROM token_rounds WHERE claimed_at < ?"
+
+
+class RoundClaims:
+    """Rounds of token tournaments that were already voted on, kept in the database.
+
+    A signed token stays valid after it is used, so a round's token could
+    be posted again, to any worker or host, to count the round again. Each
+    (seed, cursor) row can only be inserted once, so every process sharing
+    the database accepts a round once. A round's token was issued before
+    it was claimed, so once a claim is max_age old the token is expired
+    anyway and the row is swept.
+    """
+
+    def __init__(self, db, max_age, sweep_interval=60.0):
+        self.db = db
+        self.max_age = max_age
+        self.sweep_interval = sweep_interval
+        self._swept_at = time.monotonic()
+
+    def claim(self, state):
+        """Return True the first time a round of a tournament is voted on"""
+        now = time.time()
+        if time.monotonic() - self._swept_at >= self.sweep_interval:
+            self._swept_at = time.monotonic()
+            self.db.execute(SWEEP_SQL, (now - self.max_age,))
+        return self.db.execute(CLAIM_SQL, (state["seed"], state["cursor"], now)) == 1
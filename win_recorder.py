@@ -0,0 +1,111 @@
+import atexit
+import logging
+import threading
+from collections import Counter
+
+from database import connect, ensure_schema
+
+
+class WinRecorder:
+    """Write-behind aggregator for tournament wins and individual matchups.
+
+    Finished games only bump an in-memory counter and each vote appends a
+    (winner, loser) pair to a list. A background thread writes both in one
+    transaction whenever max_pending games have finished or every interval
+    seconds, and once more at interpreter shutdown.
+    """
+
+    def __init__(self, db_path, max_pending=100, interval=2.0, busy_timeout=5000):
+        self.db_path = db_path
+        self.max_pending = max_pending
+        self.interval = interval
+        self.busy_timeout = busy_timeout
+        self.flushes = 0
+        # Called with no arguments after every flush that wrote something
+        self.listeners = []
+        self._pending = Counter()
+        self._pending_games = 0
+        self._matches = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Start the background flusher and register the shutdown flush"""
+        if self._thread is not None:
+            return
+        ensure_schema(self.db_path)
+        self._thread = threading.Thread(target=self._run, name="win-recorder", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def record(self, fragrance_id):
+        """Count one win; never touches the database"""
+        with self._lock:
+            self._pending[fragrance_id] += 1
+            self._pending_games += 1
+            full = self._pending_games >= self.max_pending
+        if full:
+            self._wake.set()
+
+    def record_match(self, winner, loser):
+        """Append one matchup result to the match log"""
+        with self._lock:
+            self._matches.append((winner, loser))
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                logging.exception("Flushing wins failed")
+
+    def _connect(self):
+        return connect(self.db_path, timeout=self.busy_timeout / 1000, isolation_level=None)
+
+    def flush(self):
+        """Write all pending increments and matches in a single transaction"""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, Counter()
+                matches, self._matches = self._matches, []
+                self._pending_games = 0
+            if not pending and not matches:
+                return 0
+            conn = self._connect()
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                conn.executemany("""
+                    INSERT INTO wins (id, wins)
+                    VALUES (?, ?)
+                    ON CONFLICT(id) DO UPDATE SET wins = wins + excluded.wins
+                """, pending.items())
+                conn.executemany("INSERT INTO matches (winner, loser) VALUES (?, ?)", matches)
+                conn.execute("COMMIT")
+            except Exception:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                # Keep everything for the next attempt
+                with self._lock:
+                    self._pending.update(pending)
+                    self._pending_games += sum(pending.values())
+                    self._matches[:0] = matches
+                raise
+            finally:
+                conn.close()
+            self.flushes += 1
+        for listener in self.listeners:
+            listener()
+        return len(pending) + len(matches)
+
+    def close(self):
+        """Stop the background thread and flush whatever is left"""
+        self._stopped.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval + 5)
+        self.flush()